@@ -0,0 +1,129 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from dotenv import load_dotenv
+from metrics import JUDGE_QUEUE_SECONDS
+
+# Load environment variables
+load_dotenv()
+
+# Judge runs (whole submissions) in flight at once, and runs allowed to wait for a slot
+JUDGE_MAX_RUNS = int(os.getenv("JUDGE_MAX_RUNS", "16"))
+JUDGE_QUEUE_LIMIT = int(os.getenv("JUDGE_QUEUE_LIMIT", "200"))
+
+class Overloaded(Exception):
+    """The admission queue is full; retry_after estimates when there will be room"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Judge queue is full, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class AdmissionQueue:
+    """Global cap on judge runs in flight, shared fairly between lobbies
+
+    A run starts at once while fewer than max_runs are in flight. Otherwise
+    it waits in its group's (lobby's) FIFO, and groups take turns as slots
+    free up, so a lobby submitting in a loop delays only its own runs.
+    Once limit runs are waiting, check() refuses new ones with Overloaded
+    rather than letting the queue grow without bound.
+    """
+
+    def __init__(self, max_runs: int = JUDGE_MAX_RUNS, limit: int = JUDGE_QUEUE_LIMIT):
+        self.max_runs = max_runs
+        self.limit = limit
+        self.running = 0
+        self.queued = 0
+        self.waiting: Dict[str, Deque[asyncio.Future]] = {}
+        # Groups with waiting runs, in the order they get their next slot
+        self.turns: Deque[str] = deque()
+        # Moving average of run time, for retry estimates
+        self.average = 1.0
+        self.rejected = 0
+
+    def check(self):
+        """Raise Overloaded if a new run would not be queued"""
+        if self.running >= self.max_runs and self.queued >= self.limit:
+            self.rejected += 1
+            raise Overloaded(self.retry_after())
+
+    def retry_after(self) -> float:
+        return max(1.0, round(self.queued / max(1, self.max_runs) * self.average, 1))
+
+    @asynccontextmanager
+    async def slot(self, group: Optional[str]):
+        """Hold one of the run slots, waiting for the group's turn if all are taken"""
+        await self.acquire(group or "")
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.average += (time.monotonic() - started - self.average) * 0.1
+            self.release()
+
+    async def acquire(self, group: str):
+        if self.running < self.max_runs and not self.queued:
+            self.running += 1
+            JUDGE_QUEUE_SECONDS.observe(0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self.waiting.get(group)
+        if queue is None:
+            queue = self.waiting[group] = deque()
+            self.turns.append(group)
+        queue.append(future)
+        self.queued += 1
+
+        started = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self.discard(group, future)
+            else:
+                # Granted a slot just as the run was cancelled
+                self.release()
+            raise
+        JUDGE_QUEUE_SECONDS.observe(time.monotonic() - started)
+
+    def release(self):
+        """Free a slot and hand it to the next group in turn"""
+        self.running -= 1
+        while self.turns:
+            group = self.turns.popleft()
+            queue = self.waiting[group]
+            future = queue.popleft()
+            self.queued -= 1
+            if queue:
+                # Back of the line behind every other waiting lobby
+                self.turns.append(group)
+            else:
+                del self.waiting[group]
+            if not future.cancelled():
+                self.running += 1
+                future.set_result(None)
+                return
+
+    def discard(self, group: str, future: asyncio.Future):
+        """Forget a waiting run that was cancelled"""
+        queue = self.waiting.get(group)
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        self.queued -= 1
+        if not queue:
+            del self.waiting[group]
+            self.turns.remove(group)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "lobbiesWaiting": len(self.waiting),
+            "rejected": self.rejected,
+            "averageRunSeconds": round(self.average, 3)
+        }
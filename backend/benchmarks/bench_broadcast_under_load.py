@@ -0,0 +1,86 @@
+"""Lobby broadcast latency while submissions are being judged
+
+Ticks a lobby list broadcast to simulated connections at a fixed
+interval (encoded once and pushed to every Outbox, as main.py fans out) and reports how late each broadcast completes, first idle and
+then with submissions in flight. With judging offloaded from the event
+loop both phases should look the same.
+
+Usage (from backend/):
+    EXECUTOR_BACKEND=fake python benchmarks/bench_broadcast_under_load.py [clients] [submitters]
+"""
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("EXECUTOR_BACKEND", "fake")
+os.environ.setdefault("RESULT_CACHE_SIZE", "0")  # Judge every submission
+os.environ["DATABASE_URL"] = ""  # Keep results out of the real database
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main  # noqa: E402
+from fanout import Outbox, encode_message  # noqa: E402
+
+TICK = 0.05
+PHASE_SECONDS = 3.0
+CODE = "def two_sum(nums, target):\n    for i in range(len(nums)):\n        pass\n    return [0, 1]\n" * 3
+
+class FakeWebSocket:
+    async def send_text(self, message: str):
+        pass
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def broadcast(event: str, data: dict):
+    message = encode_message(event, data)
+    for outbox in main.connections.values():
+        outbox.push(message)
+
+async def measure_broadcasts(seconds: float) -> list:
+    """Broadcast every TICK seconds and record lateness in milliseconds"""
+    lateness = []
+    start = time.perf_counter()
+    tick = 0
+    while time.perf_counter() - start < seconds:
+        tick += 1
+        due = start + tick * TICK
+        await asyncio.sleep(max(0, due - time.perf_counter()))
+        broadcast("lobby_list_update", main.get_public_lobbies())
+        lateness.append((time.perf_counter() - due) * 1000)
+    return lateness
+
+async def submitter(stop: asyncio.Event, test_cases: list, counter: list):
+    while not stop.is_set():
+        await main.judge0_submit_code(CODE, test_cases)
+        counter[0] += 1
+
+def report(name: str, lateness: list):
+    print(f"{name:>7}: broadcasts={len(lateness)} "
+          f"p50={percentile(lateness, 50):.2f}ms "
+          f"p99={percentile(lateness, 99):.2f}ms "
+          f"max={max(lateness):.2f}ms")
+
+async def bench(clients: int, submitters: int):
+    for i in range(clients):
+        main.connections[f"client_{i}"] = Outbox(FakeWebSocket())
+    await main.startup()
+
+    report("idle", await measure_broadcasts(PHASE_SECONDS))
+
+    stop = asyncio.Event()
+    counter = [0]
+    test_cases = main.problem_bank.get("two-sum").test_cases
+    tasks = [asyncio.create_task(submitter(stop, test_cases, counter)) for _ in range(submitters)]
+    report("loaded", await measure_broadcasts(PHASE_SECONDS))
+    stop.set()
+    await asyncio.gather(*tasks)
+    print(f"submissions judged while loaded: {counter[0]} ({main.executor.name} executor)")
+
+    await main.shutdown()
+
+if __name__ == "__main__":
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    submitters = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    asyncio.run(bench(clients, submitters))
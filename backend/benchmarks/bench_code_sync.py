@@ -0,0 +1,76 @@
+"""CPU and bandwidth of live code sync (code_delta) against resending the buffer
+
+Types into editor buffers of growing size, one keystroke per delta at a
+random position, with the odd paste and deletion. For each size reports
+the server CPU to validate and apply a delta, the bytes a client sends
+per keystroke as a code_delta and as a whole-buffer resend, and the
+bytes relayed per viewer when edits are batched every CODE_SYNC_INTERVAL
+(typing at the given keystrokes per second).
+
+Usage (from backend/):
+    python benchmarks/bench_code_sync.py [keystrokes] [keystrokes_per_second]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from code_sync import CODE_SYNC_INTERVAL, CodeBuffer  # noqa: E402
+
+SIZES = (1_000, 10_000, 30_000)
+
+def starting_text(size: int) -> str:
+    line = "    total = sum(value * weight for value, weight in zip(values, weights))\n"
+    return (line * (size // len(line) + 1))[:size]
+
+def keystrokes(text_length: int, count: int):
+    """(ops) per keystroke: mostly single characters, some deletions and pastes"""
+    random.seed(3)
+    length = text_length
+    for _ in range(count):
+        position = random.randint(0, length)
+        roll = random.random()
+        if roll < 0.7:
+            op = [position, 0, random.choice("abcdefghijklmnopqrstuvwxyz ()\n")]
+        elif roll < 0.99 and position < length:
+            op = [position, 1, ""]
+        else:
+            op = [position, 0, "for i in range(len(values)):\n        pass\n"]
+        length += len(op[2]) - op[1]
+        yield [op]
+
+def bench(count: int, rate: float):
+    per_relay = max(1, round(rate * CODE_SYNC_INTERVAL))
+    print(f"{count} keystrokes per buffer, {rate:.0f}/s, relayed every {CODE_SYNC_INTERVAL}s "
+          f"(~{per_relay} keystrokes per relay)")
+    for size in SIZES:
+        buffer = CodeBuffer()
+        buffer.apply(0, text=starting_text(size))
+        buffer.take_update()
+        deltas = [{"seq": seq, "ops": ops} for seq, ops in enumerate(keystrokes(size, count), 1)]
+
+        delta_bytes = sum(len(json.dumps({"event": "code_delta", "data": delta})) for delta in deltas)
+        full_bytes = len(json.dumps({"event": "submit_code", "data": {"code": buffer.text}}))
+
+        relayed = 0
+        snapshots = 0
+        start = time.perf_counter()
+        for index, delta in enumerate(deltas, 1):
+            buffer.apply(delta["seq"], delta["ops"])
+            if index % per_relay == 0:
+                update = buffer.take_update()
+                relayed += len(json.dumps({"event": "code_update", "data": update}))
+                snapshots += "text" in update
+        elapsed = time.perf_counter() - start
+
+        print(f"  {size // 1000:>3}KB buffer: {elapsed * 1e6 / count:6.2f}us per delta (apply + relay)  "
+              f"client {delta_bytes / count:5.1f}B/keystroke vs {full_bytes}B resend  "
+              f"relayed {relayed / count:6.1f}B/keystroke per viewer ({snapshots} snapshots)")
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 8.0
+    bench(count, rate)
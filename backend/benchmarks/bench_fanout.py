@@ -0,0 +1,101 @@
+"""Broadcast fan-out to thousands of simulated websocket clients
+
+Compares the old serial fan-out (encode, then await each send in turn)
+with the outbox fan-out (encode once, queue per connection, concurrent
+writers). A fraction of the clients are slow; the outbox run reports how
+long the fast clients wait and how many slow clients were dropped.
+
+Usage (from backend/):
+    python benchmarks/bench_fanout.py [clients] [broadcasts] [slow_fraction]
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fanout import Outbox, encode_message  # noqa: E402
+
+PAYLOAD = {
+    "lobbies": [{
+        "id": f"lobby_{i}",
+        "name": f"Lobby {i}",
+        "playerCount": 1,
+        "maxPlayers": 2,
+        "status": "waiting",
+        "createdAt": time.time()
+    } for i in range(4)],
+    "pagination": {"currentPage": 1, "totalPages": 5, "totalLobbies": 20, "perPage": 4},
+    "search": ""
+}
+
+class SimulatedWebSocket:
+    """Records delivery time; fast clients yield once per send, slow ones sleep"""
+
+    def __init__(self, slow: bool):
+        self.delay = 0.5 if slow else 0
+        self.slow = slow
+        self.received = 0
+        self.last_delivery = 0.0
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(self.delay)
+        self.received += 1
+        self.last_delivery = time.perf_counter()
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+async def serial_fanout(sockets: list, broadcasts: int) -> float:
+    start = time.perf_counter()
+    for _ in range(broadcasts):
+        message = json.dumps({"event": "lobby_list_update", "data": PAYLOAD})
+        for websocket in sockets:
+            await websocket.send_text(message)
+    return time.perf_counter() - start
+
+async def outbox_fanout(sockets: list, broadcasts: int):
+    outboxes = [Outbox(websocket, limit=16) for websocket in sockets]
+    start = time.perf_counter()
+    enqueue_time = 0.0
+    for i in range(broadcasts):
+        enqueue_start = time.perf_counter()
+        message = encode_message("lobby_list_update" if i % 2 else "progress_update", PAYLOAD)
+        for outbox in outboxes:
+            outbox.push(message, "lobby_list_update" if i % 2 else None)
+        enqueue_time += time.perf_counter() - enqueue_start
+        await asyncio.sleep(0)
+
+    fast = [websocket for websocket in sockets if not websocket.slow]
+    while any(outbox.writer is not None for outbox, websocket in zip(outboxes, sockets) if not websocket.slow):
+        await asyncio.sleep(0.001)
+    fast_done = max(websocket.last_delivery for websocket in fast) - start
+    dropped = sum(1 for outbox in outboxes if outbox.closed)
+    for outbox in outboxes:
+        outbox.close()
+    return enqueue_time, fast_done, dropped
+
+async def bench(clients: int, broadcasts: int, slow_fraction: float):
+    random.seed(7)
+    slow_flags = [random.random() < slow_fraction for _ in range(clients)]
+    slow_count = sum(slow_flags)
+    print(f"{clients} clients ({slow_count} slow), {broadcasts} broadcasts")
+
+    # Serial fan-out waits on every slow client in turn, so time a single broadcast
+    serial = await serial_fanout([SimulatedWebSocket(flag) for flag in slow_flags], 1)
+    print(f"  serial: {serial * 1000:.0f}ms per broadcast (everyone waits behind slow clients)")
+
+    sockets = [SimulatedWebSocket(flag) for flag in slow_flags]
+    enqueue_time, fast_done, dropped = await outbox_fanout(sockets, broadcasts)
+    print(f"  outbox: {enqueue_time * 1000 / broadcasts:.2f}ms per broadcast to encode+queue, "
+          f"{fast_done * 1000:.0f}ms until fast clients had all {broadcasts}, "
+          f"{dropped}/{slow_count} slow clients dropped")
+
+if __name__ == "__main__":
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    broadcasts = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    slow_fraction = float(sys.argv[3]) if len(sys.argv) > 3 else 0.01
+    asyncio.run(bench(clients, broadcasts, slow_fraction))
@@ -0,0 +1,62 @@
+"""Submit latency against a local mock Judge0, with and without pooling
+
+Usage (from backend/):
+    python benchmarks/bench_judge0_pool.py [submissions] [concurrency]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+PORT = int(os.getenv("MOCK_JUDGE0_PORT", "2358"))
+
+os.environ["JUDGE0_API_KEY"] = "benchmark"
+os.environ["JUDGE0_BASE_URL"] = f"http://127.0.0.1:{PORT}"
+os.environ.setdefault("JUDGE0_POLL_INITIAL", "0.02")
+os.environ.setdefault("RESULT_CACHE_SIZE", "0")  # Judge every submission
+os.environ["DATABASE_URL"] = ""  # Keep results out of the real database
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import main  # noqa: E402
+import mock_judge0  # noqa: E402
+
+CODE = "print([0, 1])"
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def run(submissions: int, concurrency: int) -> list:
+    test_cases = main.problem_bank.get("two-sum").test_cases
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def submit():
+        async with gate:
+            start = time.perf_counter()
+            await main.judge0_submit_code(CODE, test_cases)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(submit() for _ in range(submissions)))
+    return latencies
+
+async def bench(submissions: int, concurrency: int):
+    modes = [("unpooled", False), ("pooled", True)]
+    for name, pooled in modes:
+        if pooled:
+            await main.startup()
+        await run(concurrency, concurrency)  # warm-up
+        latencies = await run(submissions, concurrency)
+        if pooled:
+            await main.shutdown()
+        print(f"{name:>9}: n={len(latencies)} "
+              f"p50={percentile(latencies, 50):.1f}ms "
+              f"p99={percentile(latencies, 99):.1f}ms "
+              f"mean={statistics.mean(latencies):.1f}ms")
+
+if __name__ == "__main__":
+    submissions = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+    mock_judge0.start_in_thread(PORT)
+    asyncio.run(bench(submissions, concurrency))
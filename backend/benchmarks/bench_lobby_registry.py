@@ -0,0 +1,81 @@
+"""get_public_lobbies with 100k lobbies: full scan versus the indexed registry
+
+Usage (from backend/):
+    python benchmarks/bench_lobby_registry.py [lobbies]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lobby_registry import LobbyRegistry  # noqa: E402
+from models import Lobby  # noqa: E402
+
+WORDS = ["shiba", "doge", "code", "battle", "quick", "arena", "python", "speed", "noob", "pro"]
+
+def scan_page(lobbies: dict, search: str, page: int, per_page: int = 4) -> list:
+    """The original get_public_lobbies algorithm"""
+    public_lobbies = [
+        lobby for lobby in lobbies.values()
+        if lobby.type == "public" and lobby.status == "waiting"
+    ]
+    if search:
+        search_lower = search.lower()
+        public_lobbies = [lobby for lobby in public_lobbies if search_lower in lobby.name.lower()]
+    public_lobbies.sort(key=lambda x: x.created_at, reverse=True)
+    total_pages = max(1, (len(public_lobbies) + per_page - 1) // per_page)
+    page = max(1, min(page, total_pages))
+    return public_lobbies[(page - 1) * per_page:page * per_page]
+
+def make_lobbies(count: int) -> list:
+    random.seed(42)
+    now = time.time()
+    return [Lobby(
+        id=f"lobby_{i}",
+        name=f"{random.choice(WORDS)} {random.choice(WORDS)} {i}",
+        type="public" if random.random() < 0.8 else "private",
+        status="waiting" if random.random() < 0.7 else "playing",
+        created_at=now + i * 0.001
+    ) for i in range(count)]
+
+def timed(label: str, func, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<32} {elapsed * 1e6:>10.1f}us")
+    return result
+
+def bench(count: int):
+    lobbies = make_lobbies(count)
+    plain = {lobby.id: lobby for lobby in lobbies}
+
+    start = time.perf_counter()
+    registry = LobbyRegistry()
+    for lobby in lobbies:
+        registry[lobby.id] = lobby
+    print(f"{count} lobbies, {registry.listed_count()} listed; "
+          f"registry built in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    queries = [("", 1), ("", 500), ("shiba", 1), ("doge arena", 3), ("12345", 1), ("pr", 1), ("q", 2), ("7", 1), ("zz", 1)]
+    for search, page in queries:
+        label = f"search={search!r} page={page}"
+        print(label)
+        expected = timed("scan", lambda: scan_page(plain, search, page), 5)
+        actual = timed("registry", lambda: registry.public_page(search, page, 4)[2], 50)
+        assert [lobby.id for lobby in expected] == [lobby.id for lobby in actual], label
+
+    print("maintenance")
+    extra = make_lobbies(1)[0]
+    extra.id = "lobby_extra"
+    extra.created_at += count
+
+    def create_and_delete():
+        registry[extra.id] = extra
+        del registry[extra.id]
+    timed("create + delete", create_and_delete, 1000)
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
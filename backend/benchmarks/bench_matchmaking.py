@@ -0,0 +1,101 @@
+"""Quick-match queue simulation: wait times and pairing throughput
+
+Players arrive at a steady rate on a simulated clock with ELO drawn from
+a normal distribution; the matchmaker pairs them on arrival and on every
+tick as bands widen. Reports the average and p95 wait, the largest queue
+seen and how many pairings per second of CPU time the matchmaker makes,
+including a burst of tens of thousands of players joining at once.
+Pairing on arrival keeps about one waiter per ELO bucket, so the last
+case spreads ratings far apart to hold the whole crowd in the queue and
+times joins and leaves against it.
+
+Usage (from backend/):
+    python benchmarks/bench_matchmaking.py [players]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from matchmaking import MATCH_TICK, Matchmaker  # noqa: E402
+
+def ratings(count: int) -> list:
+    return [max(0, min(4000, int(random.gauss(1200, 350)))) for _ in range(count)]
+
+def simulate(label: str, count: int, rate: float):
+    """count players arriving at rate per second (0 = all at once)"""
+    random.seed(42)
+    matchmaker = Matchmaker()
+    elos = ratings(count)
+    waits = []
+    pairs = 0
+    largest = 0
+    next_tick = MATCH_TICK
+    now = 0.0
+
+    def record(pair, at):
+        nonlocal pairs
+        pairs += 1
+        waits.extend(at - ticket.joined_at for ticket in pair)
+
+    start = time.perf_counter()
+    for i, elo in enumerate(elos):
+        now = i / rate if rate else 0.0
+        while next_tick <= now:
+            for pair in matchmaker.tick(next_tick):
+                record(pair, next_tick)
+            next_tick += MATCH_TICK
+        pair = matchmaker.join(f"client_{i}", elo, now)
+        if pair:
+            record(pair, now)
+        largest = max(largest, len(matchmaker))
+
+    # Let the stragglers' bands widen until nobody else can be paired
+    for _ in range(30):
+        next_tick = max(next_tick, now + MATCH_TICK)
+        for pair in matchmaker.tick(next_tick):
+            record(pair, next_tick)
+        now = next_tick
+        next_tick += MATCH_TICK
+    elapsed = time.perf_counter() - start
+
+    waits.sort()
+    average = sum(waits) / len(waits) if waits else 0.0
+    p95 = waits[int(len(waits) * 0.95)] if waits else 0.0
+    print(f"  {label:<22} {pairs:>7} pairs  wait avg {average:6.2f}s p95 {p95:6.2f}s  "
+          f"max queue {largest:>5}  unmatched {len(matchmaker):>3}  "
+          f"{pairs / elapsed:>10.0f} pairs/s")
+
+def crowded(count: int):
+    """join + leave against count waiting players who cannot be paired"""
+    matchmaker = Matchmaker(max_band=100)
+    for i in range(count):
+        matchmaker.join(f"client_{i}", i * 1000, 0.0)
+    assert len(matchmaker) == count
+
+    repeat = 10_000
+    start = time.perf_counter()
+    for i in range(repeat):
+        elo = random.randrange(count) * 1000 + 500
+        matchmaker.join("probe", elo, 0.0)
+        matchmaker.leave("probe")
+    elapsed = (time.perf_counter() - start) / repeat
+    tick_times = []
+    for now in (1.0, 60.0, 61.0):
+        tick_start = time.perf_counter()
+        matchmaker.tick(now)
+        tick_times.append(f"{(time.perf_counter() - tick_start) * 1000:.1f}ms")
+    print(f"  {count} queued: join + leave {elapsed * 1e6:.1f}us, "
+          f"ticks (widening, fully widened, settled) {', '.join(tick_times)}")
+
+def bench(count: int):
+    print(f"{count} players")
+    for rate in (10, 100, 1000, 10_000):
+        simulate(f"{rate}/s arrivals", count, rate)
+    simulate("burst", count, 0)
+    crowded(count)
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
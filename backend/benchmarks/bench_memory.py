@@ -0,0 +1,87 @@
+"""Memory per idle connection and per lobby, measured with tracemalloc
+
+Builds the server-side records for idle connections (Player + Outbox +
+ClientTasks) and for two-player lobbies (Lobby with cached views), and
+compares players and lobbies against the previous nested-dict layout.
+Run it on each release to track memory per connection and per lobby.
+
+Usage (from backend/):
+    python benchmarks/bench_memory.py [count]
+"""
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from client_tasks import ClientTasks  # noqa: E402
+from fanout import Outbox  # noqa: E402
+from models import Lobby, LobbyPlayer, Player  # noqa: E402
+
+class IdleWebSocket:
+    async def send_text(self, message: str):
+        pass
+
+def measure(label: str, build, count: int):
+    """Print the bytes retained per item by build(i)"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    items = [build(i) for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print(f"  {label:<36} {retained / count:>8.0f} bytes each")
+    return items
+
+def idle_connection(i: int):
+    client_id = f"client_{i:012x}"
+    return (Player(client_id, connected_at=time.time()), Outbox(IdleWebSocket()), ClientTasks(client_id))
+
+def dict_player(i: int) -> dict:
+    """A connection's player record as the dict used before the models"""
+    return {"id": f"client_{i:012x}", "name": None, "lobby": None, "connected_at": time.time()}
+
+def model_player(i: int) -> Player:
+    return Player(f"client_{i:012x}", connected_at=time.time())
+
+def dict_lobby(i: int) -> dict:
+    """A two-player lobby as the nested dicts used before the models"""
+    return {
+        "id": f"lobby_{i}",
+        "name": f"Lobby {i}",
+        "type": "public",
+        "pin": None,
+        "status": "waiting",
+        "players": [
+            {"id": f"client_{i:012x}a", "name": f"Player{i}a", "ready": False},
+            {"id": f"client_{i:012x}b", "name": f"Player{i}b", "ready": False}
+        ],
+        "maxPlayers": 2,
+        "createdAt": time.time()
+    }
+
+def model_lobby(i: int) -> Lobby:
+    lobby = Lobby(id=f"lobby_{i}", name=f"Lobby {i}", type="public", created_at=time.time())
+    lobby.add_player(LobbyPlayer(f"client_{i:012x}a", f"Player{i}a"))
+    lobby.add_player(LobbyPlayer(f"client_{i:012x}b", f"Player{i}b"))
+    return lobby
+
+def model_lobby_with_views(i: int) -> Lobby:
+    lobby = model_lobby(i)
+    lobby.view()
+    return lobby
+
+async def bench(count: int):
+    print(f"{count} items each")
+    measure("idle connection", idle_connection, count)
+    measure("player record (dict)", dict_player, count)
+    measure("player record (model)", model_player, count)
+    measure("lobby (dicts)", dict_lobby, count)
+    measure("lobby (models)", model_lobby, count)
+    measure("lobby (models + cached views)", model_lobby_with_views, count)
+
+if __name__ == "__main__":
+    asyncio.run(bench(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000))
@@ -0,0 +1,134 @@
+"""Bandwidth and CPU of the JSON and compact (MessagePack) wire protocols
+
+Replays the messages one game sends (lobby list pages, joins, ready and
+countdown updates, game_start, streamed test verdicts, progress updates
+and the result) through both protocols, with and without
+permessage-deflate. Deflate keeps a compression context per connection
+(as browsers and uvicorn negotiate it), so its cost is paid per
+recipient while the encoding itself is paid once per broadcast. Reports
+bytes per game, encode and decode time, deflate time, and the totals
+for the given number of concurrent games.
+
+Usage (from backend/):
+    python benchmarks/bench_protocol.py [games]
+"""
+import json
+import os
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import msgpack  # noqa: E402
+from models import Lobby, LobbyPlayer  # noqa: E402
+from problem_bank import ProblemBank  # noqa: E402
+from protocol import Message  # noqa: E402
+
+def game_messages():
+    """(message, recipients) for one two-player game, built the way main.py builds them"""
+    problem = ProblemBank.load().all[0]
+    lobby = Lobby("lobby_123456", "Friday night duel", "public", time.time())
+    page = {
+        "lobbies": [{"id": f"lobby_{i}", "name": f"Lobby {i}", "playerCount": 1, "maxPlayers": 2,
+                     "status": "waiting", "createdAt": time.time()} for i in range(4)],
+        "pagination": {"currentPage": 1, "totalPages": 25, "totalLobbies": 100, "perPage": 4},
+        "search": ""
+    }
+
+    def variant(data):
+        compact = dict(data)
+        if "players" in compact:
+            compact["players"] = lobby.compact_players_view()
+        if "lobbyData" in compact:
+            compact["lobbyData"] = lobby.compact_view()
+        return compact
+
+    messages = [(Message("lobby_list", page), 2), (Message("lobby_list_update", page), 2)]
+    lobby.add_player(LobbyPlayer("client_aaaaaaaaaaaa", "Ann"))
+    data = {"lobbyId": lobby.id, "lobbyData": lobby.view()}
+    messages.append((Message("lobby_created", data, variant(data)), 1))
+    lobby.add_player(LobbyPlayer("client_bbbbbbbbbbbb", "Bob"))
+    data = {"lobbyId": lobby.id, "lobbyData": lobby.view(), "playerCount": 2}
+    messages.append((Message("lobby_joined", data, variant(data)), 1))
+    data = {"playerName": "Bob", "playerCount": 2, "maxPlayers": 2, "players": lobby.players_view()}
+    messages.append((Message("player_joined", data, variant(data)), 2))
+    for name in ("Ann", "Bob"):
+        messages.append((Message("player_ready_update", {"playerName": name, "players": [
+            {"id": p.id, "name": p.name, "ready": True} for p in lobby.players.values()]}), 2))
+    messages.append((Message("countdown_start", {"countdown": 3}), 2))
+    for remaining in (3, 2, 1):
+        messages.append((Message("countdown_update", {"countdown": remaining}), 2))
+
+    players = [{"id": p.id, "name": p.name} for p in lobby.players.values()]
+    data = {"problem": problem.view, "players": players, "timeLimit": problem.time_limit}
+    messages.append((Message("game_start", data, {**data, "problem": problem.reference}), 2))
+
+    # Three submissions each, five verdicts streamed per submission
+    total = len(problem.test_cases)
+    for submission in range(3):
+        for player in lobby.players.values():
+            for test in range(total):
+                messages.append((Message("test_progress", {"test": test, "passed": test <= submission + 2,
+                                                           "status": "Accepted", "runtime": 12, "total": total}), 1))
+            messages.append((Message("test_results", {"mode": "submit", "passed": submission + 2, "total": total,
+                                                      "completed": False, "runtime": 240, "errors": [],
+                                                      "skipped": 0}), 1))
+            messages.append((Message("progress_update", {"players": [{
+                "name": p.name, "tests_passed": submission + 2, "total_tests": total, "completed": False
+            } for p in lobby.players.values()]}), 2))
+
+    scores = [{"name": p.name, "tests_passed": total, "total_tests": total, "completed": True,
+               "completion_time": 187.4} for p in lobby.players.values()]
+    messages.append((Message("game_finished", {"winner": "Ann", "winner_id": "client_aaaaaaaaaaaa",
+                                               "final_scores": scores, "game_duration": 187.4,
+                                               "reason": "completed"}), 2))
+    return messages
+
+def fresh(messages):
+    """Copies with empty encoding caches"""
+    return [(Message(m.event, m.data, m.compact), recipients) for m, recipients in messages]
+
+def run(label: str, messages, encode, decode, games: int):
+    # Encode once per message, as a broadcast does
+    copies = fresh(messages)
+    start = time.perf_counter()
+    frames = [(encode(message), recipients) for message, recipients in copies]
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for frame, recipients in frames:
+        for _ in range(recipients):
+            decode(frame)
+    decode_time = time.perf_counter() - start
+
+    raw = sum(len(frame if isinstance(frame, bytes) else frame.encode("utf-8")) * recipients
+              for frame, recipients in frames)
+
+    # permessage-deflate with context takeover: one compressor per recipient connection
+    compressors = {}
+    deflated = 0
+    start = time.perf_counter()
+    for frame, recipients in frames:
+        payload = frame if isinstance(frame, bytes) else frame.encode("utf-8")
+        for connection in range(recipients):
+            compressor = compressors.setdefault(connection, zlib.compressobj(wbits=-15))
+            deflated += len(compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+    deflate_time = time.perf_counter() - start
+
+    sent = sum(recipients for _, recipients in frames)
+    print(f"  {label:<9} {raw / 1024:7.1f} KiB/game raw {deflated / 1024:6.1f} KiB deflated  "
+          f"encode {encode_time * 1e6 / len(frames):5.1f}us/msg  decode {decode_time * 1e6 / sent:5.1f}us/msg  "
+          f"deflate {deflate_time * 1e6 / sent:5.1f}us/msg")
+    print(f"  {'':<9} {games} games: {raw * games / 2 ** 20:8.1f} MiB raw {deflated * games / 2 ** 20:7.1f} MiB "
+          f"deflated, CPU {(encode_time + deflate_time) * games:6.2f}s server / "
+          f"{decode_time * games:6.2f}s clients")
+
+def bench(games: int):
+    messages = game_messages()
+    print(f"{len(messages)} messages per game, {sum(r for _, r in messages)} deliveries")
+    run("json", messages, lambda message: message.text, json.loads, games)
+    run("msgpack", messages, lambda message: message.packed, msgpack.unpackb, games)
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
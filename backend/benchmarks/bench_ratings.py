@@ -0,0 +1,58 @@
+"""Rank lookups, leaderboard pages and rating updates with many rated players
+
+Fills a RatingService with N players (ratings spread around 1200, plus a
+crowd still on the default 1000) and times, per call: a player's rank,
+the top leaderboard page, a page deep in the table, and rating a
+finished game (two players re-ranked). Counting the players above a
+rating with a scan over every rating is shown for comparison.
+
+Usage (from backend/):
+    python benchmarks/bench_ratings.py [players] [calls]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ratings import RatingService  # noqa: E402
+
+def timed(label: str, calls: int, func):
+    samples = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    print(f"  {label:<28} p50 {statistics.median(samples) * 1e6:8.2f}us  "
+          f"p99 {samples[int(len(samples) * 0.99)] * 1e6:8.2f}us  max {samples[-1] * 1e6:8.2f}us")
+
+def bench(count: int, calls: int):
+    random.seed(5)
+    service = RatingService(None)
+    names = [f"player{index:07d}" for index in range(count)]
+    started = time.perf_counter()
+    service.ratings = {name: 1000 if random.random() < 0.1 else service.clamp(round(random.gauss(1200, 250)))
+                       for name in names}
+    service.index.build(service.ratings.items())
+    print(f"{count} rated players, loaded in {time.perf_counter() - started:.2f}s, {calls} calls each")
+
+    timed("rank", calls, lambda: service.rank(random.choice(names)))
+    timed("top page (50)", calls, lambda: service.leaderboard(0, 50))
+    timed("deep page (50)", calls, lambda: service.leaderboard(random.randrange(count), 50))
+    timed("rate a game", calls, lambda: service.record(random.sample(names, 2), random.choice((None, names[0]))))
+
+    values = list(service.ratings.values())
+
+    def scan():
+        target = service.ratings[random.choice(names)]
+        return sum(1 for rating in values if rating > target)
+
+    timed("rank by scanning", max(1, calls // 100), scan)
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    bench(count, calls)
@@ -0,0 +1,91 @@
+"""Timer wheel against one sleeping task per timer
+
+Gives every lobby a game clock and an idle reaper, as the server does,
+and compares the wheel with the asyncio.sleep task per timer it replaced:
+schedule and cancel cost, memory per timer, the time to fire one tick
+of due timers, and how late the event loop runs while every timer is
+pending and a tenth of them fire at once.
+
+Usage (from backend/):
+    python benchmarks/bench_scheduler.py [lobbies]
+"""
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from scheduler import Scheduler  # noqa: E402
+
+def noop(*args):
+    pass
+
+async def sleeper(delay: float):
+    await asyncio.sleep(delay)
+
+def measure(label: str, count: int, schedule, cancel):
+    tracemalloc.start()
+    start = time.perf_counter()
+    handles = [schedule(i) for i in range(count)]
+    scheduled = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for handle in handles:
+        cancel(handle)
+    cancelled = time.perf_counter() - start
+    print(f"  {label:<14} schedule {scheduled / count * 1e6:5.2f}us  cancel {cancelled / count * 1e6:5.2f}us  "
+          f"{memory / count:6.0f} bytes/timer")
+
+async def lag_while(label: str, pending: int):
+    """Worst and average loop lag over 2s with pending timers (a tenth are due after 1s)"""
+    lags = []
+    interval = 0.01
+    for _ in range(200):
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+    print(f"  {label:<14} {pending} pending: loop lag avg {sum(lags) / len(lags) * 1000:5.2f}ms "
+          f"max {max(lags) * 1000:6.2f}ms")
+
+async def bench(lobbies: int):
+    timers = lobbies * 2
+    print(f"{lobbies} lobbies ({timers} timers)")
+
+    scheduler = Scheduler(tick=0.1)
+    measure("timer wheel", timers,
+            lambda i: scheduler.call_later(60 + i % 1800, noop, i), lambda timer: timer.cancel())
+    measure("sleep tasks", timers,
+            lambda i: asyncio.create_task(sleeper(60 + i % 1800)), lambda task: task.cancel())
+    await asyncio.sleep(0)
+
+    # One tick firing a tenth of the timers, the rest due on later revolutions
+    scheduler = Scheduler(tick=0.1, slots=1024)
+    burst = timers // 10
+    for i in range(timers):
+        scheduler.call_later(0.1 if i < burst else 0.1 + 102.4 * (1 + i % 5), noop, i)
+    start = time.perf_counter()
+    scheduler.current += 1
+    fired = scheduler.advance()
+    print(f"  advance        fired {fired} timers in {(time.perf_counter() - start) * 1000:.1f}ms, "
+          f"{len(scheduler)} left")
+
+    # Loop lag with the wheel running, then with a task per timer
+    scheduler = Scheduler(tick=0.1)
+    for i in range(timers):
+        scheduler.call_later(1 if i < burst else 600, noop, i)
+    await scheduler.start()
+    await lag_while("timer wheel", timers)
+    await scheduler.stop()
+
+    tasks = [asyncio.create_task(sleeper(1 if i < burst else 600)) for i in range(timers)]
+    await lag_while("sleep tasks", timers)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+if __name__ == "__main__":
+    asyncio.run(bench(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000))
@@ -0,0 +1,120 @@
+"""Player latency and spectator traffic for a match with many spectators
+
+Streams one match's progress (a submission every 50ms for a few seconds,
+plus a countdown) to its two players and N spectators, two ways:
+
+  inline:     spectators are pushed in the same loop as the players, and
+              every progress_update goes to everyone
+  spectators: the SpectatorFeed path from main.py, pushed after the
+              players, with progress sampled by a Throttle
+
+Reports how long the players waited for each message, how many messages
+the spectators were sent, and the time the broadcasting handlers spent
+queueing them.
+
+Usage (from backend/):
+    python benchmarks/bench_spectators.py [spectators] [seconds]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fanout import Outbox, Throttle, encode_message  # noqa: E402
+from spectators import SPECTATOR_PROGRESS_INTERVAL, SpectatorFeed  # noqa: E402
+
+SUBMISSION_INTERVAL = 0.05
+
+class SimulatedWebSocket:
+    """Records how long each message took from broadcast to delivery"""
+
+    def __init__(self):
+        self.received = 0
+        self.latencies = []
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(0)
+        self.received += 1
+        self.latencies.append(time.perf_counter() - Clock.broadcast_at)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+class Clock:
+    broadcast_at = 0.0
+
+def progress(step: int) -> dict:
+    return {"players": [{"name": name, "tests_passed": step % 6, "total_tests": 5, "completed": False}
+                        for name in ("Ann", "Bob")]}
+
+async def settle(outboxes):
+    while any(outbox.writer is not None for outbox in outboxes):
+        await asyncio.sleep(0.001)
+
+async def run(label: str, spectator_count: int, seconds: float, feed: bool):
+    player_sockets = [SimulatedWebSocket(), SimulatedWebSocket()]
+    spectator_sockets = [SimulatedWebSocket() for _ in range(spectator_count)]
+    outboxes = {f"p{i}": Outbox(ws) for i, ws in enumerate(player_sockets)}
+    outboxes.update({f"s{i}": Outbox(ws) for i, ws in enumerate(spectator_sockets)})
+    players = ["p0", "p1"]
+    fanout_time = 0.0
+
+    spectators = SpectatorFeed(push=lambda client_id, message, key: outboxes[client_id].push(message, key))
+    for i in range(spectator_count):
+        spectators.add(f"s{i}", "lobby")
+
+    def broadcast(event: str, data: dict, key=None, to_spectators=True):
+        nonlocal fanout_time
+        Clock.broadcast_at = started = time.perf_counter()
+        message = encode_message(event, data)
+        for client_id in players:
+            outboxes[client_id].push(message, key)
+        if to_spectators and feed:
+            spectators.publish("lobby", message, key)
+        elif to_spectators:
+            for i in range(spectator_count):
+                outboxes[f"s{i}"].push(message, key)
+        fanout_time += time.perf_counter() - started
+
+    step = 0
+
+    async def send_spectator_progress(lobby_id: str):
+        spectators.publish(lobby_id, encode_message("progress_update", progress(step)), "progress_update")
+
+    sampled = Throttle(send_spectator_progress, SPECTATOR_PROGRESS_INTERVAL)
+
+    for remaining in (3, 2, 1):
+        broadcast("countdown_update", {"countdown": remaining})
+        await asyncio.sleep(0)
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        step += 1
+        broadcast("progress_update", progress(step), "progress_update", to_spectators=not feed)
+        if feed:
+            await sampled.trigger("lobby")
+        await asyncio.sleep(SUBMISSION_INTERVAL)
+    if feed:
+        await sampled.flush("lobby")
+    broadcast("game_finished", {"winner": "Ann", "reason": "completed"})
+    await asyncio.sleep(0)
+    await settle(outboxes.values())
+
+    latencies = [latency for ws in player_sockets for latency in ws.latencies]
+    sent = sum(ws.received for ws in spectator_sockets)
+    print(f"  {label:<10} player latency p50 {statistics.median(latencies) * 1000:6.2f}ms "
+          f"max {max(latencies) * 1000:6.2f}ms  spectator messages {sent:7d} "
+          f"({sent / max(1, spectator_count):.0f} each)  in handlers {fanout_time * 1000:.1f}ms")
+
+async def bench(spectator_count: int, seconds: float):
+    print(f"2 players, {spectator_count} spectators, a submission every {SUBMISSION_INTERVAL * 1000:.0f}ms "
+          f"for {seconds:.0f}s, spectator progress every {SPECTATOR_PROGRESS_INTERVAL}s")
+    await run("inline", spectator_count, seconds, feed=False)
+    await run("spectators", spectator_count, seconds, feed=True)
+
+if __name__ == "__main__":
+    spectator_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+    asyncio.run(bench(spectator_count, seconds))
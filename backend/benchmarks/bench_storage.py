@@ -0,0 +1,101 @@
+"""Sustained match-completion throughput of the write-behind match store
+
+Records finished games at several steady rates and reports how many per
+second reach the database, the cost of record() on the game path, event
+loop lag while the writer runs and the deepest the queue got.
+A baseline awaits one transaction per game, as writing inline from
+handle_submit_code would. Uses SQLite in a temporary directory unless
+DATABASE_URL points elsewhere.
+
+Usage (from backend/):
+    python benchmarks/bench_storage.py [seconds per rate]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import storage  # noqa: E402
+from storage import MatchResult, MatchStore, PlayerResult, create_database  # noqa: E402
+
+def make_result(i: int) -> MatchResult:
+    now = time.time()
+    return MatchResult(
+        lobby_id=f"lobby_{i}",
+        problem_id="two-sum",
+        winner=f"Player{i % 5000}a",
+        started_at=now - 120,
+        ended_at=now,
+        players=[
+            PlayerResult(f"Player{i % 5000}a", 5, 5, True, 118.5),
+            PlayerResult(f"Player{i % 5000}b", 3, 5, False)
+        ]
+    )
+
+async def monitor_lag(samples: list, interval: float = 0.005):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+def database_url(directory: str, name: str) -> str:
+    if os.getenv("DATABASE_URL", "").startswith("postgres"):
+        return os.environ["DATABASE_URL"]
+    return f"sqlite:///{os.path.join(directory, name)}"
+
+async def inline(directory: str, count: int):
+    database = create_database(database_url(directory, "inline.db"))
+    await database.start()
+    start = time.perf_counter()
+    for i in range(count):
+        await database.execute_batch(MatchStore.statements([make_result(i)]))
+    elapsed = time.perf_counter() - start
+    await database.stop()
+    print(f"  {'inline, one txn per game':<28} {count / elapsed:>9.0f} games/s  "
+          f"{elapsed / count * 1e6:>8.0f}us on the game path")
+
+async def write_behind(directory: str, rate: int, seconds: float):
+    """Record rate games per second for the given time, then drain"""
+    store = MatchStore(create_database(database_url(directory, f"batched_{rate}.db")))
+    await store.start()
+    lag = []
+    monitor = asyncio.create_task(monitor_lag(lag))
+    deepest = 0
+    record_time = 0.0
+    count = int(rate * seconds)
+
+    start = time.perf_counter()
+    for i in range(count):
+        # Pace arrivals in 10ms slices, yielding to the writer in between
+        due = start + i / rate
+        if due - time.perf_counter() > 0.01:
+            await asyncio.sleep(due - time.perf_counter())
+        result = make_result(i)
+        t = time.perf_counter()
+        store.record(result)
+        record_time += time.perf_counter() - t
+        deepest = max(deepest, store.queue.qsize())
+    while store.written + store.failed + store.dropped < count:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    monitor.cancel()
+    await store.stop()
+
+    lag.sort()
+    print(f"  {f'write-behind at {rate}/s':<28} {store.written / elapsed:>9.0f} games/s  "
+          f"{record_time / count * 1e6:>8.1f}us on the game path")
+    print(f"    {store.batches} batches, queue peak {deepest}, dropped {store.dropped}, "
+          f"loop lag p99 {lag[int(len(lag) * 0.99)] * 1000:.1f}ms max {lag[-1] * 1000:.1f}ms")
+
+async def bench(seconds: float):
+    storage.STORAGE_RETRIES = 1
+    with tempfile.TemporaryDirectory() as directory:
+        await inline(directory, 2000)
+        for rate in (500, 2000, 5000, 10_000):
+            await write_behind(directory, rate, seconds)
+
+if __name__ == "__main__":
+    asyncio.run(bench(float(sys.argv[1]) if len(sys.argv) > 1 else 3.0))
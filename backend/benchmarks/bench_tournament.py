@@ -0,0 +1,150 @@
+"""Tournament simulation: a full bracket played through main.py's handlers
+
+Connects simulated clients in-process (an Outbox per client writing to a
+fake socket, events dispatched with main.dispatch_event, no network),
+registers them all in one tournament and lets it run: every match is
+seated, counted down and started by the scheduler, players submit after
+a random solve time to the fake executor (through the admission queue;
+fake runs are never cached) and resubmit until they pass, and winners advance
+automatically. Reports the bracket's duration, when each round
+finished, how many matches were played, judge admission waits, and the
+event loop lag sampled throughout.
+
+Usage (from backend/):
+    python benchmarks/bench_tournament.py [players] [max_solve_seconds] [stagger]
+"""
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+PLAYERS = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+SOLVE_SECONDS = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+STAGGER = sys.argv[3] if len(sys.argv) > 3 else "0.01"
+
+# Configure main before importing it: fake judge, throwaway database, quiet logs
+os.environ.update(
+    EXECUTOR_BACKEND="fake",
+    STATE_BACKEND="memory",
+    DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}",
+    TOURNAMENT_MATCH_DELAY="1",
+    TOURNAMENT_STAGGER=STAGGER,
+    TOURNAMENT_MAX_PLAYERS=str(max(PLAYERS, 2)),
+    LOG_LEVEL="WARNING"
+)
+
+import main  # noqa: E402
+from client_tasks import ClientTasks  # noqa: E402
+from fanout import Outbox  # noqa: E402
+from models import Player  # noqa: E402
+
+# Scores well with the fake executor (most runs pass every test)
+SOLUTION = ("def solve(values, weights):\n    total = 0\n    for value, weight in zip(values, weights):\n"
+            "        total += value * weight\n    return total\n")
+
+class SimulatedClient:
+    """A fake websocket that plays whatever match it is seated in"""
+
+    def __init__(self, client_id: str):
+        self.client_id = client_id
+        self.tasks = ClientTasks(client_id)
+        self.playing = False
+        self.finished = asyncio.Event()
+
+    async def send_text(self, text: str):
+        message = json.loads(text)
+        event = message["event"]
+        if event == "game_start":
+            self.playing = True
+            asyncio.create_task(self.submit(random.uniform(0.3, SOLVE_SECONDS)))
+        elif event == "test_results" and self.playing and not message["data"]["completed"]:
+            asyncio.create_task(self.submit(random.uniform(0.2, 1.0)))
+        elif event == "game_finished":
+            self.playing = False
+        elif event == "tournament_finished":
+            self.finished.set()
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+    async def submit(self, delay: float):
+        await asyncio.sleep(delay)
+        if self.playing:
+            await self.send("submit_code", {"code": SOLUTION})
+
+    async def send(self, event: str, data: dict):
+        await main.dispatch_event(self.client_id, event, data, self.tasks)
+
+async def sample_lag(samples: list, interval: float = 0.05):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - started - interval))
+
+def connect(index: int) -> SimulatedClient:
+    client_id = f"client_{index:012d}"
+    client = SimulatedClient(client_id)
+    main.connections[client_id] = Outbox(client)
+    main.players[client_id] = Player(client_id, f"Player{index}", connected_at=time.time(), guest=False,
+                                     rate_state=main.rate_limiter.new_state())
+    return client
+
+async def bench():
+    random.seed(11)
+    await main.startup()
+    lag = []
+    sampler = asyncio.create_task(sample_lag(lag))
+
+    organizer = connect(0)
+    clients = [connect(index) for index in range(1, PLAYERS + 1)]
+    await organizer.send("create_tournament", {"name": "Benchmark Cup", "maxPlayers": PLAYERS})
+    tournament = next(iter(main.tournaments.values()))
+
+    # Watch rounds finish from the bracket itself
+    round_times = []
+    max_queued = 0
+
+    async def watch():
+        nonlocal max_queued
+        while True:
+            await asyncio.sleep(0.1)
+            max_queued = max(max_queued, main.executor.admission.queued)
+            if tournament.rounds:
+                while len(round_times) < tournament.current_round():
+                    round_times.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    watcher = asyncio.create_task(watch())
+    for client in clients:
+        await client.send("join_tournament", {"tournamentId": tournament.id})
+    await asyncio.wait_for(clients[0].finished.wait(), timeout=3600)
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(0.2)
+    watcher.cancel()
+    sampler.cancel()
+
+    matches = sum(1 for matches in tournament.rounds for match in matches if match.lobby_id)
+    print(f"{PLAYERS} players, {len(tournament.rounds)} rounds, {matches} matches played in {elapsed:.1f}s "
+          f"(stagger {float(STAGGER) * 1000:.0f}ms, solve up to {SOLVE_SECONDS:.1f}s), "
+          f"champion {tournament.champion.name if tournament.champion else None}")
+    print("  rounds done at " + ", ".join(f"{moment:.1f}s" for moment in round_times))
+    admission = main.executor.admission.stats()
+    print(f"  judge runs {main.executor.misses}, cache hits {main.executor.hits}, "
+          f"shared with an identical run {main.executor.deduplicated}, "
+          f"most runs waiting for a slot {max_queued}, average run {admission['averageRunSeconds']}s")
+    lag.sort()
+    print(f"  event loop lag p50 {statistics.median(lag) * 1000:.2f}ms p99 {lag[int(len(lag) * 0.99)] * 1000:.2f}ms "
+          f"max {lag[-1] * 1000:.2f}ms over {len(lag)} samples")
+
+    for client in [organizer] + clients:
+        client.tasks.cancel_all()
+    await main.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(bench())
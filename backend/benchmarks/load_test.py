@@ -0,0 +1,396 @@
+"""End-to-end load test: scripted websocket players against a local server
+
+Starts the mock Judge0 and the API server (uvicorn main:app) as
+subprocesses, then drives /ws with pairs of scripted players. Each pair
+plays full games: browse the lobby list, create and join a lobby, ready
+up, sit through the countdown, run failing code, submit a solution,
+finish and leave. Extra "browser" clients only follow the lobby list, so
+lobby list updates fan out to them while games run.
+
+Reports games per second, messages per second, latency percentiles per
+request type, the server's memory growth (RSS from /proc) and event loop
+lag (from its /metrics), plus the load generator's own loop lag so a
+saturated client is not mistaken for a slow server. Exits non-zero when
+any player fails or a --max-* threshold is exceeded, which makes it
+usable as a CI check on a plain Linux box.
+
+Usage (from backend/):
+    python benchmarks/load_test.py --players 200 --rounds 2 --browsers 100
+    python benchmarks/load_test.py --players 40 --max-p99-ms 250 --max-lag-ms 50 --output report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+SOLUTION = "def solve(*args):\n    return None\n\nprint(solve())\n"
+FAILING = SOLUTION + "# WRONG_ANSWER\n"
+
+# Replies awaited per request; every request is timed until its reply arrives
+REPLIES = {
+    "get_lobby_list": "lobby_list",
+    "create_lobby": "lobby_created",
+    "join_lobby": "lobby_joined",
+    "submit_code": "test_results",
+    "leave_lobby": "lobby_left"
+}
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.games = 0
+        self.sent = 0
+        self.received = 0
+        self.failures: List[str] = []
+
+    def record(self, name: str, seconds: float):
+        self.latencies[name].append(seconds)
+
+def percentile(ordered: List[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class Player:
+    """One scripted websocket client"""
+
+    def __init__(self, url: str, name: str, stats: Stats):
+        self.url = url
+        self.name = name
+        self.stats = stats
+        self.ws = None
+        self.reader: Optional[asyncio.Task] = None
+        # Recent messages per event, so a reply that beats its wait() is not lost
+        self.inbox: Dict[str, deque] = defaultdict(lambda: deque(maxlen=32))
+        self.arrived = asyncio.Event()
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.url, max_size=None, open_timeout=30)
+        self.reader = asyncio.create_task(self.read())
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self.reader is not None:
+            self.reader.cancel()
+
+    async def read(self):
+        async for raw in self.ws:
+            self.stats.received += 1
+            message = json.loads(raw)
+            self.inbox[message.get("event")].append(message.get("data"))
+            self.arrived.set()
+
+    async def send(self, event: str, data: dict):
+        self.stats.sent += 1
+        await self.ws.send(json.dumps({"event": event, "data": data}))
+
+    async def wait(self, event: str, timeout: float = 30.0) -> dict:
+        """Next message of an event type; an error message fails the wait"""
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.inbox["error"]:
+                raise RuntimeError(f"{self.name} got error: {self.inbox['error'].popleft()}")
+            if self.inbox[event]:
+                return self.inbox[event].popleft()
+            if self.reader.done():
+                raise RuntimeError(f"{self.name} disconnected while waiting for {event}")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"{self.name} timed out waiting for {event}")
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def request(self, event: str, data: dict, label: Optional[str] = None) -> dict:
+        started = time.perf_counter()
+        await self.send(event, data)
+        reply = await self.wait(REPLIES[event])
+        self.stats.record(label or event, time.perf_counter() - started)
+        return reply
+
+    def forget(self):
+        """Drop messages nobody waits for (broadcasts of a finished game)"""
+        self.inbox.clear()
+
+async def play_games(url: str, pair: int, rounds: int, stats: Stats):
+    host = Player(url, f"Host{pair}", stats)
+    guest = Player(url, f"Guest{pair}", stats)
+    try:
+        await host.connect()
+        await guest.connect()
+        for game in range(rounds):
+            await asyncio.gather(host.request("get_lobby_list", {}), guest.request("get_lobby_list", {}))
+
+            created = await host.request("create_lobby", {"name": f"load {pair}-{game}", "playerName": host.name})
+            await guest.request("join_lobby", {"lobbyId": created["lobbyId"], "playerName": guest.name})
+            await host.wait("player_joined")
+
+            # Timed from the last ready to game_start, so it includes the countdown
+            await host.send("player_ready", {})
+            started = time.perf_counter()
+            await guest.send("player_ready", {})
+            await asyncio.gather(host.wait("game_start"), guest.wait("game_start"))
+            stats.record("player_ready->game_start", time.perf_counter() - started)
+
+            await guest.request("submit_code", {"code": FAILING + f"# {guest.name}\n", "mode": "run"},
+                                "submit_code (run)")
+            started = time.perf_counter()
+            await host.request("submit_code", {"code": SOLUTION + f"# {host.name} {game}\n"}, "submit_code (submit)")
+            await asyncio.gather(host.wait("game_finished"), guest.wait("game_finished"))
+            stats.record("submit_code->game_finished", time.perf_counter() - started)
+
+            await guest.request("leave_lobby", {})
+            await host.request("leave_lobby", {})
+            host.forget()
+            guest.forget()
+            stats.games += 1
+    except Exception as e:
+        stats.failures.append(f"pair {pair}: {type(e).__name__}: {e}")
+    finally:
+        await host.close()
+        await guest.close()
+
+async def browse(url: str, index: int, stats: Stats, done: asyncio.Event):
+    """Follow the lobby list (receiving pushed updates) until the games end"""
+    browser = Player(url, f"Browser{index}", stats)
+    try:
+        await browser.connect()
+        await browser.request("get_lobby_list", {"deltas": index % 2 == 0})
+        while not done.is_set():
+            await asyncio.sleep(0.5)
+            browser.forget()
+    except Exception as e:
+        stats.failures.append(f"browser {index}: {type(e).__name__}: {e}")
+    finally:
+        await browser.close()
+
+async def monitor_lag(samples: List[float], interval: float = 0.05):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_process(app: str, port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env={**os.environ, **env}
+    )
+
+async def wait_until_up(base_url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{base_url} exited with code {process.returncode}")
+            try:
+                await client.get(base_url + "/")
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{base_url} did not start within {timeout}s")
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+async def lag_buckets(base_url: str) -> Dict[float, int]:
+    """Cumulative buckets of the server's event loop lag histogram"""
+    async with httpx.AsyncClient() as client:
+        text = (await client.get(base_url + "/metrics")).text
+    buckets = {}
+    for line in text.splitlines():
+        if line.startswith("shibacoder_event_loop_lag_seconds_bucket"):
+            le = line.split('le="')[1].split('"')[0]
+            buckets[float("inf") if le == "+Inf" else float(le)] = int(line.rsplit(" ", 1)[1])
+    return buckets
+
+def bucket_percentile(before: Dict[float, int], after: Dict[float, int], pct: float) -> float:
+    """Upper bound of the bucket holding the percentile of samples taken in between"""
+    bounds = sorted(after)
+    counts = [after[bound] - before.get(bound, 0) for bound in bounds]
+    total = counts[-1] if counts else 0
+    for bound, cumulative in zip(bounds, counts):
+        if total and cumulative >= total * pct / 100:
+            return bound
+    return 0.0
+
+def raise_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+async def run(args) -> dict:
+    raise_file_limit()
+    processes = []
+    base_url = args.server
+    server_pid = None
+    if base_url is None:
+        judge0_port, server_port = free_port(), free_port()
+        processes.append(start_process("benchmarks.mock_judge0:app", judge0_port,
+                                       {"MOCK_JUDGE0_LATENCY": str(args.judge0_latency)}))
+        await wait_until_up(f"http://127.0.0.1:{judge0_port}", processes[0])
+        server = start_process("main:app", server_port, {
+            "EXECUTOR_BACKEND": "judge0",
+            "JUDGE0_API_KEY": "load-test",
+            "JUDGE0_BASE_URL": f"http://127.0.0.1:{judge0_port}",
+            "JUDGE0_POLL_INITIAL": "0.02",
+            "DATABASE_URL": "",
+            "STATE_BACKEND": "memory",
+            "LOG_LEVEL": "WARNING"
+        })
+        processes.append(server)
+        base_url = f"http://127.0.0.1:{server_port}"
+        await wait_until_up(base_url, server)
+        server_pid = server.pid
+    ws_url = base_url.replace("http", "ws", 1) + "/ws"
+
+    try:
+        stats = Stats()
+        client_lag: List[float] = []
+        lag_task = asyncio.create_task(monitor_lag(client_lag))
+        lag_before = await lag_buckets(base_url)
+        rss_start = rss_mb(server_pid) if server_pid else None
+        rss_peak = rss_start or 0.0
+
+        done = asyncio.Event()
+        browsers = [asyncio.create_task(browse(ws_url, i, stats, done)) for i in range(args.browsers)]
+
+        async def ramped(pair: int):
+            await asyncio.sleep(args.ramp * pair / max(1, args.players // 2))
+            await play_games(ws_url, pair, args.rounds, stats)
+
+        started = time.perf_counter()
+        games = asyncio.gather(*(ramped(pair) for pair in range(args.players // 2)))
+        while not games.done():
+            await asyncio.sleep(0.5)
+            if server_pid:
+                rss_peak = max(rss_peak, rss_mb(server_pid))
+        await games
+        elapsed = time.perf_counter() - started
+        done.set()
+        await asyncio.gather(*browsers)
+
+        lag_after = await lag_buckets(base_url)
+        rss_end = rss_mb(server_pid) if server_pid else None
+        lag_task.cancel()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    client_lag.sort()
+    report = {
+        "players": args.players,
+        "browsers": args.browsers,
+        "rounds": args.rounds,
+        "seconds": round(elapsed, 3),
+        "games": stats.games,
+        "gamesPerSecond": round(stats.games / elapsed, 2),
+        "messagesSentPerSecond": round(stats.sent / elapsed, 1),
+        "messagesReceivedPerSecond": round(stats.received / elapsed, 1),
+        "latencyMs": {
+            name: {
+                "count": len(samples),
+                "p50": round(percentile(samples, 50) * 1000, 2),
+                "p95": round(percentile(samples, 95) * 1000, 2),
+                "p99": round(percentile(samples, 99) * 1000, 2),
+                "max": round(samples[-1] * 1000, 2)
+            } for name, samples in ((name, sorted(samples)) for name, samples in stats.latencies.items())
+        },
+        "serverLoopLagMs": {
+            "p50": bucket_percentile(lag_before, lag_after, 50) * 1000,
+            "p99": bucket_percentile(lag_before, lag_after, 99) * 1000
+        },
+        "clientLoopLagMs": {
+            "p99": round(percentile(client_lag, 99) * 1000, 2) if client_lag else 0.0,
+            "max": round(client_lag[-1] * 1000, 2) if client_lag else 0.0
+        },
+        "serverRssMb": {
+            "start": round(rss_start, 1), "peak": round(rss_peak, 1), "end": round(rss_end, 1),
+            "growth": round(rss_end - rss_start, 1)
+        } if server_pid else None,
+        "failures": stats.failures
+    }
+    return report
+
+def print_report(report: dict):
+    print(f"{report['players']} players, {report['browsers']} browsers, {report['rounds']} rounds: "
+          f"{report['games']} games in {report['seconds']}s "
+          f"({report['gamesPerSecond']} games/s, {report['messagesSentPerSecond']} sent/s, "
+          f"{report['messagesReceivedPerSecond']} received/s)")
+    print(f"  {'request':<28} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)")
+    for name, latency in report["latencyMs"].items():
+        print(f"  {name:<28} {latency['count']:>6} {latency['p50']:>9.2f} {latency['p95']:>9.2f} "
+              f"{latency['p99']:>9.2f} {latency['max']:>9.2f}")
+    lag = report["serverLoopLagMs"]
+    print(f"  server loop lag p50 <= {lag['p50']:g}ms, p99 <= {lag['p99']:g}ms "
+          f"(client p99 {report['clientLoopLagMs']['p99']}ms)")
+    if report["serverRssMb"]:
+        rss = report["serverRssMb"]
+        print(f"  server RSS {rss['start']}MB -> peak {rss['peak']}MB -> {rss['end']}MB (growth {rss['growth']}MB)")
+    for failure in report["failures"][:20]:
+        print(f"  FAILED {failure}")
+
+def check(report: dict, args) -> List[str]:
+    """Threshold violations for CI"""
+    problems = []
+    if report["failures"]:
+        problems.append(f"{len(report['failures'])} clients failed")
+    if args.max_p99_ms is not None:
+        for name, latency in report["latencyMs"].items():
+            # The ready-to-start time includes the fixed countdown
+            if "->game_start" not in name and latency["p99"] > args.max_p99_ms:
+                problems.append(f"{name} p99 {latency['p99']}ms > {args.max_p99_ms}ms")
+    if args.max_lag_ms is not None and report["serverLoopLagMs"]["p99"] > args.max_lag_ms:
+        problems.append(f"server loop lag p99 {report['serverLoopLagMs']['p99']}ms > {args.max_lag_ms}ms")
+    if args.max_rss_growth_mb is not None and report["serverRssMb"] and \
+            report["serverRssMb"]["growth"] > args.max_rss_growth_mb:
+        problems.append(f"server RSS grew {report['serverRssMb']['growth']}MB > {args.max_rss_growth_mb}MB")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--players", type=int, default=100, help="players, in pairs (default 100)")
+    parser.add_argument("--rounds", type=int, default=2, help="games each pair plays (default 2)")
+    parser.add_argument("--browsers", type=int, default=50, help="clients only following the lobby list")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which pairs start")
+    parser.add_argument("--judge0-latency", type=float, default=0.05, help="mock Judge0 time per submission")
+    parser.add_argument("--server", help="use a running server (http://host:port) instead of starting one")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--max-p99-ms", type=float, help="fail if any request's p99 exceeds this")
+    parser.add_argument("--max-lag-ms", type=float, help="fail if the server loop lag p99 exceeds this")
+    parser.add_argument("--max-rss-growth-mb", type=float, help="fail if server RSS grows by more than this")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    problems = check(report, args)
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    sys.exit(1 if problems else 0)
+
+if __name__ == "__main__":
+    main()
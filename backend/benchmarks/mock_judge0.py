@@ -0,0 +1,65 @@
+"""Minimal local stand-in for the Judge0 CE API used by the benchmarks
+
+Implements the batch submission endpoints used by judge0_submit_code.
+Every submission reports "Processing" until MOCK_JUDGE0_LATENCY seconds
+have passed and is then Accepted, or Wrong Answer if its source code
+contains the marker WRONG_ANSWER.
+
+Run standalone with:
+    uvicorn benchmarks.mock_judge0:app --port 2358
+"""
+import base64
+import os
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+MOCK_JUDGE0_LATENCY = float(os.getenv("MOCK_JUDGE0_LATENCY", "0.05"))
+
+ACCEPTED = {"id": 3, "description": "Accepted"}
+WRONG_ANSWER = {"id": 4, "description": "Wrong Answer"}
+
+app = FastAPI(title="Mock Judge0")
+submissions = {}
+
+@app.post("/submissions/batch", status_code=201)
+async def create_batch(request: Request):
+    body = await request.json()
+    tokens = []
+    for submission in body.get("submissions", []):
+        token = uuid.uuid4().hex
+        source = base64.b64decode(submission.get("source_code", "")).decode("utf-8", errors="replace")
+        submissions[token] = (time.monotonic(), WRONG_ANSWER if "WRONG_ANSWER" in source else ACCEPTED)
+        tokens.append({"token": token})
+    return tokens
+
+@app.get("/submissions/batch")
+async def get_batch(tokens: str = ""):
+    now = time.monotonic()
+    results = []
+    for token in tokens.split(","):
+        if token not in submissions:
+            results.append(None)
+        elif now - submissions[token][0] < MOCK_JUDGE0_LATENCY:
+            results.append({"token": token, "status": {"id": 2, "description": "Processing"}})
+        else:
+            results.append({
+                "token": token,
+                "status": submissions[token][1],
+                "time": "0.010",
+                "stdout": None,
+                "stderr": None,
+                "compile_output": None
+            })
+    return {"submissions": results}
+
+def start_in_thread(port: int) -> uvicorn.Server:
+    """Serve the mock on 127.0.0.1:port from a daemon thread"""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
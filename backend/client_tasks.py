@@ -0,0 +1,57 @@
+import asyncio
+import os
+from typing import Dict
+
+from log import get_logger
+
+logger = get_logger("client_tasks")
+
+# Maximum background handlers in flight per connection
+CLIENT_MAX_TASKS = int(os.getenv("CLIENT_MAX_TASKS", "2"))
+
+class ClientTasks:
+    """Background handler tasks owned by one websocket connection
+
+    Long-running handlers (code submission, ready countdown) run here so
+    the connection's receive loop keeps reading. Each task occupies a named
+    slot: a new task either supersedes the one in its slot or is refused
+    while it is still running. All tasks are cancelled on disconnect.
+    """
+
+    def __init__(self, client_id: str, max_tasks: int = CLIENT_MAX_TASKS):
+        self.client_id = client_id
+        self.max_tasks = max_tasks
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def busy(self, slot: str) -> bool:
+        task = self.tasks.get(slot)
+        return task is not None and not task.done()
+
+    def spawn(self, slot: str, coro, supersede: bool = False) -> bool:
+        """Start coro in a slot; returns False (and drops coro) when refused"""
+        if self.busy(slot):
+            if not supersede:
+                coro.close()
+                return False
+            self.tasks.pop(slot).cancel()
+
+        if sum(1 for task in self.tasks.values() if not task.done()) >= self.max_tasks:
+            coro.close()
+            return False
+
+        task = asyncio.create_task(coro, name=f"{self.client_id}:{slot}")
+        self.tasks[slot] = task
+        task.add_done_callback(lambda done: self._finished(slot, done))
+        return True
+
+    def _finished(self, slot: str, task: asyncio.Task):
+        if self.tasks.get(slot) is task:
+            del self.tasks[slot]
+        if not task.cancelled() and task.exception():
+            logger.error("background_task_failed", client_id=self.client_id, slot=slot, error=str(task.exception()))
+
+    def cancel_all(self):
+        """Cancel every in-flight task (disconnect or leaving the lobby)"""
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
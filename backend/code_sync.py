@@ -0,0 +1,110 @@
+import os
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Seconds between code_update relays of one player's editor
+CODE_SYNC_INTERVAL = float(os.getenv("CODE_SYNC_INTERVAL", "0.25"))
+
+# Longest editor buffer accepted
+CODE_MAX_LENGTH = int(os.getenv("CODE_MAX_LENGTH", "65536"))
+
+class DeltaError(ValueError):
+    """A code_delta that does not apply to the buffer"""
+
+def apply_ops(text: str, ops: list) -> str:
+    """Apply [position, delete, insert] splices in order
+
+    Each position counts characters (code points) in the text as left by
+    the ops before it.
+    """
+    if not isinstance(ops, list):
+        raise DeltaError("ops must be a list")
+    for op in ops:
+        if not isinstance(op, list) or len(op) != 3:
+            raise DeltaError("each op must be [position, delete, insert]")
+        position, delete, insert = op
+        if (not isinstance(position, int) or not isinstance(delete, int) or not isinstance(insert, str)
+                or isinstance(position, bool) or isinstance(delete, bool)):
+            raise DeltaError("each op must be [position, delete, insert]")
+        if position < 0 or delete < 0 or position + delete > len(text):
+            raise DeltaError("op out of range")
+        text = text[:position] + insert + text[position + delete:]
+    if len(text) > CODE_MAX_LENGTH:
+        raise DeltaError("code is too long")
+    return text
+
+class CodeBuffer:
+    """A player's editor text, rebuilt on the server from code_delta events
+
+    The client numbers its deltas 1, 2, 3... and sends either edits
+    ({"seq", "ops"}) or its whole text ({"seq", "text"}), which also
+    restarts the numbering at seq. A delta that is out of order or does
+    not apply leaves the buffer as it was; the client is asked to resync
+    with its whole text. Edits applied since the last relay are kept
+    until take_update() hands them on, so relaying costs the size of the
+    edits, not of the file. The whole text is relayed again once the
+    edits relayed since it add up to its size, so viewers that missed
+    something converge while the cost per keystroke stays independent
+    of the file size.
+    """
+    __slots__ = ("text", "seq", "pending", "pending_size", "relayed_seq", "relayed_size", "snapshot_due",
+                 "awaiting_text")
+
+    def __init__(self):
+        self.text = ""
+        self.seq = 0
+        self.pending: List[list] = []
+        self.pending_size = 0
+        # Seq of the last relay, which the next relay's edits apply to, and
+        # the size of the edits relayed since the last snapshot
+        self.relayed_seq = 0
+        self.relayed_size = 0
+        self.snapshot_due = True
+        # Set once the client has been asked to resync, until its text arrives
+        self.awaiting_text = False
+
+    def apply(self, seq: int, ops: Optional[list] = None, text: Optional[str] = None):
+        """Apply one delta or snapshot; raises DeltaError if it does not fit"""
+        if text is not None:
+            if not isinstance(text, str) or len(text) > CODE_MAX_LENGTH:
+                raise DeltaError("code is too long")
+            self.text = text
+            self.seq = seq
+            self.pending.clear()
+            self.pending_size = 0
+            self.snapshot_due = True
+            self.awaiting_text = False
+            return
+        if seq != self.seq + 1:
+            raise DeltaError(f"expected delta {self.seq + 1}")
+        self.text = apply_ops(self.text, ops)
+        self.seq = seq
+        if not self.snapshot_due:
+            self.pending.extend(ops)
+            self.pending_size += sum(len(op[2]) + 2 for op in ops)
+            if self.relayed_size + self.pending_size > len(self.text):
+                self.snapshot_due = True
+
+    def take_update(self) -> Optional[dict]:
+        """What to relay since the last call: the whole text or the edits, or None if nothing changed
+
+        Edits come with "base", the seq they apply to; a viewer that does
+        not have it waits for the next snapshot.
+        """
+        if self.snapshot_due:
+            update = {"seq": self.seq, "text": self.text}
+            self.relayed_size = 0
+            self.snapshot_due = False
+        elif self.pending:
+            update = {"seq": self.seq, "base": self.relayed_seq, "ops": self.pending}
+            self.relayed_size += self.pending_size
+        else:
+            return None
+        self.pending = []
+        self.pending_size = 0
+        self.relayed_seq = self.seq
+        return update
@@ -0,0 +1,568 @@
+import asyncio
+import base64
+import json
+import os
+import random
+import signal
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+from offload import run_blocking
+from log import get_logger
+from metrics import (JUDGE0_ERRORS, JUDGE0_POLL_SECONDS, JUDGE0_POLLS, JUDGE0_POLLS_PER_BATCH,
+                     JUDGE0_SUBMIT_SECONDS)
+
+# Load environment variables
+load_dotenv()
+
+logger = get_logger("executors")
+
+# Judge0 API Configuration
+JUDGE0_API_KEY = os.getenv("JUDGE0_API_KEY")
+JUDGE0_API_HOST = os.getenv("JUDGE0_API_HOST", "judge0-ce.p.rapidapi.com")
+JUDGE0_BASE_URL = os.getenv("JUDGE0_BASE_URL", "https://judge0-ce.p.rapidapi.com")
+
+# Batch polling backoff (seconds): start fast, double while nothing finishes
+JUDGE0_POLL_INITIAL = float(os.getenv("JUDGE0_POLL_INITIAL", "0.2"))
+JUDGE0_POLL_MAX = float(os.getenv("JUDGE0_POLL_MAX", "2.0"))
+JUDGE0_POLL_TIMEOUT = float(os.getenv("JUDGE0_POLL_TIMEOUT", "15.0"))
+
+# Shared Judge0 connection pool and per-host concurrency cap
+JUDGE0_MAX_CONNECTIONS = int(os.getenv("JUDGE0_MAX_CONNECTIONS", "50"))
+JUDGE0_MAX_KEEPALIVE = int(os.getenv("JUDGE0_MAX_KEEPALIVE", "20"))
+JUDGE0_KEEPALIVE_EXPIRY = float(os.getenv("JUDGE0_KEEPALIVE_EXPIRY", "30.0"))
+JUDGE0_MAX_CONCURRENCY = int(os.getenv("JUDGE0_MAX_CONCURRENCY", "32"))
+JUDGE0_HTTP2 = os.getenv("JUDGE0_HTTP2", "true").lower() == "true"
+
+# Tests per batch when judging stops at the first failure (later batches are never billed)
+JUDGE0_WAVE_SIZE = int(os.getenv("JUDGE0_WAVE_SIZE", "2"))
+
+# Python language ID for Judge0 (71 = Python 3.8.1)
+PYTHON_LANGUAGE_ID = 71
+
+# Local sandbox configuration
+LOCAL_POOL_SIZE = int(os.getenv("LOCAL_POOL_SIZE", "8"))
+LOCAL_CPU_LIMIT = int(os.getenv("LOCAL_CPU_LIMIT", "2"))  # seconds of CPU per test
+LOCAL_MEMORY_LIMIT_MB = int(os.getenv("LOCAL_MEMORY_LIMIT_MB", "256"))
+LOCAL_WALL_TIMEOUT = float(os.getenv("LOCAL_WALL_TIMEOUT", "5.0"))  # seconds per test
+LOCAL_OUTPUT_LIMIT = int(os.getenv("LOCAL_OUTPUT_LIMIT", "65536"))  # bytes kept per stream
+# Unprivileged uid/gid that workers switch to when the server runs as root
+LOCAL_SANDBOX_UID = int(os.getenv("LOCAL_SANDBOX_UID", "65534"))
+
+# Which backend runs submissions: judge0, local or fake. Without a Judge0 key
+# the default is fake; local runs player code on this host and must be chosen
+EXECUTOR_BACKEND = os.getenv("EXECUTOR_BACKEND", "judge0" if JUDGE0_API_KEY else "fake")
+
+SANDBOX_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+EXIT_COMPILE_ERROR = 113  # Must match sandbox_worker.py
+
+def encode_b64(text: str) -> str:
+    """Base64-encode a string for Judge0's base64_encoded mode"""
+    return base64.b64encode(text.encode("utf-8")).decode("ascii")
+
+def decode_b64(text: str) -> str:
+    """Decode a base64 field returned by Judge0 (None-safe)"""
+    if not text:
+        return ""
+    return base64.b64decode(text).decode("utf-8", errors="replace")
+
+def normalize_output(text: str) -> str:
+    """Normalize program output for comparison (trailing whitespace and blank lines)"""
+    return "\n".join(line.rstrip() for line in text.strip().splitlines())
+
+def outputs_match(stdout: str, expected_output: str) -> bool:
+    """Compare program output with the expected output after normalization"""
+    return normalize_output(stdout) == normalize_output(expected_output)
+
+def summarize_verdicts(verdicts: Dict[int, dict], errors: Dict[int, str], total_tests: int) -> dict:
+    """Build the aggregate test result sent back to the player"""
+    passed_tests = sum(1 for verdict in verdicts.values() if verdict["passed"])
+    judged = set(verdicts) | {i for i in errors if i < total_tests}
+
+    return {
+        "passed": passed_tests,
+        "total": total_tests,
+        "completed": passed_tests == total_tests,
+        "runtime": sum(verdict["runtime"] for verdict in verdicts.values()),
+        "errors": [errors[i] for i in sorted(errors)],
+        "skipped": total_tests - len(judged)
+    }
+
+class Executor:
+    """Runs a submission against a list of test cases
+
+    Backends implement run(); start()/stop() are called from the FastAPI
+    startup and shutdown events for anything that should live as long as
+    the app (connection pools, pre-warmed workers).
+    """
+    name = "base"
+    # Whether results follow from the code, so identical submissions may share one
+    cacheable = True
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def run(self, code: str, test_cases: list, on_result=None, stop_on_failure: bool = False) -> dict:
+        """Return aggregate results, awaiting on_result(verdict) per finished test
+
+        With stop_on_failure, tests that have not been judged when the first
+        one fails may be skipped; test_cases are taken in the given order.
+        """
+        raise NotImplementedError
+
+class FakeExecutor(Executor):
+    """Heuristic scoring without running the code (offline development only)"""
+    name = "fake"
+    # Each run draws its own result, so a resubmission may do better
+    cacheable = False
+
+    async def run(self, code: str, test_cases: list, on_result=None, stop_on_failure: bool = False) -> dict:
+        """Pass the first tests the heuristic allows and fail the rest, in order"""
+        # Simulate processing time without holding up the event loop
+        await asyncio.sleep(0.1)
+        passed_count = await run_blocking(fake_passed_count, code, len(test_cases))
+        hint = "" if "return" in code else " - Function must return a value"
+
+        verdicts = {}
+        errors = {}
+        for index in range(len(test_cases)):
+            passed = index < passed_count
+            verdict = {
+                "test": index + 1,
+                "passed": passed,
+                "status": "Accepted" if passed else "Wrong Answer",
+                "runtime": random.randint(10, 60),  # Fake runtime in ms
+                "error": None if passed else f"Test {index+1}: Wrong Answer{hint}"
+            }
+            verdicts[index] = verdict
+            if verdict["error"]:
+                errors[index] = verdict["error"]
+            if on_result:
+                await on_result(verdict)
+            if errors and stop_on_failure:
+                break
+        return summarize_verdicts(verdicts, errors, len(test_cases))
+
+class Judge0Executor(Executor):
+    """Runs submissions on the Judge0 CE API via RapidAPI"""
+    name = "judge0"
+
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+        self.slots = asyncio.Semaphore(JUDGE0_MAX_CONCURRENCY)
+
+    async def start(self):
+        """Open the shared Judge0 connection pool"""
+        self.client = create_judge0_client()
+
+    async def stop(self):
+        """Close the shared Judge0 connection pool"""
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    async def request(self, client: httpx.AsyncClient, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send one request to Judge0 without exceeding the host concurrency cap"""
+        async with self.slots:
+            return await client.request(method, path, **kwargs)
+
+    async def run(self, code: str, test_cases: list, on_result=None, stop_on_failure: bool = False) -> dict:
+        """Submit test cases to Judge0 in batches and poll each batch together
+
+        Normally all tests go in one batch. With stop_on_failure they are
+        sent in order, JUDGE0_WAVE_SIZE at a time, and no further batch is
+        sent once a test has failed.
+        """
+        total_tests = len(test_cases)
+        verdicts = {}
+        errors = {}
+        wave_size = max(1, JUDGE0_WAVE_SIZE if stop_on_failure else total_tests)
+
+        # Reuse the pooled client; only fall back to a one-off client outside the app lifecycle
+        client = self.client or create_judge0_client()
+        try:
+            source_code = encode_b64(code)
+            for start in range(0, total_tests, wave_size):
+                indexes = range(start, min(start + wave_size, total_tests))
+                await self.run_batch(client, source_code, test_cases, indexes, verdicts, errors, on_result)
+                if stop_on_failure and errors:
+                    break
+
+        except Exception as e:
+            logger.warning("judge0_api_error", error=str(e))
+            JUDGE0_ERRORS.inc()
+            errors[total_tests] = f"API Error: {str(e)}"
+        finally:
+            if client is not self.client:
+                await client.aclose()
+
+        return summarize_verdicts(verdicts, errors, total_tests)
+
+    async def run_batch(self, client: httpx.AsyncClient, source_code: str, test_cases: list, indexes: range,
+                        verdicts: Dict[int, dict], errors: Dict[int, str], on_result=None):
+        """Judge the tests at indexes in one batch, recording verdicts and errors"""
+        # Submit every test case in a single batch request (problem bank tests come pre-encoded)
+        started = time.perf_counter()
+        submit_response = await self.request(
+            client, "POST", "/submissions/batch",
+            params={"base64_encoded": "true"},
+            json={"submissions": [{
+                "language_id": PYTHON_LANGUAGE_ID,
+                "source_code": source_code,
+                "stdin": test_cases[i].get("stdin_b64") or encode_b64(test_cases[i]["input"]),
+                "expected_output": test_cases[i].get("expected_output_b64") or encode_b64(test_cases[i]["expected_output"])
+            } for i in indexes]},
+            timeout=30.0
+        )
+        JUDGE0_SUBMIT_SECONDS.observe(time.perf_counter() - started)
+
+        if submit_response.status_code != 201:
+            raise RuntimeError(f"Batch submission failed ({submit_response.status_code})")
+
+        # Map tokens back to test indexes; entries rejected by Judge0 have no token
+        pending = {}
+        for i, item in zip(indexes, submit_response.json()):
+            if item.get("token"):
+                pending[item["token"]] = i
+            else:
+                errors[i] = f"Test {i+1}: Submission failed"
+
+        # Poll all outstanding tokens together, backing off while nothing finishes
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + JUDGE0_POLL_TIMEOUT
+        delay = JUDGE0_POLL_INITIAL
+        polls = 0
+        while pending and loop.time() < deadline:
+            await asyncio.sleep(delay)
+
+            started = time.perf_counter()
+            result_response = await self.request(
+                client, "GET", "/submissions/batch",
+                params={
+                    "tokens": ",".join(pending),
+                    "base64_encoded": "true",
+                    "fields": "token,status,stdout,stderr,compile_output,time"
+                }
+            )
+            JUDGE0_POLL_SECONDS.observe(time.perf_counter() - started)
+            JUDGE0_POLLS.inc()
+            polls += 1
+
+            finished = 0
+            if result_response.status_code == 200:
+                for result in result_response.json().get("submissions", []):
+                    if not result or result.get("token") not in pending:
+                        continue
+                    # Status 1=In Queue, 2=Processing
+                    if (result.get("status") or {}).get("id") in [1, 2]:
+                        continue
+
+                    i = pending.pop(result["token"])
+                    verdict = parse_judge0_result(i, result)
+                    verdicts[i] = verdict
+                    if verdict["error"]:
+                        errors[i] = verdict["error"]
+                    finished += 1
+                    if on_result:
+                        await on_result(verdict)
+
+            # Reset the backoff as soon as results start arriving
+            delay = JUDGE0_POLL_INITIAL if finished else min(delay * 2, JUDGE0_POLL_MAX)
+
+        JUDGE0_POLLS_PER_BATCH.observe(polls)
+        for i in pending.values():
+            errors[i] = f"Test {i+1}: Timeout waiting for result"
+
+class LocalExecutor(Executor):
+    """Runs Python submissions in a pool of pre-warmed sandbox subprocesses
+
+    Each worker is a started interpreter blocked on its job header, so a test
+    only pays for executing the submission. Workers are single use: the
+    process exits after one test and a replacement is spawned in the
+    background. Workers leave the network and, when the server runs as
+    root, switch to LOCAL_SANDBOX_UID (see sandbox_worker.py); CPU, memory,
+    file-size, open-file and process rlimits are applied before the
+    submission runs, and a wall-clock timeout kills the whole process
+    group. For development only: this is not a security boundary and no
+    substitute for container or seccomp isolation of the host. Run as
+    another user, a submission can still read the server's environment.
+    """
+    name = "local"
+
+    def __init__(self, pool_size: int = LOCAL_POOL_SIZE):
+        self.pool_size = pool_size
+        self.idle: Optional[asyncio.Queue] = None
+        self.workdir = tempfile.mkdtemp(prefix="shibacoder-sandbox-")
+        if hasattr(os, "geteuid") and os.geteuid() == 0:
+            # Scratch directory owned by the uid the workers switch to
+            os.chown(self.workdir, LOCAL_SANDBOX_UID, LOCAL_SANDBOX_UID)
+        self.refills = set()
+        self.warned = False
+
+    async def start(self):
+        """Pre-warm the worker pool"""
+        self.idle = asyncio.Queue()
+        workers = await asyncio.gather(*(self.spawn_worker() for _ in range(self.pool_size)))
+        for worker in workers:
+            self.idle.put_nowait(worker)
+
+    async def stop(self):
+        """Kill and reap idle workers"""
+        for task in list(self.refills):
+            task.cancel()
+        if not self.idle:
+            return
+        while not self.idle.empty():
+            worker = self.idle.get_nowait()
+            kill_process_group(worker)
+            await worker.wait()
+
+    async def spawn_worker(self) -> asyncio.subprocess.Process:
+        """Start an isolated interpreter and wait until it is ready for a job"""
+        worker = await asyncio.create_subprocess_exec(
+            sys.executable, "-I", SANDBOX_WORKER,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.workdir,
+            env={"PYTHONIOENCODING": "utf-8", "SANDBOX_UID": str(LOCAL_SANDBOX_UID)},
+            start_new_session=True
+        )
+        # The worker writes a single ready byte once its imports are done
+        # and it has isolated itself ("P" if it could not fully)
+        if await worker.stdout.readexactly(1) != b"R" and not self.warned:
+            self.warned = True
+            logger.warning("sandbox_not_isolated", detail="submissions may reach the network or the "
+                           "server's environment; use judge0 outside development")
+        return worker
+
+    async def refill(self):
+        self.idle.put_nowait(await self.spawn_worker())
+
+    async def acquire_worker(self) -> asyncio.subprocess.Process:
+        """Take a warm worker, waiting for a refill when the pool is drained"""
+        if self.idle is None:
+            await self.start()
+        while True:
+            worker = await self.idle.get()
+            task = asyncio.create_task(self.refill())
+            self.refills.add(task)
+            task.add_done_callback(self.refills.discard)
+            if worker.returncode is None:
+                return worker
+
+    async def run_test(self, index: int, code: str, test_case: dict) -> dict:
+        """Execute one test case in a fresh worker and compare its stdout"""
+        worker = await self.acquire_worker()
+        header = json.dumps({
+            "code": code,
+            "cpu_seconds": LOCAL_CPU_LIMIT,
+            "memory_bytes": LOCAL_MEMORY_LIMIT_MB * 1024 * 1024
+        })
+
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            worker.stdin.write(header.encode("utf-8") + b"\n" + test_case["input"].encode("utf-8"))
+            await worker.stdin.drain()
+            worker.stdin.close()
+            stdout, stderr = await self.collect(worker)
+        except asyncio.TimeoutError:
+            timed_out = True
+            stdout = stderr = ""
+        except (BrokenPipeError, ConnectionResetError):
+            stdout, stderr = "", "Sandbox worker exited unexpectedly"
+        finally:
+            kill_process_group(worker)
+            await worker.wait()
+        runtime_ms = int((time.perf_counter() - started) * 1000)
+
+        returncode = worker.returncode
+        if timed_out or returncode in (-signal.SIGXCPU, -signal.SIGKILL):
+            status = "Time Limit Exceeded"
+        elif returncode == EXIT_COMPILE_ERROR:
+            status = "Compilation Error"
+        elif returncode != 0:
+            status = "Runtime Error (NZEC)"
+        elif await run_blocking(outputs_match, stdout, test_case["expected_output"]):
+            status = "Accepted"
+        else:
+            status = "Wrong Answer"
+
+        error = None
+        if status != "Accepted":
+            error = f"Test {index+1}: {status} - {stderr.strip()}" if stderr.strip() else f"Test {index+1}: {status}"
+
+        return {
+            "test": index + 1,
+            "passed": status == "Accepted",
+            "status": status,
+            "runtime": runtime_ms,
+            "error": error
+        }
+
+    async def collect(self, worker: asyncio.subprocess.Process):
+        """Drain a worker's output within the wall-clock limit"""
+        stdout, stderr, _ = await asyncio.wait_for(asyncio.gather(
+            read_capped(worker.stdout, LOCAL_OUTPUT_LIMIT),
+            read_capped(worker.stderr, LOCAL_OUTPUT_LIMIT),
+            worker.wait()
+        ), timeout=LOCAL_WALL_TIMEOUT)
+        return stdout, stderr
+
+    async def run(self, code: str, test_cases: list, on_result=None, stop_on_failure: bool = False) -> dict:
+        """Run every test case concurrently across the worker pool
+
+        Tests claim workers in order. With stop_on_failure, tests still
+        running or waiting for a worker are cancelled once one fails.
+        """
+        verdicts = {}
+        errors = {}
+
+        async def run_one(index: int, test_case: dict):
+            verdict = await self.run_test(index, code, test_case)
+            verdicts[index] = verdict
+            if verdict["error"]:
+                errors[index] = verdict["error"]
+            if on_result:
+                await on_result(verdict)
+
+        tasks = [asyncio.create_task(run_one(i, test_case)) for i, test_case in enumerate(test_cases)]
+        try:
+            if stop_on_failure:
+                for finished in asyncio.as_completed(tasks):
+                    await finished
+                    if errors:
+                        break
+            else:
+                await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return summarize_verdicts(verdicts, errors, len(test_cases))
+
+async def read_capped(stream: asyncio.StreamReader, limit: int) -> str:
+    """Read a stream to EOF, keeping at most limit bytes"""
+    chunks: List[bytes] = []
+    kept = 0
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        if kept < limit:
+            chunks.append(chunk[:limit - kept])
+            kept += len(chunks[-1])
+    return b"".join(chunks).decode("utf-8", errors="replace")
+
+def kill_process_group(process: asyncio.subprocess.Process):
+    """Kill a sandbox worker and anything it spawned"""
+    if process.returncode is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def create_judge0_client() -> httpx.AsyncClient:
+    """Create a pooled keep-alive client for the Judge0 host"""
+    http2 = JUDGE0_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("judge0_http2_unavailable", reason="h2 not installed")
+            http2 = False
+
+    return httpx.AsyncClient(
+        base_url=JUDGE0_BASE_URL,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=JUDGE0_MAX_CONNECTIONS,
+            max_keepalive_connections=JUDGE0_MAX_KEEPALIVE,
+            keepalive_expiry=JUDGE0_KEEPALIVE_EXPIRY
+        ),
+        headers={
+            "X-RapidAPI-Key": JUDGE0_API_KEY or "",
+            "X-RapidAPI-Host": JUDGE0_API_HOST,
+            "Content-Type": "application/json"
+        },
+        timeout=httpx.Timeout(10.0, connect=5.0)
+    )
+
+def parse_judge0_result(index: int, result: dict) -> dict:
+    """Turn a finished Judge0 submission into a per-test verdict"""
+    status = result.get("status") or {}
+    status_id = status.get("id")
+    status_desc = status.get("description", "Unknown error")
+    runtime_ms = int(float(result.get("time") or 0) * 1000)
+
+    # Status: 3=Accepted, 4=Wrong Answer, 5=Time Limit Exceeded, 6=Compilation Error, etc.
+    error = None
+    if status_id != 3:
+        stderr = decode_b64(result.get("stderr"))
+        compile_output = decode_b64(result.get("compile_output"))
+        if stderr:
+            error = f"Test {index+1}: {status_desc} - {stderr}"
+        elif compile_output:
+            error = f"Test {index+1}: {compile_output}"
+        else:
+            error = f"Test {index+1}: {status_desc}"
+
+    return {
+        "test": index + 1,
+        "passed": status_id == 3,
+        "status": status_desc,
+        "runtime": runtime_ms,
+        "error": error
+    }
+
+def fake_passed_count(code: str, total_tests: int) -> int:
+    """How many of total_tests a fake run passes, from a guess at the code's quality"""
+    # Simple heuristic for fake results based on code quality
+    code_length = len(code.strip())
+    has_return = "return" in code
+    has_loop = any(keyword in code for keyword in ["for", "while"])
+    has_function = "def " in code
+
+    # Scoring based on code characteristics
+    score = 0
+    if code_length > 50: score += 1
+    if has_return: score += 2
+    if has_loop: score += 1
+    if has_function: score += 1
+    if code_length > 100: score += 1
+
+    # Add some randomness
+    random_factor = random.random()
+
+    if score >= 4 and random_factor > 0.2:
+        return total_tests  # All tests pass
+    if score >= 3 and random_factor > 0.3:
+        fraction = random.uniform(0.6, 0.8)
+    elif score >= 2:
+        fraction = random.uniform(0.2, 0.6)
+    else:
+        fraction = random.uniform(0.0, 0.4)
+    return int(fraction * total_tests)
+
+EXECUTORS = {
+    "judge0": Judge0Executor,
+    "local": LocalExecutor,
+    "fake": FakeExecutor
+}
+
+def create_executor(name: str = EXECUTOR_BACKEND) -> Executor:
+    """Instantiate the executor backend selected by EXECUTOR_BACKEND"""
+    if name not in EXECUTORS:
+        raise ValueError(f"Unknown executor backend '{name}' (expected one of {', '.join(EXECUTORS)})")
+    if name == "judge0" and not JUDGE0_API_KEY:
+        raise RuntimeError("EXECUTOR_BACKEND=judge0 requires JUDGE0_API_KEY")
+    return EXECUTORS[name]()
@@ -0,0 +1,209 @@
+import asyncio
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from fastapi import WebSocket
+from log import get_logger
+from metrics import SLOW_CONSUMERS
+from protocol import JSON, JsonProtocol, Message
+
+logger = get_logger("fanout")
+
+# Messages a connection may have queued before it is treated as a slow consumer
+OUTBOX_LIMIT = int(os.getenv("OUTBOX_LIMIT", "256"))
+
+# Close code sent to consumers that cannot keep up (1013 = try again later)
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+def encode_message(event: str, data: dict, compact: Any = None) -> Message:
+    """Wrap an event once so every recipient shares its encodings (see protocol.Message)"""
+    return Message(event, data, compact)
+
+class Outbox:
+    """Bounded outbound queue for one websocket
+
+    push() never waits on the network: messages are queued and written by
+    a short-lived writer task, so one slow client cannot delay a broadcast
+    to everyone else. Messages pushed with a coalesce key replace an
+    older queued message with the same key instead of adding a new one.
+    A client whose queue still exceeds the limit is disconnected. The
+    protocol the client negotiated decides how messages are written.
+
+    With a history the outbox outlives its connection: after detach() it
+    keeps queueing, and attach() continues on a new connection, first
+    resending the sent messages the client reports it did not receive.
+    """
+
+    def __init__(self, websocket: Optional[WebSocket], limit: int = OUTBOX_LIMIT, protocol: JsonProtocol = JSON,
+                 history: int = 0):
+        self.websocket = websocket
+        self.limit = limit
+        self.protocol = protocol
+        self.queue: Deque[Tuple[Optional[str], Optional[Message]]] = deque()
+        self.coalesced: Dict[str, Message] = {}
+        self.writer: Optional[asyncio.Task] = None
+        self.closed = False
+        # Messages written so far, and the most recent of them for replay
+        self.sent = 0
+        self.history: Optional[Deque[Message]] = deque(maxlen=history) if history else None
+        self.sending: Optional[Message] = None
+
+    def push(self, message: Message, coalesce_key: Optional[str] = None) -> bool:
+        """Queue a pre-encoded message; returns False if the client was dropped"""
+        if self.closed:
+            return False
+
+        if coalesce_key is not None:
+            if coalesce_key in self.coalesced:
+                self.coalesced[coalesce_key] = message
+                return True
+            self.coalesced[coalesce_key] = message
+            self.queue.append((coalesce_key, None))
+        else:
+            self.queue.append((None, message))
+
+        if len(self.queue) > self.limit:
+            self.drop()
+            return False
+
+        self.start_writer()
+        return True
+
+    def start_writer(self):
+        if self.writer is None and self.websocket is not None and self.queue:
+            self.writer = asyncio.create_task(self.drain())
+
+    async def drain(self):
+        """Write queued messages in order until the queue is empty"""
+        try:
+            while self.queue and self.websocket is not None:
+                key, message = self.queue.popleft()
+                if key is not None:
+                    message = self.coalesced.pop(key)
+                self.sending = message
+                await self.protocol.send(self.websocket, message)
+                self.sending = None
+                self.sent += 1
+                if self.history is not None:
+                    self.history.append(message)
+        except Exception:
+            if self.history is not None:
+                # Kept for the resumed connection; the receive loop detaches this one
+                self.requeue()
+            else:
+                # The receive loop sees the broken socket and runs disconnect cleanup
+                self.closed = True
+                self.queue.clear()
+                self.coalesced.clear()
+        finally:
+            if self.writer is asyncio.current_task():
+                self.writer = None
+
+    def requeue(self):
+        """Put a message whose write did not finish back at the front"""
+        if self.sending is not None:
+            self.queue.appendleft((None, self.sending))
+            self.sending = None
+
+    def detach(self):
+        """Stop writing to a lost connection but keep queueing for a resume"""
+        self.websocket = None
+        if self.writer is not None:
+            self.writer.cancel()
+            self.writer = None
+        self.requeue()
+
+    def attach(self, websocket: WebSocket, protocol: JsonProtocol, received: int) -> Optional[int]:
+        """Continue on a new connection after the client received `received` messages
+
+        Returns how many sent messages are queued again, or None if they
+        are no longer all in the history (the client must then resync).
+        """
+        if self.websocket is not None:
+            self.detach()
+        missed = self.sent - received
+        if self.history is not None and 0 <= missed <= len(self.history):
+            # Newest first, each to the front, leaves them oldest first
+            self.queue.extendleft((None, self.history.pop()) for _ in range(missed))
+            self.sent = received
+        else:
+            missed = None
+        self.websocket = websocket
+        self.protocol = protocol
+        return missed
+
+    def push_first(self, message: Message):
+        """Queue a message ahead of everything else (e.g. the resume acknowledgement)"""
+        if not self.closed:
+            self.queue.appendleft((None, message))
+            self.start_writer()
+
+    def drop(self):
+        """Disconnect a slow consumer instead of buffering without bound"""
+        SLOW_CONSUMERS.inc()
+        self.close()
+        asyncio.create_task(self.close_socket())
+
+    async def close_socket(self, code: int = SLOW_CONSUMER_CLOSE_CODE, reason: str = ""):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    def close(self):
+        """Discard queued messages and stop writing"""
+        self.closed = True
+        self.queue.clear()
+        self.coalesced.clear()
+        self.sending = None
+        if self.history is not None:
+            self.history.clear()
+        if self.writer is not None:
+            self.writer.cancel()
+            self.writer = None
+
+class Throttle:
+    """Send at most one update per key per interval, always ending on the latest
+
+    The first trigger for a key sends immediately. Triggers during the
+    following interval are folded into one trailing send at its end, which
+    renders whatever state is current by then.
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[None]], interval: float):
+        self.send = send
+        self.interval = interval
+        self.timers: Dict[str, asyncio.Task] = {}
+        self.dirty: Dict[str, bool] = {}
+
+    async def trigger(self, key: str):
+        if key in self.timers:
+            self.dirty[key] = True
+            return
+        self.dirty[key] = False
+        self.timers[key] = asyncio.create_task(self.trailing(key))
+        await self.send(key)
+
+    async def trailing(self, key: str):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                if not self.dirty.get(key):
+                    break
+                self.dirty[key] = False
+                await self.send(key)
+        except Exception as e:
+            logger.error("throttled_send_failed", key=key, error=str(e))
+        finally:
+            if self.timers.get(key) is asyncio.current_task():
+                del self.timers[key]
+                self.dirty.pop(key, None)
+
+    async def flush(self, key: str):
+        """Send a pending update now (e.g. before a final event)"""
+        timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+            if self.dirty.pop(key, False):
+                await self.send(key)
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from fanout import encode_message
+from log import get_logger
+from metrics import FANOUT_RECIPIENTS, FANOUT_SECONDS
+
+logger = get_logger("lobby_feed")
+
+# Seconds to collect lobby changes before pushing updates to subscribers
+LOBBY_LIST_DEBOUNCE = float(os.getenv("LOBBY_LIST_DEBOUNCE", "0.25"))
+
+View = Tuple[str, int]
+
+def diff_pages(old: dict, new: dict) -> dict:
+    """Compact difference between two renders of the same lobby list page
+
+    Applying it is idempotent: upsert "added", drop "removed" ids, patch
+    "updated" fields, then order by "order".
+    """
+    old_lobbies = {lobby["id"]: lobby for lobby in old["lobbies"]}
+    new_lobbies = {lobby["id"]: lobby for lobby in new["lobbies"]}
+
+    updated = []
+    for lobby_id, lobby in new_lobbies.items():
+        previous = old_lobbies.get(lobby_id)
+        if previous is None:
+            continue
+        changes = {key: value for key, value in lobby.items() if previous.get(key) != value}
+        if changes:
+            updated.append({"id": lobby_id, **changes})
+
+    return {
+        "added": [lobby for lobby_id, lobby in new_lobbies.items() if lobby_id not in old_lobbies],
+        "removed": [lobby_id for lobby_id in old_lobbies if lobby_id not in new_lobbies],
+        "updated": updated,
+        "order": list(new_lobbies),
+        "pagination": new["pagination"],
+        "search": new["search"]
+    }
+
+class LobbyListFeed:
+    """Lobby list subscriptions with debounced per-view updates
+
+    Requesting a lobby list subscribes the client to that page/search view.
+    Lobby changes only mark the feed dirty; after the debounce window each
+    view with subscribers is rendered once, compared with what was last
+    sent, and pushed only if it changed: as a full lobby_list_update, or
+    as a lobby_list_delta for clients that asked for deltas. Clients in a
+    lobby are unsubscribed and get nothing.
+    """
+
+    def __init__(self, render: Callable[[str, int], dict], push: Callable[[str, str, Optional[str]], None],
+                 window: float = LOBBY_LIST_DEBOUNCE):
+        self.render = render
+        self.push = push
+        self.window = window
+        self.subscriptions: Dict[str, Tuple[View, bool]] = {}
+        self.views: Dict[View, Set[str]] = {}
+        self.snapshots: Dict[View, dict] = {}
+        self.flush_task: Optional[asyncio.Task] = None
+
+    def subscribe(self, client_id: str, search: str, page: int, deltas: bool, snapshot: dict):
+        """Follow a view; snapshot is the page the client was just sent"""
+        self.unsubscribe(client_id)
+        view = (search, page)
+        self.subscriptions[client_id] = (view, deltas)
+        if view not in self.views:
+            self.views[view] = set()
+            self.snapshots[view] = snapshot
+        self.views[view].add(client_id)
+
+    def unsubscribe(self, client_id: str):
+        subscription = self.subscriptions.pop(client_id, None)
+        if subscription is None:
+            return
+        view = subscription[0]
+        self.views[view].discard(client_id)
+        if not self.views[view]:
+            del self.views[view]
+            del self.snapshots[view]
+
+    def mark_changed(self):
+        """Schedule a flush at the end of the current debounce window"""
+        if self.flush_task is None and self.views:
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self.flush_task = None
+        try:
+            started = time.perf_counter()
+            sent = self.flush()
+            FANOUT_SECONDS.labels("lobby_list").observe(time.perf_counter() - started)
+            FANOUT_RECIPIENTS.labels("lobby_list").observe(sent)
+        except Exception as e:
+            logger.error("lobby_list_update_failed", error=str(e))
+
+    def flush(self) -> int:
+        """Push changed views to their subscribers; returns messages queued"""
+        sent = 0
+        for view, client_ids in list(self.views.items()):
+            current = self.render(*view)
+            previous = self.snapshots[view]
+            if current == previous:
+                continue
+            self.snapshots[view] = current
+
+            # Encode each format at most once per view
+            full_message = delta_message = None
+            for client_id in list(client_ids):
+                if self.subscriptions[client_id][1]:
+                    if delta_message is None:
+                        delta_message = encode_message("lobby_list_delta", diff_pages(previous, current))
+                    self.push(client_id, delta_message, None)
+                else:
+                    if full_message is None:
+                        full_message = encode_message("lobby_list_update", current)
+                    # A backed-up client only needs the newest full list
+                    self.push(client_id, full_message, "lobby_list_update")
+                sent += 1
+        return sent
@@ -0,0 +1,120 @@
+import bisect
+import heapq
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Set, Tuple
+
+from models import Lobby
+
+GRAM = 3
+
+def name_grams(name: str) -> Set[str]:
+    """Lowercased substrings of one to GRAM characters of a lobby name"""
+    name = name.lower()
+    return {name[i:i + size] for size in range(1, GRAM + 1) for i in range(len(name) - size + 1)}
+
+def query_grams(query: str) -> Set[str]:
+    """Trigrams of a lowercased query longer than GRAM"""
+    return {query[i:i + GRAM] for i in range(len(query) - GRAM + 1)}
+
+class LobbyRegistry(MutableMapping):
+    """Lobby id -> Lobby, with indexes for the public lobby list
+
+    Public lobbies in "waiting" status are kept in a list ordered by
+    (createdAt, id), so an unfiltered page is a slice of the list. Every
+    substring of one to three characters of their names is indexed too:
+    a query that short is answered by its own postings, and a longer one
+    only looks at lobbies that contain every trigram of the query. Lobbies are indexed when
+    stored and unindexed when deleted; call refresh() after changing a
+    lobby's status or type so it joins or leaves the list.
+    """
+
+    def __init__(self):
+        self._lobbies: Dict[str, Lobby] = {}
+        self._order: List[Tuple[float, str]] = []
+        self._listed: Dict[str, Tuple[float, str]] = {}
+        self._names: Dict[str, str] = {}
+        self._grams: Dict[str, Set[str]] = {}
+
+    def __getitem__(self, lobby_id: str) -> Lobby:
+        return self._lobbies[lobby_id]
+
+    def __setitem__(self, lobby_id: str, lobby: Lobby):
+        if lobby_id in self._lobbies:
+            self._unlist(lobby_id)
+        self._lobbies[lobby_id] = lobby
+        self.refresh(lobby_id)
+
+    def __delitem__(self, lobby_id: str):
+        self._unlist(lobby_id)
+        del self._lobbies[lobby_id]
+
+    def __contains__(self, lobby_id) -> bool:
+        return lobby_id in self._lobbies
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._lobbies)
+
+    def __len__(self) -> int:
+        return len(self._lobbies)
+
+    def refresh(self, lobby_id: str):
+        """Re-evaluate whether a lobby belongs in the public list"""
+        lobby = self._lobbies.get(lobby_id)
+        listed = lobby is not None and lobby.type == "public" and lobby.status == "waiting"
+        if listed and lobby_id not in self._listed:
+            self._list(lobby)
+        elif not listed and lobby_id in self._listed:
+            self._unlist(lobby_id)
+
+    def _list(self, lobby: Lobby):
+        key = (lobby.created_at, lobby.id)
+        bisect.insort(self._order, key)
+        self._listed[lobby.id] = key
+        self._names[lobby.id] = lobby.name.lower()
+        for gram in name_grams(lobby.name):
+            self._grams.setdefault(gram, set()).add(lobby.id)
+
+    def _unlist(self, lobby_id: str):
+        key = self._listed.pop(lobby_id, None)
+        if key is None:
+            return
+        index = bisect.bisect_left(self._order, key)
+        del self._order[index]
+        for gram in name_grams(self._names.pop(lobby_id)):
+            ids = self._grams[gram]
+            ids.discard(lobby_id)
+            if not ids:
+                del self._grams[gram]
+
+    def listed_count(self) -> int:
+        return len(self._order)
+
+    def public_page(self, search: str, page: int, per_page: int) -> Tuple[int, int, List[Lobby]]:
+        """Return (total, clamped page, lobbies) for a newest-first page of the public list"""
+        if not search:
+            total = len(self._order)
+            page = max(1, min(page, max(1, (total + per_page - 1) // per_page)))
+            end = total - (page - 1) * per_page
+            keys = self._order[max(0, end - per_page):end]
+            return total, page, [self._lobbies[lobby_id] for _, lobby_id in reversed(keys)]
+
+        matches = self._search(search.lower())
+        total = len(matches)
+        page = max(1, min(page, max(1, (total + per_page - 1) // per_page)))
+        start = (page - 1) * per_page
+        # Only order as many matches as the requested page needs
+        newest = heapq.nlargest(start + per_page, matches)
+        return total, page, [self._lobbies[lobby_id] for _, lobby_id in newest[start:]]
+
+    def _search(self, query: str) -> List[Tuple[float, str]]:
+        """Listed lobbies whose name contains query, as (createdAt, id) keys"""
+        if len(query) <= GRAM:
+            # Every substring this short is indexed, so its postings are exact
+            return [self._listed[lobby_id] for lobby_id in self._grams.get(query, ())]
+
+        postings = sorted((self._grams.get(gram, set()) for gram in query_grams(query)), key=len)
+        candidates = postings[0].intersection(*postings[1:])
+
+        # Trigrams can match out of order, so confirm the substring
+        names = self._names
+        return [self._listed[lobby_id] for lobby_id in candidates if query in names[lobby_id]]
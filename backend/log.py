@@ -0,0 +1,124 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+from dotenv import load_dotenv
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+    import json
+
+# Load environment variables
+load_dotenv()
+
+# Minimum level written, and "json" (one object per line) or "text" output
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+
+# Records waiting for the writer thread before new ones are discarded
+LOG_QUEUE_LIMIT = int(os.getenv("LOG_QUEUE_LIMIT", "10000"))
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage()
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if orjson is not None:
+            return orjson.dumps(entry, default=str).decode("utf-8")
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(f"{key}={value}" for key, value in getattr(record, "fields", {}).items())
+        stamp = time.strftime("%H:%M:%S", time.localtime(record.created))
+        line = f"{stamp} {record.levelname:<7} {record.getMessage()} {fields}".rstrip()
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records rather than block when the writer falls behind"""
+
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The writer thread formats; only make the record safe to hand over
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class Logger:
+    """Structured logger: an event name plus key/value fields
+
+    Records are queued to a writer thread, so logging from a handler never
+    waits on stdout.
+    """
+
+    def __init__(self, name: str):
+        self.logger = logging.getLogger(name)
+
+    def log(self, level: int, event: str, fields: dict, exc_info=None):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, extra={"fields": fields}, exc_info=exc_info)
+
+    def debug(self, event: str, **fields):
+        self.log(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields):
+        self.log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields):
+        self.log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields):
+        self.log(logging.ERROR, event, fields)
+
+    def exception(self, event: str, **fields):
+        self.log(logging.ERROR, event, fields, exc_info=True)
+
+_listener = None
+
+def configure_logging():
+    """Send the "shibacoder" loggers through a queue to a stdout writer thread"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+    records = queue.Queue(maxsize=LOG_QUEUE_LIMIT)
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger("shibacoder")
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(DroppingQueueHandler(records))
+    root.propagate = False
+
+def get_logger(name: str) -> Logger:
+    configure_logging()
+    return Logger(f"shibacoder.{name}")
@@ -1,25 +1,44 @@
-import json
 import random
 import time
 import os
-import httpx
 import asyncio
-import base64
-from typing import Dict, Set
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import uuid
+from typing import Dict, Optional, Set
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
+from executors import create_executor
+from result_cache import CachedExecutor
+from admission import AdmissionQueue, Overloaded
+from rate_limit import RateLimiter
+from problem_bank import ProblemBank
+from offload import shutdown_pool
+from client_tasks import ClientTasks
+from code_sync import CODE_SYNC_INTERVAL, CodeBuffer, DeltaError
+from fanout import Outbox, Throttle, encode_message
+from lobby_registry import LobbyRegistry
+from lobby_feed import LobbyListFeed
+from spectators import (SPECTATOR_COALESCE, SPECTATOR_EVENTS, SPECTATOR_LIMIT, SPECTATOR_PROGRESS_INTERVAL,
+                        SpectatorFeed)
+from state import RemoteSocket, create_state_backend
+from protocol import RELAY, Message, describe as describe_protocol, negotiate
+from models import Lobby, LobbyPlayer, Player
+from matchmaking import Matchmaker, Ticket
+from tournaments import (TOURNAMENT_MATCH_DELAY, TOURNAMENT_MAX_PLAYERS, TOURNAMENT_MIN_PLAYERS,
+                         TOURNAMENT_REGISTRATION_TIMEOUT, TOURNAMENT_STAGGER, TOURNAMENT_UPDATE_INTERVAL,
+                         Match, Tournament)
+from scheduler import Scheduler
+from sessions import SESSION_GRACE_PERIOD, SESSION_REPLAY_LIMIT, Session, SessionStore
+from storage import MatchResult, MatchStore, PlayerResult, create_database
+from ratings import LEADERBOARD_MAX_PAGE_SIZE, LEADERBOARD_PAGE_SIZE, RatingService
+from log import get_logger
+import metrics
 
 # Load environment variables
 load_dotenv()
 
-# Judge0 API Configuration
-JUDGE0_API_KEY = os.getenv("JUDGE0_API_KEY")
-JUDGE0_API_HOST = os.getenv("JUDGE0_API_HOST", "judge0-ce.p.rapidapi.com")
-JUDGE0_BASE_URL = os.getenv("JUDGE0_BASE_URL", "https://judge0-ce.p.rapidapi.com")
-
-# Python language ID for Judge0 (71 = Python 3.8.1)
-PYTHON_LANGUAGE_ID = 71
+logger = get_logger("main")
 
 # Create FastAPI app
 app = FastAPI(title="ShibaCoder API", version="1.0.0")
@@ -35,106 +54,150 @@ app.add_middleware(
 )
 
 # In-memory storage
-lobbies: Dict[str, Dict] = {}
-connections: Dict[str, WebSocket] = {}
-players: Dict[str, Dict] = {}
+lobbies = LobbyRegistry()
+connections: Dict[str, Outbox] = {}
+players: Dict[str, Player] = {}
+# Player name -> client id of the connected player using it (see claim_name)
+player_names: Dict[str, str] = {}
+
+# Code execution backend (Judge0, local sandbox or fake), reusing results of identical
+# submissions; new runs wait their lobby's turn for one of JUDGE_MAX_RUNS slots
+executor = CachedExecutor(create_executor(), admission=AdmissionQueue())
+
+# Per-client token buckets for websocket events
+rate_limiter = RateLimiter()
+
+# Problems and their test suites, loaded once from PROBLEMS_DIR
+problem_bank = ProblemBank.load()
+
+# Shared state between workers (lobbies owned by other workers appear in
+# `lobbies` with their owner's worker id set)
+state = create_state_backend()
+
+# Finished games, written to the database in the background
+match_store = MatchStore(create_database())
+
+# ELO ratings and the leaderboard, saved along with each game
+ratings = RatingService(match_store.database)
+
+# Quick-match queue of players on this worker, paired by ELO
+matchmaker = Matchmaker()
+
+# Bracket tournaments run by this worker
+tournaments: Dict[str, Tournament] = {}
+
+# Timer wheel for countdowns, time limits, idle lobbies and idle connections
+scheduler = Scheduler()
+
+# Resumable sessions of clients connected to this worker
+sessions = SessionStore()
+
+# Samples event loop lag for /metrics while the app runs
+loop_monitor: Optional[asyncio.Task] = None
+
+# Background tasks of clients connected to other workers but playing in our lobbies
+remote_clients: Dict[str, ClientTasks] = {}
 
 def generate_lobby_id() -> str:
     """Generate a unique lobby ID"""
     return f"lobby_{random.randint(100000, 999999)}"
 
+def claim_name(client_id: str, requested: str) -> Optional[str]:
+    """Give a player the name they asked for (or keep theirs, or a generated one)
+
+    Names are not authenticated: ratings and the leaderboard are keyed by
+    name, and whoever plays under a name is rated as it. All this prevents
+    is two connected players using one name at once; None means another
+    connected player holds it. A player who never chose a name plays as a
+    guest under a generated one, which is neither rated nor stored.
+    """
+    player = players[client_id]
+    if requested:
+        name, guest = requested, False
+    elif player.name:
+        name, guest = player.name, player.guest
+    else:
+        name, guest = f"Player{client_id[-8:]}", True
+    holder = player_names.get(name)
+    if holder is not None and holder != client_id and holder in players:
+        return None
+    release_name(client_id)
+    player_names[name] = client_id
+    player.name = name
+    player.guest = guest
+    return name
+
+def release_name(client_id: str):
+    player = players.get(client_id)
+    if player is not None and player.name and player_names.get(player.name) == client_id:
+        del player_names[player.name]
+
 def validate_pin(pin: str) -> bool:
     """Validate 4-digit pin format"""
     return pin.isdigit() and len(pin) == 4
 
-async def broadcast_to_all(event: str, data: dict):
-    """Broadcast event to all connected clients"""
-    if not connections:
-        return
-    
-    message = json.dumps({"event": event, "data": data})
-    disconnected = []
+async def broadcast_to_lobby(lobby_id: str, event: str, data: dict, coalesce_key: Optional[str] = None,
+                             compact: Optional[dict] = None, spectated: Optional[dict] = None):
+    """Broadcast event to all players in a specific lobby and, for SPECTATOR_EVENTS, its spectators
     
-    for client_id, websocket in connections.items():
-        try:
-            await websocket.send_text(message)
-        except:
-            disconnected.append(client_id)
-    
-    # Clean up disconnected clients
-    for client_id in disconnected:
-        if client_id in connections:
-            del connections[client_id]
-        if client_id in players:
-            del players[client_id]
-
-async def broadcast_to_lobby(lobby_id: str, event: str, data: dict):
-    """Broadcast event to all players in a specific lobby"""
+    compact replaces data for compact clients, spectated for spectators
+    (data that carries player code must come with both).
+    """
     if lobby_id not in lobbies:
         return
     
     lobby = lobbies[lobby_id]
-    message = json.dumps({"event": event, "data": data})
+    started = time.perf_counter()
+    message = encode_message(event, data, compact)
     
-    for player in lobby["players"]:
-        player_id = player["id"]
+    for player_id in lobby.players:
         if player_id in connections:
-            try:
-                await connections[player_id].send_text(message)
-            except:
-                pass
+            connections[player_id].push(message, coalesce_key)
+    metrics.FANOUT_SECONDS.labels("lobby").observe(time.perf_counter() - started)
+    metrics.FANOUT_RECIPIENTS.labels("lobby").observe(len(lobby.players))
+    
+    # Spectators are fed after the players, from one shared message
+    if event in SPECTATOR_EVENTS and spectators.count(lobby_id):
+        if spectated is not None:
+            message = encode_message(event, spectated, compact)
+        spectators.publish(lobby_id, message, event if event in SPECTATOR_COALESCE else None)
 
-async def send_to_client(client_id: str, event: str, data: dict):
+async def send_to_client(client_id: str, event: str, data: dict, compact: Optional[dict] = None):
     """Send event to a specific client"""
     if client_id not in connections:
         return
     
-    message = json.dumps({"event": event, "data": data})
-    try:
-        await connections[client_id].send_text(message)
-    except:
-        pass
+    connections[client_id].push(encode_message(event, data, compact))
+
+def compact_variant(lobby: Lobby, data: dict) -> dict:
+    """data for compact protocol clients: lobby views without player code, the problem by reference"""
+    compact = dict(data)
+    if "players" in compact:
+        compact["players"] = lobby.compact_players_view()
+    if "lobbyData" in compact:
+        compact["lobbyData"] = lobby.compact_view()
+    if "problem" in compact:
+        compact["problem"] = lobby.problem_ref
+    return compact
+
+def spectator_variant(lobby: Lobby, data: dict) -> dict:
+    """data for spectators: lobby views without player code"""
+    spectated = dict(data)
+    if "players" in spectated:
+        spectated["players"] = lobby.compact_players_view()
+    if "lobbyData" in spectated:
+        spectated["lobbyData"] = lobby.spectator_view()
+    return spectated
 
 def get_public_lobbies(search: str = "", page: int = 1, per_page: int = 4) -> Dict:
     """Get paginated list of public lobbies with search"""
-    # Filter public lobbies in waiting status
-    public_lobbies = [
-        lobby for lobby in lobbies.values() 
-        if lobby["type"] == "public" and lobby["status"] == "waiting"
-    ]
-    
-    # Apply search filter if provided
-    if search:
-        search_lower = search.lower()
-        public_lobbies = [
-            lobby for lobby in public_lobbies
-            if search_lower in lobby["name"].lower()
-        ]
-    
-    # Sort by creation time (newest first)
-    public_lobbies.sort(key=lambda x: x["createdAt"], reverse=True)
-    
-    # Apply pagination
-    total_lobbies = len(public_lobbies)
+    # Public waiting lobbies come from the registry's index, newest first
+    total_lobbies, page, page_lobbies = lobbies.public_page(search, page, per_page)
     total_pages = max(1, (total_lobbies + per_page - 1) // per_page)
     
-    # Ensure page is valid
-    page = max(1, min(page, total_pages))
-    
-    start_idx = (page - 1) * per_page
-    end_idx = start_idx + per_page
-    page_lobbies = public_lobbies[start_idx:end_idx]
-    
     # Return lobby data without sensitive info
     return {
-        "lobbies": [{
-            "id": lobby["id"],
-            "name": lobby["name"],
-            "playerCount": len(lobby["players"]),
-            "maxPlayers": lobby["maxPlayers"],
-            "status": lobby["status"],
-            "createdAt": lobby["createdAt"]
-        } for lobby in page_lobbies],
+        "lobbies": [lobby.listing() for lobby in page_lobbies],
         "pagination": {
             "currentPage": page,
             "totalPages": total_pages,
@@ -144,268 +207,893 @@ def get_public_lobbies(search: str = "", page: int = 1, per_page: int = 4) -> Di
         "search": search
     }
 
-async def broadcast_lobby_list_update():
-    """Broadcast updated lobby list to all connected clients"""
-    try:
-        lobby_data = get_public_lobbies(search="", page=1)
-        await broadcast_to_all("lobby_list_update", lobby_data)
-        print(f"Broadcasted lobby list update: {len(lobby_data['lobbies'])} lobbies")
-    except Exception as e:
-        print(f"Failed to broadcast lobby list update: {e}")
-
-# Judge0 functions (same as before)
-async def judge0_submit_code(code: str, test_cases: list) -> dict:
-    """Submit code to Judge0 API and return test results"""
-    if not JUDGE0_API_KEY:
-        print("Warning: Judge0 API key not configured, using fake results")
-        return run_fake_tests(code)
-    
-    headers = {
-        "X-RapidAPI-Key": JUDGE0_API_KEY,
-        "X-RapidAPI-Host": JUDGE0_API_HOST,
-        "Content-Type": "application/json"
-    }
+def push_to_client(client_id: str, message: Message, coalesce_key: Optional[str] = None):
+    """Queue an already-encoded message for a client"""
+    if client_id in connections:
+        connections[client_id].push(message, coalesce_key)
+
+# Lobby list subscriptions (a client follows the page/search it last requested)
+lobby_feed = LobbyListFeed(
+    render=lambda search, page: get_public_lobbies(search=search, page=page),
+    push=push_to_client
+)
+
+# Clients watching a lobby they do not play in
+spectators = SpectatorFeed(push=push_to_client)
+
+def close_spectators(lobby_id: str, reason: str):
+    """Tell a closing lobby's spectators why and end their subscriptions"""
+    if spectators.count(lobby_id):
+        spectators.close(lobby_id, encode_message("lobby_closed", {"reason": reason}))
+
+async def broadcast_lobby_list_update(lobby_id: Optional[str] = None):
+    """Schedule a debounced lobby list update for subscribed clients
+    
+    With a shared state backend the lobby's summary is also published so
+    other workers can list it and route its players here.
+    """
+    lobby_feed.mark_changed()
+    if state.shared and lobby_id:
+        await publish_lobby(lobby_id)
+
+# Multi-worker routing
+async def publish_lobby(lobby_id: str):
+    """Share the current state of one of our lobbies (or its deletion)"""
+    if lobby_id in lobbies:
+        summary = lobbies[lobby_id].summary(state.worker_id)
+        await state.save_lobby(summary)
+        await state.broadcast({"type": "lobby", "lobby": summary})
+    else:
+        await state.delete_lobby(lobby_id)
+        await state.broadcast({"type": "lobby_deleted", "lobby_id": lobby_id})
+
+def remote_owner(client_id: str, event: str, payload: dict) -> Optional[str]:
+    """Worker owning the lobby an event is aimed at, if that is not us"""
+    if event == "join_lobby" and not players[client_id].lobby:
+        lobby_id = payload.get("lobbyId")
+        lobby_id = lobby_id.strip() if isinstance(lobby_id, str) else None
+    elif event in ("leave_lobby", "player_ready", "submit_code", "code_delta"):
+        lobby_id = players[client_id].lobby
+    else:
+        return None
     
-    passed_tests = 0
-    total_tests = len(test_cases)
-    errors = []
+    lobby = lobbies.get(lobby_id) if lobby_id else None
+    return lobby.owner if lobby else None
+
+async def forward_event(owner: str, client_id: str, event: str, payload: dict):
+    """Hand a client's event to the worker that owns its lobby"""
+    player = players[client_id]
+    await state.send_to_worker(owner, {
+        "type": "event",
+        "client_id": client_id,
+        "event": event,
+        "payload": payload,
+        "name": player.name,
+        "lobby": player.lobby
+    })
+
+async def handle_remote_event(origin: str, message: dict):
+    """Run an event for a client connected to another worker"""
+    client_id = message["client_id"]
+    if client_id not in remote_clients:
+        connections[client_id] = Outbox(RemoteSocket(state, origin, client_id), protocol=RELAY)
+        players[client_id] = Player(client_id, message["name"], message["lobby"], time.time())
+        remote_clients[client_id] = ClientTasks(client_id)
     
-    async with httpx.AsyncClient() as client:
-        try:
-            for i, test_case in enumerate(test_cases):
-                # Prepare the submission
-                submission_data = {
-                    "language_id": PYTHON_LANGUAGE_ID,
-                    "source_code": code,
-                    "stdin": test_case["input"],
-                    "expected_output": test_case["expected_output"]
-                }
-                
-                # Submit code
-                submit_response = await client.post(
-                    f"{JUDGE0_BASE_URL}/submissions",
-                    json=submission_data,
-                    headers=headers,
-                    timeout=30.0
-                )
-                
-                if submit_response.status_code != 201:
-                    errors.append(f"Test {i+1}: Submission failed")
-                    continue
-                
-                submission_token = submit_response.json()["token"]
-                
-                # Poll for results
-                max_polls = 10
-                for poll in range(max_polls):
-                    await asyncio.sleep(1)  # Wait 1 second between polls
-                    
-                    result_response = await client.get(
-                        f"{JUDGE0_BASE_URL}/submissions/{submission_token}",
-                        headers=headers,
-                        timeout=10.0
-                    )
-                    
-                    if result_response.status_code != 200:
-                        continue
-                    
-                    result = result_response.json()
-                    status_id = result.get("status", {}).get("id")
-                    
-                    # Status: 1=In Queue, 2=Processing, 3=Accepted, 4=Wrong Answer, 5=Time Limit Exceeded, 6=Compilation Error, etc.
-                    if status_id in [1, 2]:  # Still processing
-                        continue
-                    elif status_id == 3:  # Accepted
-                        passed_tests += 1
-                        break
-                    else:  # Error
-                        status_desc = result.get("status", {}).get("description", "Unknown error")
-                        if result.get("stderr"):
-                            errors.append(f"Test {i+1}: {status_desc} - {result['stderr']}")
-                        elif result.get("compile_output"):
-                            errors.append(f"Test {i+1}: {result['compile_output']}")
-                        else:
-                            errors.append(f"Test {i+1}: {status_desc}")
-                        break
-                else:
-                    errors.append(f"Test {i+1}: Timeout waiting for result")
-                    
-        except Exception as e:
-            print(f"Judge0 API error: {e}")
-            errors.append(f"API Error: {str(e)}")
+    player = players[client_id]
+    lobby_before = player.lobby
+    await dispatch_event(client_id, message["event"], message["payload"], remote_clients[client_id])
+    
+    # Tell the client's worker where its events should go from now on
+    if player.lobby != lobby_before:
+        await state.send_to_worker(origin, {
+            "type": "player",
+            "client_id": client_id,
+            "name": player.name,
+            "lobby": player.lobby
+        })
+    if not player.lobby:
+        asyncio.create_task(release_remote_client(client_id))
+
+async def release_remote_client(client_id: str):
+    """Forget a remote client once it is no longer in one of our lobbies"""
+    outbox = connections.get(client_id)
+    if outbox is not None and outbox.writer is not None:
+        # Let queued replies (errors, lobby_left) reach the client first
+        await asyncio.wait([outbox.writer])
+    if client_id in remote_clients and not players[client_id].lobby:
+        remote_clients.pop(client_id).cancel_all()
+        release_name(client_id)
+        del players[client_id]
+        connections.pop(client_id).close()
+
+async def handle_remote_disconnect(client_id: str):
+    """A client playing in one of our lobbies disconnected from its worker"""
+    if client_id in remote_clients:
+        remote_clients.pop(client_id).cancel_all()
+        await handle_disconnect(client_id)
+
+async def forget_worker(worker_id: str):
+    """Forget the lobbies and clients of a worker that shut down"""
+    for client_id in [client_id for client_id in remote_clients
+                      if connections[client_id].websocket.worker_id == worker_id]:
+        await handle_remote_disconnect(client_id)
+    
+    gone = {lobby_id for lobby_id, lobby in lobbies.items() if lobby.owner == worker_id}
+    for lobby_id in gone:
+        del lobbies[lobby_id]
+    for player in players.values():
+        if player.lobby in gone:
+            player.lobby = None
+            push_to_client(player.id, encode_message("error", {"message": "Lobby is no longer available"}))
+    if gone:
+        lobby_feed.mark_changed()
+
+async def handle_worker_message(message: dict):
+    """Handle a message from another worker"""
+    kind = message["type"]
+    origin = message["origin"]
+    
+    if kind == "deliver":
+        push_to_client(message["client_id"], encode_message(message["event"], message["data"], message["compact"]))
+        
+    elif kind == "event":
+        await handle_remote_event(origin, message)
+        
+    elif kind == "player":
+        client_id = message["client_id"]
+        if client_id in players:
+            # Checked by the client's own worker; recorded here so local players cannot take it
+            release_name(client_id)
+            players[client_id].name = message["name"]
+            if message["name"] and message["name"] not in player_names:
+                player_names[message["name"]] = client_id
+            players[client_id].lobby = message["lobby"]
+            if message["lobby"]:
+                lobby_feed.unsubscribe(client_id)
+                spectators.remove(client_id)
+        
+    elif kind == "disconnect":
+        await handle_remote_disconnect(message["client_id"])
+        
+    elif kind == "drop":
+        if message["client_id"] in connections:
+            connections[message["client_id"]].drop()
+        
+    elif kind == "lobby":
+        summary = message["lobby"]
+        existing = lobbies.get(summary["id"])
+        if existing is None or existing.owner:
+            lobbies[summary["id"]] = Lobby.from_summary(summary)
+            lobby_feed.mark_changed()
+        
+    elif kind == "lobby_deleted":
+        existing = lobbies.get(message["lobby_id"])
+        if existing is not None and existing.owner == origin:
+            del lobbies[message["lobby_id"]]
+            lobby_feed.mark_changed()
+        
+    elif kind == "worker_stopped":
+        # Sent by the worker itself, or on its behalf once its liveness key expired
+        await forget_worker(message.get("worker", origin))
+
+# Code execution
+async def judge0_submit_code(code: str, test_cases: list, on_result=None, language: str = "python",
+                             version: Optional[str] = None, stop_on_failure: bool = False,
+                             group: Optional[str] = None) -> dict:
+    """Run code against the test cases on the configured executor backend
     
+    If on_result is given it is awaited with each per-test verdict as soon
+    as it is known, so callers can stream progress to the player. With
+    stop_on_failure, tests after the first failure may be skipped. Identical
+    submissions are answered from the result cache; version identifies
+    the test set (hashed from test_cases when omitted). Runs are admitted
+    fairly between groups (lobbies); raises Overloaded when too many are
+    already waiting.
+    """
+    return await executor.run(code, test_cases, on_result=on_result, stop_on_failure=stop_on_failure,
+                              language=language, version=version, group=group)
+
+# Seconds between progress_update broadcasts to a lobby
+PROGRESS_UPDATE_INTERVAL = float(os.getenv("PROGRESS_UPDATE_INTERVAL", "0.5"))
+
+def progress_data(lobby: Lobby) -> dict:
     return {
-        "passed": passed_tests,
-        "total": total_tests,
-        "completed": passed_tests == total_tests,
-        "runtime": random.randint(50, 300),  # Judge0 provides actual runtime
-        "errors": errors
+        "players": [{
+            "name": p.name,
+            "tests_passed": p.tests_passed or 0,
+            "total_tests": p.total_tests or 5,
+            "completed": p.completed or False
+        } for p in lobby.players.values()]
     }
 
-def get_two_sum_test_cases():
-    """Return test cases for the Two Sum problem"""
-    return [
-        {
-            "input": "[2,7,11,15]\n9",
-            "expected_output": "[0, 1]"
-        },
-        {
-            "input": "[3,2,4]\n6",
-            "expected_output": "[1, 2]"
-        },
-        {
-            "input": "[3,3]\n6",
-            "expected_output": "[0, 1]"
-        },
-        {
-            "input": "[1,2,3,4,5]\n9",
-            "expected_output": "[3, 4]"
-        },
-        {
-            "input": "[2,5,5,11]\n10",
-            "expected_output": "[1, 2]"
-        }
-    ]
-
-def run_fake_tests(code: str, problem_id: str = "two-sum") -> dict:
-    """Simulate code execution and return fake test results"""
-    # Simulate processing time
-    time.sleep(0.1)
-    
-    # Simple heuristic for fake results based on code quality
-    code_length = len(code.strip())
-    has_return = "return" in code
-    has_loop = any(keyword in code for keyword in ["for", "while"])
-    has_function = "def " in code
-    
-    # Scoring based on code characteristics
-    score = 0
-    if code_length > 50: score += 1
-    if has_return: score += 2
-    if has_loop: score += 1
-    if has_function: score += 1
-    if code_length > 100: score += 1
-    
-    # Add some randomness
-    random_factor = random.random()
-    
-    if score >= 4 and random_factor > 0.2:
-        passed_count = 5  # All tests pass
-    elif score >= 3 and random_factor > 0.3:
-        passed_count = random.randint(3, 4)
-    elif score >= 2:
-        passed_count = random.randint(1, 3)
-    else:
-        passed_count = random.randint(0, 2)
+async def send_progress_update(lobby_id: str):
+    """Broadcast every player's latest submission score to the lobby"""
+    if lobby_id not in lobbies:
+        return
     
-    total_tests = 5
-    passed_count = min(passed_count, total_tests)
+    await broadcast_to_lobby(lobby_id, "progress_update", progress_data(lobbies[lobby_id]),
+                             coalesce_key="progress_update")
+
+async def send_spectator_progress(lobby_id: str):
+    """Send the lobby's spectators the current scores"""
+    if lobby_id not in lobbies:
+        return
     
-    errors = []
-    if passed_count < total_tests:
-        if not has_return:
-            errors.append("Function must return a value")
-        if passed_count == 0:
-            errors.append("No test cases passed")
-        elif passed_count < 3:
-            errors.append(f"Only {passed_count} out of {total_tests} test cases passed")
+    spectators.publish(lobby_id, encode_message("progress_update", progress_data(lobbies[lobby_id])),
+                       "progress_update")
+
+# Bursts of submissions produce one trailing progress_update per interval;
+# spectators are sampled on a slower interval of their own
+progress_updates = Throttle(send_progress_update, PROGRESS_UPDATE_INTERVAL)
+spectator_progress = Throttle(send_spectator_progress, SPECTATOR_PROGRESS_INTERVAL)
+
+async def send_code_update(client_id: str):
+    """Relay a player's editor changes to the rest of the lobby and its spectators"""
+    player = players.get(client_id)
+    lobby = lobbies.get(player.lobby) if player is not None and player.lobby else None
+    seat = lobby.players.get(client_id) if lobby is not None else None
+    if seat is None or seat.draft is None or lobby.status != "playing":
+        return
     
-    return {
-        "passed": passed_count,
-        "total": total_tests,
-        "completed": passed_count == total_tests,
-        "runtime": random.randint(50, 300),  # Fake runtime in ms
-        "errors": errors
+    update = seat.draft.take_update()
+    if update is None:
+        return
+    message = encode_message("code_update", {"playerId": client_id, "playerName": seat.name, **update})
+    for player_id in lobby.players:
+        if player_id != client_id:
+            push_to_client(player_id, message)
+    spectators.publish(lobby.id, message)
+
+# Live edits are relayed at most once per interval per player, batched
+code_updates = Throttle(send_code_update, CODE_SYNC_INTERVAL)
+
+async def resync_code(lobby: Lobby):
+    """Relay every player's whole editor text (for viewers that missed edits)"""
+    if lobby.status != "playing":
+        return
+    for seat in list(lobby.players.values()):
+        if seat.draft is not None:
+            seat.draft.snapshot_due = True
+            await code_updates.trigger(seat.id)
+
+# Seconds counted down once every player is ready
+COUNTDOWN_SECONDS = 3
+
+# Seconds a waiting lobby with no joins or leaves, or a finished lobby, is kept
+LOBBY_IDLE_TIMEOUT = float(os.getenv("LOBBY_IDLE_TIMEOUT", "1800"))
+LOBBY_FINISHED_TIMEOUT = float(os.getenv("LOBBY_FINISHED_TIMEOUT", "300"))
+
+# Connections that send nothing for this long are closed (1001 = going away), unless
+# seated in a lobby or a tournament, whose own timers decide how long they may wait
+CLIENT_IDLE_TIMEOUT = float(os.getenv("CLIENT_IDLE_TIMEOUT", "900"))
+IDLE_CLOSE_CODE = 1001
+# Close reason telling the client its session ended and is not worth resuming
+IDLE_CLOSE_REASON = "idle"
+
+def schedule_reaper(lobby: Lobby, delay: float):
+    """(Re)start the timer that closes a lobby left idle"""
+    if lobby.reaper is not None:
+        lobby.reaper.cancel()
+    lobby.reaper = scheduler.call_later(delay, reap_lobby, lobby.id)
+
+async def reap_lobby(lobby_id: str):
+    """Close an idle waiting lobby or a finished one"""
+    lobby = lobbies.get(lobby_id)
+    if lobby is None or lobby.owner or lobby.status == "playing":
+        return
+    lobby.reaper = None
+    await close_lobby(lobby, "idle")
+
+async def close_lobby(lobby: Lobby, reason: str):
+    """Close a lobby, returning its players to the list"""
+    lobby_id = lobby.id
+    await broadcast_to_lobby(lobby_id, "lobby_closed", {"reason": reason})
+    for player_id in list(lobby.players):
+        player = players.get(player_id)
+        if player is None or player.lobby != lobby_id:
+            continue
+        player.lobby = None
+        if player_id in remote_clients:
+            await state.send_to_worker(connections[player_id].websocket.worker_id, {
+                "type": "player",
+                "client_id": player_id,
+                "name": player.name,
+                "lobby": None
+            })
+            asyncio.create_task(release_remote_client(player_id))
+    
+    close_spectators(lobby_id, reason)
+    lobby.cancel_timers()
+    del lobbies[lobby_id]
+    logger.info("lobby_deleted", lobby_id=lobby_id, reason=reason)
+    await broadcast_lobby_list_update(lobby_id)
+
+async def countdown_step(lobby_id: str, remaining: int):
+    """Broadcast one countdown second, then start the game at zero"""
+    lobby = lobbies.get(lobby_id)
+    if lobby is None or lobby.status != "waiting":
+        return
+    lobby.clock = None
+    
+    # Someone left or the lobby changed during the countdown
+    if not lobby.all_ready():
+        data = {"players": lobby.players_view()}
+        await broadcast_to_lobby(lobby_id, "countdown_cancelled", data, compact=compact_variant(lobby, data),
+                                 spectated=spectator_variant(lobby, data))
+        schedule_reaper(lobby, LOBBY_IDLE_TIMEOUT)
+        return
+    
+    if remaining == 0:
+        await start_game(lobby)
+        return
+    
+    await broadcast_to_lobby(lobby_id, "countdown_update", {
+        "countdown": remaining
+    })
+    lobby.clock = scheduler.call_later(1, countdown_step, lobby_id, remaining - 1)
+
+async def start_game(lobby: Lobby):
+    """Start the game and its time limit"""
+    lobby_id = lobby.id
+    lobby.status = "playing"
+    lobby.started_at = time.time()
+    lobby.rated = [p.name for p in lobby.players.values() if not p.guest]
+    lobbies.refresh(lobby_id)
+    
+    logger.info("game_started", lobby_id=lobby_id)
+    
+    # Pick this match's problem
+    problem = problem_bank.random()
+    game_problem = problem.view
+    
+    lobby.problem = game_problem
+    lobby.problem_ref = problem.reference
+    lobby.changed()
+    
+    # A game nobody finishes ends at the time limit
+    lobby.clock = scheduler.call_later(game_problem["timeLimit"], expire_game, lobby_id)
+    
+    data = {
+        "problem": game_problem,
+        "players": [{
+            "id": p.id,
+            "name": p.name
+        } for p in lobby.players.values()],
+        "timeLimit": game_problem["timeLimit"]
     }
+    # Compact clients get the problem by reference and fetch it only if not cached
+    await broadcast_to_lobby(lobby_id, "game_start", data, compact={**data, "problem": problem.reference})
+    
+    # Broadcast lobby list update since game started (lobby no longer visible in waiting list)
+    await broadcast_lobby_list_update(lobby_id)
+
+async def expire_game(lobby_id: str):
+    """End a game at its time limit; the player with the most passed tests wins, a tie is a draw"""
+    lobby = lobbies.get(lobby_id)
+    if lobby is None or lobby.status != "playing":
+        return
+    lobby.clock = None
+    
+    ranked = sorted(lobby.players.values(), key=lambda p: p.tests_passed or 0, reverse=True)
+    leader = None
+    if ranked and (len(ranked) == 1 or (ranked[0].tests_passed or 0) > (ranked[1].tests_passed or 0)):
+        leader = ranked[0]
+    await finish_game(lobby, leader.id if leader else None, "time_limit")
+
+async def finish_game(lobby: Lobby, winner_id: Optional[str], reason: str):
+    """Mark a game finished, announce the result and queue it for storage"""
+    lobby_id = lobby.id
+    winner = lobby.players[winner_id].name if winner_id in lobby.players else None
+    lobby.status = "finished"
+    lobby.ended_at = time.time()
+    lobbies.refresh(lobby_id)
+    lobby.winner = winner
+    lobby.changed()
+    if lobby.clock is not None:
+        lobby.clock.cancel()
+        lobby.clock = None
+    schedule_reaper(lobby, LOBBY_FINISHED_TIMEOUT)
+    
+    # Deliver any held-back progress before the final result
+    await progress_updates.flush(lobby_id)
+    await spectator_progress.flush(lobby_id)
+    
+    # Calculate final scores
+    final_scores = []
+    for p in lobby.players.values():
+        final_scores.append({
+            "name": p.name,
+            "tests_passed": p.tests_passed or 0,
+            "total_tests": p.total_tests or 5,
+            "completed": p.completed or False,
+            "completion_time": p.last_submission - lobby.started_at if p.completed else None
+        })
+    
+    # Everyone who started the game under a chosen name is rated, including players who left it
+    rated = ratings.record(lobby.rated, winner)
+    guests = {p.name for p in lobby.players.values() if p.guest}
+    
+    await broadcast_to_lobby(lobby_id, "game_finished", {
+        "winner": winner,
+        "winner_id": winner_id if winner else None,
+        "final_scores": final_scores,
+        "ratings": rated,
+        "game_duration": lobby.ended_at - lobby.started_at,
+        "reason": reason
+    })
+    
+    # Queued for the background writer; the database is never awaited here
+    match_store.record(MatchResult(
+        lobby_id=lobby_id,
+        problem_id=lobby.problem.get("id") if lobby.problem else None,
+        winner=winner,
+        started_at=lobby.started_at,
+        ended_at=lobby.ended_at,
+        players=[PlayerResult(
+            score["name"], score["tests_passed"], score["total_tests"],
+            score["completed"], score["completion_time"]
+        ) for score in final_scores if score["name"] not in guests],
+        ratings={name: rating["elo"] for name, rating in rated.items()}
+    ))
+    
+    logger.info("game_finished", lobby_id=lobby_id, winner=winner, reason=reason)
+    
+    # A bracket match sends its winner on to the next round
+    if lobby.tournament:
+        await advance_tournament(lobby, winner_id)
+
+async def check_idle(client_id: str):
+    """Close a connection that has been silent for CLIENT_IDLE_TIMEOUT"""
+    player = players.get(client_id)
+    if player is None or client_id in remote_clients:
+        return
+    idle = time.monotonic() - player.last_seen
+    if idle < CLIENT_IDLE_TIMEOUT:
+        # Active since the timer was set; check again when it could next expire
+        player.idle_timer = scheduler.call_later(CLIENT_IDLE_TIMEOUT - idle, check_idle, client_id)
+        return
+    if player.lobby or still_in_tournament(client_id):
+        # A host waiting for opponents sends nothing; the lobby or bracket decides when it ends
+        player.idle_timer = scheduler.call_later(CLIENT_IDLE_TIMEOUT, check_idle, client_id)
+        return
+    
+    player.idle_timer = None
+    logger.info("client_idle_closed", client_id=client_id, idle=round(idle, 1))
+    if client_id in connections:
+        # Closed outboxes are not resumable, so the session ends with the socket
+        connections[client_id].close()
+        await connections[client_id].close_socket(IDLE_CLOSE_CODE, IDLE_CLOSE_REASON)
+
+# Sessions
+async def open_session(websocket: WebSocket, protocol) -> Session:
+    """Resume the session named in the query string, or start a new one"""
+    session = sessions.find(websocket.query_params.get("session"))
+    if session is not None and not connections[session.client_id].closed:
+        await resume_session(session, websocket, protocol)
+        return session
+    
+    client_id = f"client_{uuid.uuid4().hex[:12]}"
+    connections[client_id] = Outbox(websocket, protocol=protocol, history=SESSION_REPLAY_LIMIT)
+    players[client_id] = Player(client_id, connected_at=time.time(), last_seen=time.monotonic(),
+                                rate_state=rate_limiter.new_state())
+    session = sessions.create(client_id)
+    await send_to_client(client_id, "session", {
+        "token": session.token,
+        "clientId": client_id,
+        "gracePeriod": SESSION_GRACE_PERIOD,
+        "replayLimit": SESSION_REPLAY_LIMIT
+    })
+    logger.info("client_connected", client_id=client_id, protocol=protocol.name)
+    return session
+
+async def resume_session(session: Session, websocket: WebSocket, protocol):
+    """Continue a session on a new connection, replaying the messages the client missed"""
+    client_id = session.client_id
+    if session.expiry is not None:
+        session.expiry.cancel()
+        session.expiry = None
+    
+    outbox = connections[client_id]
+    previous = outbox.websocket
+    try:
+        received = int(websocket.query_params.get("seq", -1))
+    except ValueError:
+        received = -1
+    replayed = outbox.attach(websocket, protocol, received)
+    if previous is not None:
+        # The client came back before its old connection was noticed as dead
+        asyncio.create_task(close_quietly(previous))
+    
+    player = players[client_id]
+    player.last_seen = time.monotonic()
+    data = {"clientId": client_id, "seq": outbox.sent, "replayed": replayed}
+    lobby = lobbies.get(player.lobby) if player.lobby else None
+    if replayed is None and lobby is not None and not lobby.owner:
+        # Too much was missed to replay; send the lobby as it is now
+        data["lobbyData"] = lobby.view()
+        outbox.push_first(encode_message("session_resumed", data, compact_variant(lobby, data)))
+        await resync_code(lobby)
+    else:
+        outbox.push_first(encode_message("session_resumed", data))
+    
+    logger.info("session_resumed", client_id=client_id, protocol=protocol.name, replayed=replayed)
+    if lobby is not None and not lobby.owner:
+        notify_connection(lobby, client_id, True)
+
+async def close_quietly(websocket: WebSocket):
+    try:
+        await websocket.close()
+    except Exception:
+        pass
+
+async def connection_lost(session: Session, websocket: WebSocket):
+    """Hold a dropped client's place for the grace period, or clean up now"""
+    client_id = session.client_id
+    outbox = connections.get(client_id)
+    if outbox is None or outbox.websocket is not websocket:
+        # Already resumed on another connection
+        return
+    
+    if outbox.closed or SESSION_GRACE_PERIOD <= 0:
+        await end_session(client_id)
+        return
+    
+    outbox.detach()
+    player = players[client_id]
+    if player.idle_timer is not None:
+        player.idle_timer.cancel()
+        player.idle_timer = None
+    matchmaker.leave(client_id)
+    session.expiry = scheduler.call_later(SESSION_GRACE_PERIOD, end_session, client_id)
+    
+    lobby = lobbies.get(player.lobby) if player.lobby else None
+    if lobby is not None and not lobby.owner:
+        notify_connection(lobby, client_id, False)
+
+def notify_connection(lobby: Lobby, client_id: str, connected: bool):
+    """Tell the rest of a lobby that a player's connection dropped or came back"""
+    message = encode_message("player_connection", {"playerName": players[client_id].name, "connected": connected})
+    for player_id in lobby.players:
+        if player_id != client_id:
+            push_to_client(player_id, message)
+
+async def end_session(client_id: str):
+    """Forget a session and run disconnect cleanup (grace period over or not resumable)"""
+    session = sessions.remove(client_id)
+    if session is None:
+        return
+    session.tasks.cancel_all()
+    await handle_disconnect(client_id)
+
+@app.on_event("startup")
+async def startup():
+    """Start the executor backend (Judge0 connection pool or sandbox workers)"""
+    logger.info("executor_started", executor=executor.name, problems=len(problem_bank))
+    await executor.start()
+    
+    logger.info("state_backend_started", backend=state.name, worker_id=state.worker_id)
+    await state.start(handle_worker_message)
+    for summary in await state.load_lobbies():
+        lobbies[summary["id"]] = Lobby.from_summary(summary)
+    
+    await matchmaker.start(start_match)
+    await scheduler.start()
+    
+    logger.info("storage_started", backend=match_store.name)
+    await match_store.start()
+    await ratings.load()
+    
+    global loop_monitor
+    loop_monitor = asyncio.create_task(metrics.monitor_loop_lag())
+    
+    # Sizes exported by /metrics, read only when scraped
+    metrics.OPEN_CONNECTIONS.set_function(lambda: len(connections))
+    metrics.SPECTATORS.set_function(lambda: len(spectators))
+    metrics.ACTIVE_LOBBIES.set_function(count_lobbies_by_status)
+    metrics.QUEUE_DEPTH.set_function(lambda: {
+        ("outbox",): sum(len(outbox.queue) for outbox in connections.values()),
+        ("storage",): match_store.queue.qsize(),
+        ("matchmaking",): len(matchmaker),
+        ("judge_in_flight",): len(executor.in_flight),
+        ("judge_admission",): executor.admission.queued,
+        ("timers",): len(scheduler),
+        ("detached_sessions",): sessions.detached()
+    })
+    metrics.RESULT_CACHE_REQUESTS.set_function(lambda: {
+        ("hit",): executor.hits,
+        ("deduplicated",): executor.deduplicated,
+        ("miss",): executor.misses
+    })
+    metrics.RESULT_CACHE_HIT_RATIO.set_function(lambda: executor.stats()["hitRatio"])
+
+def count_lobbies_by_status() -> Dict:
+    counts = {("waiting",): 0, ("playing",): 0, ("finished",): 0}
+    for lobby in lobbies.values():
+        counts[(lobby.status,)] = counts.get((lobby.status,), 0) + 1
+    return counts
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop the matchmaker, flush storage, then stop the executor, the state backend and the offload pool"""
+    if loop_monitor is not None:
+        loop_monitor.cancel()
+    await matchmaker.stop()
+    await scheduler.stop()
+    await match_store.stop()
+    if state.shared:
+        for lobby_id in [lobby_id for lobby_id, lobby in lobbies.items() if not lobby.owner]:
+            await state.delete_lobby(lobby_id)
+        await state.broadcast({"type": "worker_stopped"})
+    await state.stop()
+    await executor.stop()
+    shutdown_pool()
 
 @app.get("/")
 def read_root():
     return {"message": "ShibaCoder API"}
 
+@app.get("/stats")
+def read_stats():
+    """Operational counters (the result cache hit ratio tracks saved Judge0 calls)"""
+    return {"resultCache": executor.stats(), "admission": executor.admission.stats(), "storage": match_store.stats(),
+            "ratings": ratings.stats()}
+
+@app.get("/metrics")
+def read_metrics():
+    """Prometheus metrics: handler latency, Judge0 timings, fan-out, queue depths"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/protocol")
+def read_protocol():
+    """Websocket subprotocols and the compact protocol's event ids"""
+    return describe_protocol()
+
+@app.get("/problems/{problem_id}")
+def read_problem(problem_id: str, request: Request):
+    """A problem as sent in game_start, cacheable by its content hash"""
+    problem = problem_bank.get(problem_id)
+    if problem is None:
+        raise HTTPException(status_code=404, detail="Problem not found")
+    
+    etag = f'"{problem.digest}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({**problem.view, "hash": problem.digest}, headers=headers)
+
+@app.get("/tournaments/{tournament_id}")
+def read_tournament(tournament_id: str):
+    """A tournament's bracket, as sent in the "tournament" event"""
+    tournament = tournaments.get(tournament_id)
+    if tournament is None:
+        raise HTTPException(status_code=404, detail="Tournament not found")
+    return tournament.view()
+
+@app.get("/leaderboard")
+def read_leaderboard(offset: int = 0, limit: int = LEADERBOARD_PAGE_SIZE):
+    """A page of the leaderboard, best first, as sent in the "leaderboard" event (names are not authenticated)"""
+    page = leaderboard_page(offset, limit)
+    if page is None:
+        raise HTTPException(status_code=400, detail=f"Offset must be 0 or more and limit 1 to {LEADERBOARD_MAX_PAGE_SIZE}")
+    return page
+
+@app.get("/leaderboard/{player_name}")
+def read_player_rating(player_name: str):
+    """A player's rank and rating"""
+    entry = ratings.entry(player_name)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Player has no rated games")
+    return entry
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """Main WebSocket endpoint for all real-time communication"""
-    await websocket.accept()
-    client_id = f"client_{random.randint(100000, 999999)}"
-    connections[client_id] = websocket
-    players[client_id] = {
-        "id": client_id,
-        "name": None,
-        "lobby": None,
-        "connected_at": time.time()
-    }
+    # JSON text frames unless the client offers the compact subprotocol
+    protocol = negotiate(websocket.scope.get("subprotocols", []))
+    await websocket.accept(subprotocol=protocol.subprotocol)
     
-    print(f"Client {client_id} connected")
+    # A reconnecting client gets its previous client id, lobby seat and missed messages back
+    session = await open_session(websocket, protocol)
+    client_id = session.client_id
+    player = players[client_id]
+    if player.idle_timer is not None:
+        player.idle_timer.cancel()
+    player.idle_timer = scheduler.call_later(CLIENT_IDLE_TIMEOUT, check_idle, client_id)
+    
+    # Slow handlers run as background tasks so this loop keeps reading; they belong
+    # to the session, so a judged submission still reaches a client that reconnects
+    tasks = session.tasks
     
     try:
         while True:
             # Receive message
-            data = await websocket.receive_text()
-            message = json.loads(data)
-            event = message.get("event")
-            payload = message.get("data", {})
+            event, payload = await protocol.receive(websocket)
+            player.last_seen = time.monotonic()
             
-            # Handle different events
-            if event == "get_lobby_list":
-                page = payload.get("page", 1)
-                search = payload.get("search", "")
-                lobby_data = get_public_lobbies(search=search, page=page)
-                await send_to_client(client_id, "lobby_list", lobby_data)
-                
-            elif event == "create_lobby":
-                await handle_create_lobby(client_id, payload)
-                
-            elif event == "join_lobby":
-                await handle_join_lobby(client_id, payload)
-                
-            elif event == "leave_lobby":
-                await handle_leave_lobby(client_id, payload)
-                
-            elif event == "player_ready":
-                await handle_player_ready(client_id, payload)
-                
-            elif event == "submit_code":
-                await handle_submit_code(client_id, payload)
+            # Events over the client's rate limit are refused with a hint when to retry
+            retry_after = rate_limiter.check(player.rate_state, event, player.last_seen)
+            if retry_after:
+                await send_throttled(client_id, event, "rate_limit", retry_after)
+                continue
+            
+            # Events for a lobby on another worker are handled by that worker
+            started = time.perf_counter()
+            owner = remote_owner(client_id, event, payload)
+            if owner:
+                await forward_event(owner, client_id, event, payload)
+            else:
+                await dispatch_event(client_id, event, payload, tasks)
+            metrics.WS_EVENT_SECONDS.labels(event if event in WS_EVENTS else "unknown").observe(
+                time.perf_counter() - started)
                 
     except WebSocketDisconnect:
-        print(f"Client {client_id} disconnected")
-        await handle_disconnect(client_id)
+        logger.info("client_disconnected", client_id=client_id)
+        await connection_lost(session, websocket)
     except Exception as e:
-        print(f"WebSocket error for {client_id}: {e}")
-        await handle_disconnect(client_id)
+        logger.warning("websocket_error", client_id=client_id, error=str(e))
+        await connection_lost(session, websocket)
+
+# Events with their own latency series (anything else is counted as "unknown")
+WS_EVENTS = {
+    "get_lobby_list", "create_lobby", "join_lobby", "queue_join", "queue_leave",
+    "leave_lobby", "player_ready", "submit_code", "get_problem", "spectate_lobby", "stop_spectating",
+    "code_delta", "create_tournament", "join_tournament", "leave_tournament", "start_tournament",
+    "get_tournament", "get_leaderboard"
+}
+
+async def send_throttled(client_id: str, event: str, reason: str, retry_after: float):
+    """Backpressure reply: the event was refused and may be retried after retry_after seconds"""
+    metrics.THROTTLED.labels(event if event in WS_EVENTS else "unknown", reason).inc()
+    await send_to_client(client_id, "throttled", {
+        "event": event,
+        "reason": reason,
+        "retryAfter": retry_after,
+        "message": "Too many requests, please slow down" if reason == "rate_limit"
+                   else "The judge is busy, please try again shortly"
+    })
+
+async def timed_handler(handler: str, func, *args):
+    """Run a background handler, recording its run time"""
+    started = time.perf_counter()
+    try:
+        return await func(*args)
+    finally:
+        metrics.HANDLER_SECONDS.labels(handler).observe(time.perf_counter() - started)
+
+async def dispatch_event(client_id: str, event: str, payload: dict, tasks: ClientTasks):
+    """Handle one client event in a lobby owned by this worker"""
+    if event == "get_lobby_list":
+        page = payload.get("page", 1)
+        search = payload.get("search", "")
+        lobby_data = get_public_lobbies(search=search, page=page)
+        await send_to_client(client_id, "lobby_list", lobby_data)
+        
+        # Follow this view; changes arrive as updates (or deltas if requested)
+        if not players[client_id].lobby:
+            lobby_feed.subscribe(client_id, search, page, bool(payload.get("deltas")), lobby_data)
+        
+    elif event == "create_lobby":
+        await handle_create_lobby(client_id, payload)
+        
+    elif event == "join_lobby":
+        await handle_join_lobby(client_id, payload)
+        
+    elif event == "queue_join":
+        await handle_queue_join(client_id, payload)
+        
+    elif event == "queue_leave":
+        await handle_queue_leave(client_id)
+        
+    elif event == "get_problem":
+        await handle_get_problem(client_id, payload)
+        
+    elif event == "create_tournament":
+        await handle_create_tournament(client_id, payload)
+        
+    elif event == "join_tournament":
+        await handle_join_tournament(client_id, payload)
+        
+    elif event == "leave_tournament":
+        await handle_leave_tournament(client_id)
+        
+    elif event == "start_tournament":
+        await handle_start_tournament(client_id, payload)
+        
+    elif event == "get_tournament":
+        await handle_get_tournament(client_id, payload)
+        
+    elif event == "get_leaderboard":
+        await handle_get_leaderboard(client_id, payload)
+        
+    elif event == "spectate_lobby":
+        await handle_spectate_lobby(client_id, payload)
+        
+    elif event == "stop_spectating":
+        await handle_stop_spectating(client_id)
+        
+    elif event == "leave_lobby":
+        tasks.cancel_all()
+        await handle_leave_lobby(client_id, payload)
+        
+    elif event == "player_ready":
+        if not tasks.spawn("ready", timed_handler("player_ready", handle_player_ready, client_id, payload)):
+            await send_to_client(client_id, "error", {"message": "Ready request already in progress"})
+        
+    elif event == "code_delta":
+        await handle_code_delta(client_id, payload)
+        
+    elif event == "submit_code":
+        # A newer submission replaces one that is still being judged
+        if not tasks.spawn("submit", timed_handler("submit_code", handle_submit_code, client_id, payload),
+                           supersede=True):
+            await send_to_client(client_id, "error", {"message": "Too many requests in progress, please wait"})
+
+async def handle_get_problem(client_id: str, data: dict):
+    """Send a problem a client was given by reference and does not have cached"""
+    problem = problem_bank.get(data.get("id")) if isinstance(data.get("id"), str) else None
+    if problem is None:
+        await send_to_client(client_id, "error", {"message": "Problem not found"})
+        return
+    await send_to_client(client_id, "problem", {**problem.view, "hash": problem.digest})
 
 async def handle_disconnect(client_id: str):
     """Handle client disconnection"""
+    lobby_feed.unsubscribe(client_id)
+    spectators.remove(client_id)
+    matchmaker.leave(client_id)
+    
+    # The owner of a remote lobby removes the player there
+    owner = remote_owner(client_id, "leave_lobby", {}) if client_id in players else None
+    if owner:
+        players[client_id].lobby = None
+        await state.send_to_worker(owner, {"type": "disconnect", "client_id": client_id})
+    
     if client_id in players:
         player = players[client_id]
-        if player["lobby"]:
-            lobby_id = player["lobby"]
+        if player.idle_timer is not None:
+            player.idle_timer.cancel()
+        if player.lobby:
+            lobby_id = player.lobby
             if lobby_id in lobbies:
                 lobby = lobbies[lobby_id]
-                player_name = player["name"]
+                player_name = player.name
                 
                 # Remove player from lobby
-                lobby["players"] = [p for p in lobby["players"] if p["id"] != client_id]
+                lobby.remove_player(client_id)
+                if lobby.status == "waiting":
+                    schedule_reaper(lobby, LOBBY_IDLE_TIMEOUT)
                 
-                print(f"{player_name} disconnected from lobby '{lobby['name']}' ({lobby_id})")
+                logger.info("player_disconnected", player=player_name, lobby_id=lobby_id)
                 
                 # If lobby is empty, delete it
-                if len(lobby["players"]) == 0:
+                if not lobby.players:
+                    close_spectators(lobby_id, "empty")
+                    lobby.cancel_timers()
                     del lobbies[lobby_id]
-                    print(f"Lobby {lobby_id} deleted - no players remaining")
-                    await broadcast_lobby_list_update()
+                    logger.info("lobby_deleted", lobby_id=lobby_id, reason="empty")
+                    await broadcast_lobby_list_update(lobby_id)
                 else:
                     # Notify remaining players
-                    await broadcast_to_lobby(lobby_id, "player_left", {
+                    data = {
                         "playerName": player_name,
-                        "playerCount": len(lobby["players"]),
-                        "players": lobby["players"]
-                    })
+                        "playerCount": len(lobby.players),
+                        "players": lobby.players_view()
+                    }
+                    await broadcast_to_lobby(lobby_id, "player_left", data, compact=compact_variant(lobby, data),
+                                             spectated=spectator_variant(lobby, data))
+                    await broadcast_lobby_list_update(lobby_id)
+                
+                # A bracket match in progress goes to the opponent
+                if lobby.tournament:
+                    await concede_tournament_match(lobby, client_id)
         
+        await leave_tournament(client_id)
+        release_name(client_id)
         del players[client_id]
     
     if client_id in connections:
-        del connections[client_id]
+        connections.pop(client_id).close()
 
 async def handle_create_lobby(client_id: str, data: dict):
     """Handle lobby creation"""
@@ -431,45 +1119,50 @@ async def handle_create_lobby(client_id: str, data: dict):
                 await send_to_client(client_id, "error", {"message": "Pin must be exactly 4 digits"})
                 return
         
+        # Entrants are seated by their tournament
+        if still_in_tournament(client_id):
+            await send_to_client(client_id, "error", {"message": "You are already in a tournament"})
+            return
+        
         # Generate unique lobby ID
         lobby_id = generate_lobby_id()
         while lobby_id in lobbies:
             lobby_id = generate_lobby_id()
         
         # Get player name from request, localStorage, or generate one
-        player_name = data.get("playerName", "").strip()
-        if not player_name:
-            player_name = players[client_id].get("name") or f"Player{client_id[-8:]}"
+        player_name = claim_name(client_id, data.get("playerName", "").strip())
+        if player_name is None:
+            await send_to_client(client_id, "error", {"message": "That name is already in use"})
+            return
         
         # Create lobby
-        lobbies[lobby_id] = {
-            "id": lobby_id,
-            "name": lobby_name,
-            "type": lobby_type,
-            "pin": pin if lobby_type == "private" else None,
-            "status": "waiting",
-            "players": [{
-                "id": client_id,
-                "name": player_name,
-                "ready": False
-            }],
-            "maxPlayers": 2,
-            "createdAt": time.time()
-        }
+        lobby = Lobby(
+            id=lobby_id,
+            name=lobby_name,
+            type=lobby_type,
+            pin=pin if lobby_type == "private" else None,
+            created_at=time.time()
+        )
+        lobby.add_player(LobbyPlayer(client_id, player_name, players[client_id].guest))
+        lobbies[lobby_id] = lobby
+        schedule_reaper(lobby, LOBBY_IDLE_TIMEOUT)
         
         # Update player info
-        players[client_id]["name"] = player_name
-        players[client_id]["lobby"] = lobby_id
+        players[client_id].lobby = lobby_id
+        lobby_feed.unsubscribe(client_id)
+        spectators.remove(client_id)
+        matchmaker.leave(client_id)
         
-        print(f"Lobby '{lobby_name}' ({lobby_id}) created by {player_name}")
+        logger.info("lobby_created", lobby_id=lobby_id, name=lobby_name, player=player_name)
         
-        await send_to_client(client_id, "lobby_created", {
+        data = {
             "lobbyId": lobby_id,
-            "lobbyData": lobbies[lobby_id]
-        })
+            "lobbyData": lobby.view()
+        }
+        await send_to_client(client_id, "lobby_created", data, compact=compact_variant(lobby, data))
         
         # Broadcast lobby list update to all connected clients
-        await broadcast_lobby_list_update()
+        await broadcast_lobby_list_update(lobby_id)
         
     except Exception as e:
         await send_to_client(client_id, "error", {"message": f"Failed to create lobby: {str(e)}"})
@@ -492,108 +1185,611 @@ async def handle_join_lobby(client_id: str, data: dict):
         lobby = lobbies[lobby_id]
         
         # Check if lobby is full
-        if len(lobby["players"]) >= lobby["maxPlayers"]:
+        if lobby.is_full():
             await send_to_client(client_id, "error", {"message": "Lobby is full"})
             return
         
         # Check if game already started
-        if lobby["status"] != "waiting":
+        if lobby.status != "waiting":
             await send_to_client(client_id, "error", {"message": "Game already in progress"})
             return
         
         # Check if player already in a lobby
-        if players[client_id]["lobby"]:
+        if players[client_id].lobby:
             await send_to_client(client_id, "error", {"message": "You are already in a lobby"})
             return
         
+        # Entrants are seated by their tournament
+        if still_in_tournament(client_id):
+            await send_to_client(client_id, "error", {"message": "You are already in a tournament"})
+            return
+        
         # Verify pin for private lobbies
-        if lobby["type"] == "private":
+        if lobby.type == "private":
             if not pin:
                 await send_to_client(client_id, "error", {"message": "Pin is required for private lobbies"})
                 return
-            if pin != lobby["pin"]:
+            if pin != lobby.pin:
                 await send_to_client(client_id, "error", {"message": "Incorrect pin"})
                 return
         
         # Get player name from request or generate one
-        player_name = data.get("playerName", "").strip()
-        if not player_name:
-            player_name = players[client_id].get("name") or f"Player{client_id[-8:]}"
+        player_name = claim_name(client_id, data.get("playerName", "").strip())
+        if player_name is None:
+            await send_to_client(client_id, "error", {"message": "That name is already in use"})
+            return
         
         # Add player to lobby
-        lobby["players"].append({
-            "id": client_id,
-            "name": player_name,
-            "ready": False
-        })
+        lobby.add_player(LobbyPlayer(client_id, player_name, players[client_id].guest))
+        schedule_reaper(lobby, LOBBY_IDLE_TIMEOUT)
         
         # Update player info
-        players[client_id]["name"] = player_name
-        players[client_id]["lobby"] = lobby_id
+        players[client_id].lobby = lobby_id
+        lobby_feed.unsubscribe(client_id)
+        spectators.remove(client_id)
+        matchmaker.leave(client_id)
         
-        print(f"{player_name} joined lobby '{lobby['name']}' ({lobby_id})")
+        logger.info("player_joined", player=player_name, lobby_id=lobby_id)
         
         # Send confirmation to joining player
-        await send_to_client(client_id, "lobby_joined", {
+        data = {
             "lobbyId": lobby_id,
-            "lobbyData": lobby,
-            "playerCount": len(lobby["players"])
-        })
+            "lobbyData": lobby.view(),
+            "playerCount": len(lobby.players)
+        }
+        await send_to_client(client_id, "lobby_joined", data, compact=compact_variant(lobby, data))
         
         # Notify all players in lobby about the new player
-        await broadcast_to_lobby(lobby_id, "player_joined", {
+        data = {
             "playerName": player_name,
-            "playerCount": len(lobby["players"]),
-            "maxPlayers": lobby["maxPlayers"],
-            "players": lobby["players"]
-        })
+            "playerCount": len(lobby.players),
+            "maxPlayers": lobby.max_players,
+            "players": lobby.players_view()
+        }
+        await broadcast_to_lobby(lobby_id, "player_joined", data, compact=compact_variant(lobby, data),
+                                 spectated=spectator_variant(lobby, data))
         
         # Broadcast lobby list update since player count changed
-        await broadcast_lobby_list_update()
+        await broadcast_lobby_list_update(lobby_id)
         
     except Exception as e:
         await send_to_client(client_id, "error", {"message": f"Failed to join lobby: {str(e)}"})
 
+async def handle_spectate_lobby(client_id: str, data: dict):
+    """Handle watching a lobby without playing in it"""
+    try:
+        lobby_id = data.get("lobbyId", "").strip()
+        pin = data.get("pin", "").strip()
+        
+        if not lobby_id:
+            await send_to_client(client_id, "error", {"message": "Lobby ID is required"})
+            return
+        
+        if lobby_id not in lobbies:
+            await send_to_client(client_id, "error", {"message": "Lobby not found"})
+            return
+        
+        lobby = lobbies[lobby_id]
+        
+        if players[client_id].lobby:
+            await send_to_client(client_id, "error", {"message": "You are already in a lobby"})
+            return
+        
+        # Spectators are fed by the worker that runs the lobby
+        if lobby.owner:
+            await send_to_client(client_id, "error", {"message": "Lobby cannot be spectated from this server"})
+            return
+        
+        # Private lobbies can be watched with their pin; quick matches have none
+        # (bracket matches are private only to stay out of the list)
+        if lobby.type == "private" and not lobby.tournament:
+            if not lobby.pin:
+                await send_to_client(client_id, "error", {"message": "Lobby is private"})
+                return
+            if pin != lobby.pin:
+                await send_to_client(client_id, "error", {"message": "Incorrect pin"})
+                return
+        
+        if spectators.lobby_of(client_id) != lobby_id and spectators.count(lobby_id) >= SPECTATOR_LIMIT:
+            await send_to_client(client_id, "error", {"message": "Too many spectators"})
+            return
+        
+        spectators.add(client_id, lobby_id)
+        lobby_feed.unsubscribe(client_id)
+        
+        logger.info("spectator_joined", client_id=client_id, lobby_id=lobby_id, spectators=spectators.count(lobby_id))
+        
+        data = {
+            "lobbyId": lobby_id,
+            "lobbyData": lobby.spectator_view(),
+            "spectators": spectators.count(lobby_id)
+        }
+        await send_to_client(client_id, "spectating", data, compact={**data, "lobbyData": lobby.compact_view()})
+        await resync_code(lobby)
+        
+    except Exception as e:
+        await send_to_client(client_id, "error", {"message": f"Failed to spectate lobby: {str(e)}"})
+
+async def handle_stop_spectating(client_id: str):
+    """Handle leaving a spectated lobby"""
+    lobby_id = spectators.remove(client_id)
+    if lobby_id:
+        await send_to_client(client_id, "spectating_stopped", {"lobbyId": lobby_id})
+    else:
+        await send_to_client(client_id, "error", {"message": "You are not spectating a lobby"})
+
+async def handle_queue_join(client_id: str, data: dict):
+    """Handle joining the quick-match queue"""
+    try:
+        if players[client_id].lobby:
+            await send_to_client(client_id, "error", {"message": "You are already in a lobby"})
+            return
+        
+        if client_id in matchmaker:
+            await send_to_client(client_id, "error", {"message": "You are already in the queue"})
+            return
+        
+        if still_in_tournament(client_id):
+            await send_to_client(client_id, "error", {"message": "You are already in a tournament"})
+            return
+        
+        player_name = claim_name(client_id, data.get("playerName", "").strip())
+        if player_name is None:
+            await send_to_client(client_id, "error", {"message": "That name is already in use"})
+            return
+        
+        # Matched on the server's rating, not one the client claims
+        elo = ratings.rating(player_name)
+        pair = matchmaker.join(client_id, elo)
+        if pair:
+            await start_match(*pair)
+        else:
+            await send_to_client(client_id, "queue_joined", {"elo": elo, "queueSize": len(matchmaker)})
+        
+    except Exception as e:
+        await send_to_client(client_id, "error", {"message": f"Failed to join queue: {str(e)}"})
+
+async def handle_queue_leave(client_id: str):
+    """Handle leaving the quick-match queue"""
+    if matchmaker.leave(client_id):
+        await send_to_client(client_id, "queue_left", {})
+    else:
+        await send_to_client(client_id, "error", {"message": "You are not in the queue"})
+
+async def start_match(first: Ticket, second: Ticket):
+    """Create a lobby for two matched players and seat them both"""
+    lobby_id = generate_lobby_id()
+    while lobby_id in lobbies:
+        lobby_id = generate_lobby_id()
+    
+    # Private without a pin: the lobby stays out of the list and nobody else can join
+    lobby = Lobby(id=lobby_id, name="Quick Match", type="private", created_at=time.time())
+    for ticket in (first, second):
+        player = players[ticket.client_id]
+        player.name = claim_name(ticket.client_id, "") or player.name or f"Player{ticket.client_id[-8:]}"
+        player.lobby = lobby_id
+        lobby.add_player(LobbyPlayer(ticket.client_id, player.name, player.guest))
+        lobby_feed.unsubscribe(ticket.client_id)
+        spectators.remove(ticket.client_id)
+    lobbies[lobby_id] = lobby
+    schedule_reaper(lobby, LOBBY_IDLE_TIMEOUT)
+    
+    logger.info("match_found", lobby_id=lobby_id, first=players[first.client_id].name, first_elo=first.elo,
+                second=players[second.client_id].name, second_elo=second.elo)
+    
+    now = time.monotonic()
+    for ticket, opponent in ((first, second), (second, first)):
+        data = {
+            "lobbyId": lobby_id,
+            "lobbyData": lobby.view(),
+            "playerCount": len(lobby.players),
+            "match": {
+                "opponent": players[opponent.client_id].name,
+                "opponentElo": opponent.elo,
+                "waited": round(now - ticket.joined_at, 3)
+            }
+        }
+        await send_to_client(ticket.client_id, "lobby_joined", data, compact=compact_variant(lobby, data))
+    
+    await broadcast_lobby_list_update(lobby_id)
+
+# Tournaments
+def generate_tournament_id() -> str:
+    """Generate a unique tournament ID"""
+    return f"tournament_{random.randint(100000, 999999)}"
+
+async def send_tournament_update(tournament_id: str):
+    """Send a tournament's summary to every entrant still in it"""
+    tournament = tournaments.get(tournament_id)
+    if tournament is None:
+        return
+    
+    started = time.perf_counter()
+    message = encode_message("tournament_update", tournament.summary())
+    recipients = [entrant.client_id for entrant in tournament.entrants.values() if not entrant.forfeited]
+    for client_id in recipients:
+        push_to_client(client_id, message, "tournament_update")
+    metrics.FANOUT_SECONDS.labels("tournament").observe(time.perf_counter() - started)
+    metrics.FANOUT_RECIPIENTS.labels("tournament").observe(len(recipients))
+
+# Registrations and results produce at most one summary per interval
+tournament_updates = Throttle(send_tournament_update, TOURNAMENT_UPDATE_INTERVAL)
+
+async def start_tournament(tournament: Tournament):
+    """Seed the bracket and seat the first round"""
+    if tournament.clock is not None:
+        tournament.clock.cancel()
+        tournament.clock = None
+    ready = tournament.start()
+    logger.info("tournament_started", tournament_id=tournament.id, players=len(tournament.entrants),
+                rounds=len(tournament.rounds), matches=len(ready))
+    await tournament_updates.trigger(tournament.id)
+    await settle_tournament(tournament, ready)
+
+async def close_registration(tournament_id: str):
+    """Registration deadline: start with whoever joined, or call the tournament off"""
+    tournament = tournaments.get(tournament_id)
+    if tournament is None or tournament.status != "registering":
+        return
+    tournament.clock = None
+    if len(tournament.entrants) >= TOURNAMENT_MIN_PLAYERS:
+        await start_tournament(tournament)
+    else:
+        await end_tournament(tournament, "cancelled")
+
+async def settle_tournament(tournament: Tournament, ready: list):
+    """Seat the matches that became playable, or wrap up a decided tournament"""
+    for match in ready:
+        await seat_tournament_match(tournament, match)
+    if tournament.status == "finished":
+        await end_tournament(tournament, "completed")
+
+async def seat_tournament_match(tournament: Tournament, match: Match):
+    """Create a lobby for a bracket match, seat both players and schedule its start"""
+    lobby_id = generate_lobby_id()
+    while lobby_id in lobbies:
+        lobby_id = generate_lobby_id()
+    
+    # Private without a pin: out of the list, but spectators may watch (see handle_spectate_lobby)
+    lobby = Lobby(id=lobby_id, name=f"{tournament.name} - Round {match.round + 1}", type="private",
+                  created_at=time.time(), tournament=tournament.id)
+    for entrant in match.players:
+        client_id = entrant.client_id
+        # Winners wait in their finished lobby until their next match is seated
+        if players[client_id].lobby:
+            await handle_leave_lobby(client_id, {})
+        players[client_id].lobby = lobby_id
+        lobby.add_player(LobbyPlayer(client_id, entrant.name, players[client_id].guest))
+        lobby_feed.unsubscribe(client_id)
+        spectators.remove(client_id)
+        matchmaker.leave(client_id)
+    lobbies[lobby_id] = lobby
+    match.lobby_id = lobby_id
+    tournament.by_lobby[lobby_id] = match
+    tournament.changed()
+    
+    # Countdowns start in order, TOURNAMENT_STAGGER apart, so a round's
+    # submissions do not all reach the judge at once
+    now = time.monotonic()
+    starts_at = max(now + TOURNAMENT_MATCH_DELAY, tournament.next_start)
+    tournament.next_start = starts_at + TOURNAMENT_STAGGER
+    lobby.clock = scheduler.call_later(starts_at - now, start_tournament_match, lobby_id)
+    
+    first, second = match.players
+    for entrant, opponent in ((first, second), (second, first)):
+        data = {
+            "lobbyId": lobby_id,
+            "lobbyData": lobby.view(),
+            "playerCount": len(lobby.players),
+            "tournament": {
+                "id": tournament.id,
+                "name": tournament.name,
+                "round": match.round + 1,
+                "rounds": len(tournament.rounds),
+                "seed": entrant.seed,
+                "opponent": opponent.name,
+                "opponentSeed": opponent.seed,
+                "startsIn": round(starts_at - now, 2)
+            }
+        }
+        await send_to_client(entrant.client_id, "lobby_joined", data, compact=compact_variant(lobby, data))
+    
+    await broadcast_lobby_list_update(lobby_id)
+
+async def start_tournament_match(lobby_id: str):
+    """Ready both players of a seated bracket match and run the countdown"""
+    lobby = lobbies.get(lobby_id)
+    if lobby is None or lobby.status != "waiting":
+        return
+    lobby.clock = None
+    
+    for seat in lobby.players.values():
+        seat.ready = True
+    lobby.changed()
+    if not lobby.all_ready():
+        return
+    
+    logger.info("countdown_started", lobby_id=lobby_id)
+    await broadcast_to_lobby(lobby_id, "countdown_start", {
+        "countdown": COUNTDOWN_SECONDS
+    })
+    await countdown_step(lobby_id, COUNTDOWN_SECONDS)
+
+async def advance_tournament(lobby: Lobby, winner_id: Optional[str]):
+    """Report a finished bracket match; a draw goes to the better seed"""
+    tournament = tournaments.get(lobby.tournament)
+    match = tournament.by_lobby.pop(lobby.id, None) if tournament is not None else None
+    if match is None:
+        return
+    
+    ready = tournament.report(match, tournament.entrants.get(winner_id) if winner_id else None)
+    logger.info("tournament_match_finished", tournament_id=tournament.id, lobby_id=lobby.id,
+                round=match.round + 1, winner=match.winner.name if match.winner else None)
+    await tournament_updates.trigger(tournament.id)
+    await settle_tournament(tournament, ready)
+
+def still_in_tournament(client_id: str) -> bool:
+    """Registered in a tournament and not yet knocked out (so it may seat the player any moment)"""
+    player = players.get(client_id)
+    tournament = tournaments.get(player.tournament) if player is not None and player.tournament else None
+    entrant = tournament.entrants.get(client_id) if tournament is not None else None
+    return entrant is not None and not entrant.eliminated and not entrant.forfeited
+
+async def leave_tournament(client_id: str) -> Optional[Tournament]:
+    """Unregister a player, or forfeit the rest of a running tournament"""
+    player = players.get(client_id)
+    tournament = tournaments.get(player.tournament) if player is not None and player.tournament else None
+    if tournament is None:
+        return None
+    player.tournament = None
+    tournament.leave(client_id)
+    await tournament_updates.trigger(tournament.id)
+    return tournament
+
+async def concede_tournament_match(lobby: Lobby, client_id: str):
+    """A player left an undecided bracket match (and so the tournament): the opponent wins it"""
+    tournament = tournaments.get(lobby.tournament)
+    match = tournament.by_lobby.get(lobby.id) if tournament is not None else None
+    if match is None:
+        return
+    
+    await leave_tournament(client_id)
+    opponent_id = next(iter(lobby.players), None)
+    if lobby.status == "playing":
+        await finish_game(lobby, opponent_id, "forfeit")
+        return
+    
+    # Not started yet: no game to record, the opponent just moves on
+    del tournament.by_lobby[lobby.id]
+    if lobby.id in lobbies:
+        await close_lobby(lobby, "walkover")
+    await settle_tournament(tournament, tournament.walkover(match))
+
+async def end_tournament(tournament: Tournament, reason: str):
+    """Announce the result and forget the tournament after LOBBY_FINISHED_TIMEOUT"""
+    await tournament_updates.flush(tournament.id)
+    message = encode_message("tournament_finished", {
+        "tournamentId": tournament.id,
+        "champion": tournament.champion.name if tournament.champion else None,
+        "reason": reason
+    })
+    for entrant in tournament.entrants.values():
+        if entrant.forfeited:
+            continue
+        client_id = entrant.client_id
+        push_to_client(client_id, message)
+        player = players.get(client_id)
+        if player is not None and player.tournament == tournament.id:
+            player.tournament = None
+    
+    tournament.status = "finished"
+    tournament.changed()
+    if tournament.clock is not None:
+        tournament.clock.cancel()
+    tournament.clock = scheduler.call_later(LOBBY_FINISHED_TIMEOUT, tournaments.pop, tournament.id, None)
+    logger.info("tournament_finished", tournament_id=tournament.id, reason=reason,
+                champion=tournament.champion.name if tournament.champion else None)
+
+async def handle_create_tournament(client_id: str, data: dict):
+    """Handle creating a tournament; the creator organizes it and may also join"""
+    try:
+        name = data.get("name", "").strip()
+        capacity = data.get("maxPlayers", 64)
+        
+        if not name:
+            await send_to_client(client_id, "error", {"message": "Tournament name is required"})
+            return
+        
+        if (not isinstance(capacity, int) or isinstance(capacity, bool)
+                or not TOURNAMENT_MIN_PLAYERS <= capacity <= TOURNAMENT_MAX_PLAYERS):
+            await send_to_client(client_id, "error", {
+                "message": f"Max players must be between {TOURNAMENT_MIN_PLAYERS} and {TOURNAMENT_MAX_PLAYERS}"})
+            return
+        
+        tournament_id = generate_tournament_id()
+        while tournament_id in tournaments:
+            tournament_id = generate_tournament_id()
+        
+        tournament = Tournament(id=tournament_id, name=name, capacity=capacity, created_by=client_id,
+                                created_at=time.time())
+        tournament.clock = scheduler.call_later(TOURNAMENT_REGISTRATION_TIMEOUT, close_registration, tournament_id)
+        tournaments[tournament_id] = tournament
+        
+        logger.info("tournament_created", tournament_id=tournament_id, name=name, capacity=capacity)
+        
+        await send_to_client(client_id, "tournament_created", {
+            "tournamentId": tournament_id,
+            "tournament": tournament.summary()
+        })
+        
+    except Exception as e:
+        await send_to_client(client_id, "error", {"message": f"Failed to create tournament: {str(e)}"})
+
+async def handle_join_tournament(client_id: str, data: dict):
+    """Handle registering for a tournament; it starts once full"""
+    try:
+        tournament_id = data.get("tournamentId", "").strip()
+        tournament = tournaments.get(tournament_id) if tournament_id else None
+        
+        if tournament is None:
+            await send_to_client(client_id, "error", {"message": "Tournament not found"})
+            return
+        
+        if tournament.status != "registering":
+            await send_to_client(client_id, "error", {"message": "Tournament already started"})
+            return
+        
+        if tournament.is_full():
+            await send_to_client(client_id, "error", {"message": "Tournament is full"})
+            return
+        
+        if players[client_id].tournament in tournaments:
+            await send_to_client(client_id, "error", {"message": "You are already in a tournament"})
+            return
+        
+        if players[client_id].lobby:
+            await send_to_client(client_id, "error", {"message": "You are already in a lobby"})
+            return
+        
+        player_name = claim_name(client_id, data.get("playerName", "").strip())
+        if player_name is None:
+            await send_to_client(client_id, "error", {"message": "That name is already in use"})
+            return
+        
+        tournament.join(client_id, player_name, ratings.rating(player_name))
+        players[client_id].tournament = tournament_id
+        matchmaker.leave(client_id)
+        
+        await send_to_client(client_id, "tournament_joined", {
+            "tournamentId": tournament_id,
+            "tournament": tournament.summary()
+        })
+        await tournament_updates.trigger(tournament_id)
+        
+        if tournament.is_full():
+            await start_tournament(tournament)
+        
+    except Exception as e:
+        await send_to_client(client_id, "error", {"message": f"Failed to join tournament: {str(e)}"})
+
+async def handle_leave_tournament(client_id: str):
+    """Handle leaving a tournament (forfeiting, once it has started)"""
+    tournament_id = players[client_id].tournament
+    if tournament_id not in tournaments:
+        await send_to_client(client_id, "error", {"message": "You are not in a tournament"})
+        return
+    
+    # Leaving the lobby of an undecided bracket match concedes it
+    lobby = lobbies.get(players[client_id].lobby) if players[client_id].lobby else None
+    if lobby is not None and lobby.tournament == tournament_id:
+        await handle_leave_lobby(client_id, {})
+    
+    await leave_tournament(client_id)
+    await send_to_client(client_id, "tournament_left", {"tournamentId": tournament_id})
+
+async def handle_start_tournament(client_id: str, data: dict):
+    """Handle the organizer starting a tournament before it is full"""
+    tournament_id = data.get("tournamentId", "")
+    tournament = tournaments.get(tournament_id) if isinstance(tournament_id, str) else None
+    if tournament is None:
+        await send_to_client(client_id, "error", {"message": "Tournament not found"})
+        return
+    
+    if tournament.created_by != client_id:
+        await send_to_client(client_id, "error", {"message": "Only the organizer can start the tournament"})
+        return
+    
+    if tournament.status != "registering":
+        await send_to_client(client_id, "error", {"message": "Tournament already started"})
+        return
+    
+    if len(tournament.entrants) < TOURNAMENT_MIN_PLAYERS:
+        await send_to_client(client_id, "error", {
+            "message": f"At least {TOURNAMENT_MIN_PLAYERS} players are needed to start"})
+        return
+    
+    await start_tournament(tournament)
+
+async def handle_get_tournament(client_id: str, data: dict):
+    """Send a tournament's full bracket"""
+    tournament_id = data.get("tournamentId", "")
+    tournament = tournaments.get(tournament_id) if isinstance(tournament_id, str) else None
+    if tournament is None:
+        await send_to_client(client_id, "error", {"message": "Tournament not found"})
+        return
+    await send_to_client(client_id, "tournament", tournament.view())
+
+def leaderboard_page(offset, limit) -> Optional[Dict]:
+    """A leaderboard page, or None if offset or limit is not valid"""
+    for value in (offset, limit):
+        if not isinstance(value, int) or isinstance(value, bool):
+            return None
+    if offset < 0 or not 1 <= limit <= LEADERBOARD_MAX_PAGE_SIZE:
+        return None
+    return ratings.leaderboard(offset, limit)
+
+async def handle_get_leaderboard(client_id: str, data: dict):
+    """Send a page of the leaderboard and the player's own standing"""
+    page = leaderboard_page(data.get("offset", 0), data.get("limit", LEADERBOARD_PAGE_SIZE))
+    if page is None:
+        await send_to_client(client_id, "error", {
+            "message": f"Leaderboard pages take an offset of 0 or more and 1 to {LEADERBOARD_MAX_PAGE_SIZE} players"})
+        return
+    name = players[client_id].name
+    page["player"] = ratings.entry(name) if name else None
+    await send_to_client(client_id, "leaderboard", page)
+
 async def handle_leave_lobby(client_id: str, data: dict):
     """Handle leaving a lobby"""
     try:
-        if client_id not in players or not players[client_id]["lobby"]:
+        if client_id not in players or not players[client_id].lobby:
             await send_to_client(client_id, "error", {"message": "You are not in a lobby"})
             return
         
-        lobby_id = players[client_id]["lobby"]
+        lobby_id = players[client_id].lobby
         
         if lobby_id not in lobbies:
             # Cleanup orphaned player reference
-            players[client_id]["lobby"] = None
+            players[client_id].lobby = None
             return
         
         lobby = lobbies[lobby_id]
-        player_name = players[client_id]["name"]
+        player_name = players[client_id].name
         
         # Remove player from lobby
-        lobby["players"] = [p for p in lobby["players"] if p["id"] != client_id]
+        lobby.remove_player(client_id)
         
         # Update player info
-        players[client_id]["lobby"] = None
+        players[client_id].lobby = None
+        if lobby.status == "waiting":
+            schedule_reaper(lobby, LOBBY_IDLE_TIMEOUT)
         
-        print(f"{player_name} left lobby '{lobby['name']}' ({lobby_id})")
+        logger.info("player_left", player=player_name, lobby_id=lobby_id)
         
         # Send confirmation to leaving player
         await send_to_client(client_id, "lobby_left", {"message": "Left lobby successfully"})
         
         # If lobby is empty, delete it
-        if len(lobby["players"]) == 0:
+        if not lobby.players:
+            close_spectators(lobby_id, "empty")
+            lobby.cancel_timers()
             del lobbies[lobby_id]
-            print(f"Lobby {lobby_id} deleted - no players remaining")
-            await broadcast_lobby_list_update()
+            logger.info("lobby_deleted", lobby_id=lobby_id, reason="empty")
+            await broadcast_lobby_list_update(lobby_id)
         else:
             # Notify remaining players
-            await broadcast_to_lobby(lobby_id, "player_left", {
+            data = {
                 "playerName": player_name,
-                "playerCount": len(lobby["players"]),
-                "players": lobby["players"]
-            })
+                "playerCount": len(lobby.players),
+                "players": lobby.players_view()
+            }
+            await broadcast_to_lobby(lobby_id, "player_left", data, compact=compact_variant(lobby, data),
+                                     spectated=spectator_variant(lobby, data))
+            await broadcast_lobby_list_update(lobby_id)
+        
+        # Walking out of an undecided bracket match concedes it and the tournament
+        if lobby.tournament:
+            await concede_tournament_match(lobby, client_id)
         
     except Exception as e:
         await send_to_client(client_id, "error", {"message": f"Failed to leave lobby: {str(e)}"})
@@ -601,11 +1797,11 @@ async def handle_leave_lobby(client_id: str, data: dict):
 async def handle_player_ready(client_id: str, data: dict):
     """Handle player ready state"""
     try:
-        if client_id not in players or not players[client_id]["lobby"]:
+        if client_id not in players or not players[client_id].lobby:
             await send_to_client(client_id, "error", {"message": "You are not in a lobby"})
             return
         
-        lobby_id = players[client_id]["lobby"]
+        lobby_id = players[client_id].lobby
         
         if lobby_id not in lobbies:
             await send_to_client(client_id, "error", {"message": "Lobby not found"})
@@ -616,109 +1812,80 @@ async def handle_player_ready(client_id: str, data: dict):
         # No need to check player count - allow ready even when alone
         
         # Find and update player ready state
-        player_found = False
-        for player in lobby["players"]:
-            if player["id"] == client_id:
-                player["ready"] = True
-                player_found = True
-                break
-        
-        if not player_found:
+        player = lobby.players.get(client_id)
+        if player is None:
             await send_to_client(client_id, "error", {"message": "Player not found in lobby"})
             return
         
-        player_name = players[client_id]["name"]
-        print(f"{player_name} is ready in lobby {lobby_id}")
+        player.ready = True
+        lobby.changed()
+        
+        player_name = players[client_id].name
+        logger.info("player_ready", player=player_name, lobby_id=lobby_id)
         
         # Broadcast ready state to all players in lobby
         await broadcast_to_lobby(lobby_id, "player_ready_update", {
             "playerName": player_name,
             "players": [{
-                "id": p["id"],
-                "name": p["name"], 
-                "ready": p["ready"]
-            } for p in lobby["players"]]
+                "id": p.id,
+                "name": p.name, 
+                "ready": p.ready
+            } for p in lobby.players.values()]
         })
         
-        # Check if all players are ready
-        all_ready = all(player["ready"] for player in lobby["players"])
-        
-        if all_ready and len(lobby["players"]) == lobby["maxPlayers"]:
-            # Start countdown
-            print(f"All players ready in lobby {lobby_id} - starting countdown!")
+        # Once everyone is ready the scheduler runs the countdown and starts the game
+        if lobby.status == "waiting" and lobby.all_ready() and lobby.clock is None:
+            logger.info("countdown_started", lobby_id=lobby_id)
+            if lobby.reaper is not None:
+                lobby.reaper.cancel()
+                lobby.reaper = None
             
             # Broadcast countdown start
             await broadcast_to_lobby(lobby_id, "countdown_start", {
-                "countdown": 3
-            })
-            
-            # Wait 3 seconds with countdown updates
-            for i in range(3, 0, -1):
-                await broadcast_to_lobby(lobby_id, "countdown_update", {
-                    "countdown": i
-                })
-                await asyncio.sleep(1)
-            
-            # Start the game!
-            lobby["status"] = "playing"
-            lobby["started_at"] = time.time()
-            
-            print(f"Game started in lobby {lobby_id}!")
-            
-            # Add the hardcoded Two Sum problem
-            game_problem = {
-                "id": "two-sum",
-                "title": "Two Sum", 
-                "description": "Given an array of integers nums and an integer target, return indices of the two numbers such that they add up to target. Input: First line contains the array as a string (e.g., [2,7,11,15]), second line contains the target integer.",
-                "examples": [
-                    {
-                        "input": "[2,7,11,15]\n9",
-                        "output": "[0, 1]",
-                        "explanation": "Because nums[0] + nums[1] == 9, we return [0, 1]."
-                    }
-                ],
-                "template": """# Read input
-import sys
-lines = sys.stdin.read().strip().split('\\n')
-nums = eval(lines[0])  # Parse array from string
-target = int(lines[1])
-
-# Your solution here
-def two_sum(nums, target):
-    # Write your solution here
-    pass
-
-# Call function and print result
-result = two_sum(nums, target)
-print(result)""",
-                "timeLimit": 300  # 5 minutes
-            }
-            
-            lobby["problem"] = game_problem
-            
-            await broadcast_to_lobby(lobby_id, "game_start", {
-                "problem": game_problem,
-                "players": [{
-                    "id": p["id"],
-                    "name": p["name"]
-                } for p in lobby["players"]],
-                "timeLimit": game_problem["timeLimit"]
+                "countdown": COUNTDOWN_SECONDS
             })
-            
-            # Broadcast lobby list update since game started (lobby no longer visible in waiting list)
-            await broadcast_lobby_list_update()
+            await countdown_step(lobby_id, COUNTDOWN_SECONDS)
         
     except Exception as e:
         await send_to_client(client_id, "error", {"message": f"Failed to update ready state: {str(e)}"})
 
+async def handle_code_delta(client_id: str, data: dict):
+    """Apply a live edit to the player's editor buffer and schedule its relay"""
+    lobby_id = players[client_id].lobby
+    lobby = lobbies.get(lobby_id) if lobby_id else None
+    seat = lobby.players.get(client_id) if lobby is not None else None
+    
+    # Edits outside a running game are not shown to anyone
+    if seat is None or lobby.status != "playing":
+        return
+    
+    seq = data.get("seq")
+    if not isinstance(seq, int) or isinstance(seq, bool):
+        await send_to_client(client_id, "error", {"message": "Delta sequence number is required"})
+        return
+    
+    if seat.draft is None:
+        seat.draft = CodeBuffer()
+    draft = seat.draft
+    try:
+        draft.apply(seq, data.get("ops"), data.get("text"))
+    except DeltaError as e:
+        # Ask once for the whole text; later deltas are dropped until it arrives
+        if not draft.awaiting_text:
+            draft.awaiting_text = True
+            await send_to_client(client_id, "code_resync", {"seq": draft.seq, "reason": str(e)})
+        return
+    
+    await code_updates.trigger(client_id)
+
 async def handle_submit_code(client_id: str, data: dict):
     """Handle code submission and execute tests"""
     try:
-        if client_id not in players or not players[client_id]["lobby"]:
+        if client_id not in players or not players[client_id].lobby:
             await send_to_client(client_id, "error", {"message": "You are not in a lobby"})
             return
         
-        lobby_id = players[client_id]["lobby"]
+        lobby_id = players[client_id].lobby
         
         if lobby_id not in lobbies:
             await send_to_client(client_id, "error", {"message": "Lobby not found"})
@@ -727,7 +1894,7 @@ async def handle_submit_code(client_id: str, data: dict):
         lobby = lobbies[lobby_id]
         
         # Check if game is in progress
-        if lobby["status"] != "playing":
+        if lobby.status != "playing":
             await send_to_client(client_id, "error", {"message": "Game is not in progress"})
             return
         
@@ -735,87 +1902,87 @@ async def handle_submit_code(client_id: str, data: dict):
         submitted_code = data.get("code", "").strip()
         language = data.get("language", "python")
         
+        # "run" is a private check that stops at the first failing test;
+        # "submit" judges every test and counts towards the game
+        mode = data.get("mode", "submit")
+        
         if not submitted_code:
             await send_to_client(client_id, "error", {"message": "Code cannot be empty"})
             return
         
+        if mode not in ["run", "submit"]:
+            await send_to_client(client_id, "error", {"message": "Mode must be 'run' or 'submit'"})
+            return
+        
         # Find player in lobby and update their code
-        player_found = False
-        for player in lobby["players"]:
-            if player["id"] == client_id:
-                player["code"] = submitted_code
-                player["last_submission"] = time.time()
-                player_found = True
-                break
-        
-        if not player_found:
+        player = lobby.players.get(client_id)
+        if player is None:
             await send_to_client(client_id, "error", {"message": "Player not found in lobby"})
             return
         
-        player_name = players[client_id]["name"]
-        print(f"{player_name} submitted code in lobby {lobby_id}")
+        player.code = submitted_code
+        if mode == "submit":
+            player.last_submission = time.time()
+        lobby.changed()
+        
+        player_name = players[client_id].name
+        logger.info("code_submitted", player=player_name, lobby_id=lobby_id, mode=mode)
         
         # Get test cases for the problem
-        if lobby["problem"]["id"] == "two-sum":
-            test_cases = get_two_sum_test_cases()
-        else:
-            test_cases = get_two_sum_test_cases()  # Default fallback
+        problem = problem_bank.get(lobby.problem["id"])
+        if problem is None:
+            await send_to_client(client_id, "error", {"message": "Problem not found"})
+            return
+        test_cases = problem.test_cases
         
-        # Submit code to Judge0 API
-        test_results = await judge0_submit_code(submitted_code, test_cases)
+        # Stream each verdict to the submitting player as soon as it is known
+        async def send_test_progress(verdict: dict):
+            await send_to_client(client_id, "test_progress", {
+                "test": verdict["test"],
+                "passed": verdict["passed"],
+                "status": verdict["status"],
+                "runtime": verdict["runtime"],
+                "total": len(test_cases)
+            })
         
-        # Update player progress
-        for player in lobby["players"]:
-            if player["id"] == client_id:
-                player["tests_passed"] = test_results["passed"]
-                player["total_tests"] = test_results["total"]
-                player["completed"] = test_results["completed"]
-                break
+        # Submit code to Judge0 API
+        try:
+            test_results = await judge0_submit_code(submitted_code, test_cases, on_result=send_test_progress,
+                                                    language=language, version=problem.version,
+                                                    stop_on_failure=mode == "run", group=lobby_id)
+        except Overloaded as e:
+            await send_throttled(client_id, "submit_code", "judge_busy", e.retry_after)
+            return
         
         # Send test results to submitting player
         await send_to_client(client_id, "test_results", {
+            "mode": mode,
             "passed": test_results["passed"],
             "total": test_results["total"],
             "completed": test_results["completed"],
             "runtime": test_results["runtime"],
-            "errors": test_results.get("errors", [])
+            "errors": test_results.get("errors", []),
+            "skipped": test_results.get("skipped", 0)
         })
         
-        # Broadcast progress update to all players in lobby
-        await broadcast_to_lobby(lobby_id, "progress_update", {
-            "players": [{
-                "name": p["name"],
-                "tests_passed": p.get("tests_passed", 0),
-                "total_tests": p.get("total_tests", 5),
-                "completed": p.get("completed", False)
-            } for p in lobby["players"]]
-        })
+        # A run only gives the player feedback
+        if mode == "run":
+            return
         
-        # Check for winner
-        if test_results["completed"]:
-            lobby["status"] = "finished"
-            lobby["ended_at"] = time.time()
-            lobby["winner"] = player_name
-            
-            # Calculate final scores
-            final_scores = []
-            for p in lobby["players"]:
-                final_scores.append({
-                    "name": p["name"],
-                    "tests_passed": p.get("tests_passed", 0),
-                    "total_tests": p.get("total_tests", 5),
-                    "completed": p.get("completed", False),
-                    "completion_time": p.get("last_submission", 0) - lobby.get("started_at", 0) if p.get("completed") else None
-                })
-            
-            await broadcast_to_lobby(lobby_id, "game_finished", {
-                "winner": player_name,
-                "winner_id": client_id,
-                "final_scores": final_scores,
-                "game_duration": lobby["ended_at"] - lobby["started_at"]
-            })
-            
-            print(f"Game finished in lobby {lobby_id}. Winner: {player_name}")
+        # Update player progress
+        player.tests_passed = test_results["passed"]
+        player.total_tests = test_results["total"]
+        player.completed = test_results["completed"]
+        lobby.changed()
+        
+        # Broadcast progress update to all players in lobby (coalesced per lobby)
+        await progress_updates.trigger(lobby_id)
+        if spectators.count(lobby_id):
+            await spectator_progress.trigger(lobby_id)
+        
+        # Check for winner (the opponent may have finished while this was being judged)
+        if test_results["completed"] and lobby.status == "playing":
+            await finish_game(lobby, client_id, "completed")
         
     except Exception as e:
         await send_to_client(client_id, "error", {"message": f"Failed to submit code: {str(e)}"})
@@ -823,4 +1990,6 @@ async def handle_submit_code(client_id: str, data: dict):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    # Same variable the uvicorn CLI reads for --ws-per-message-deflate
+    deflate = os.getenv("UVICORN_WS_PER_MESSAGE_DEFLATE", "true").lower() != "false"
+    uvicorn.run(app, host="0.0.0.0", port=port, ws_per_message_deflate=deflate)
\ No newline at end of file
@@ -0,0 +1,182 @@
+import asyncio
+import bisect
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from log import get_logger
+
+# Load environment variables
+load_dotenv()
+
+logger = get_logger("matchmaking")
+
+# Rating assumed for players who do not send one (matches users.elo's default)
+MATCH_DEFAULT_ELO = int(os.getenv("MATCH_DEFAULT_ELO", "1000"))
+
+# Width of an ELO bucket; the starting band must cover at least one bucket
+MATCH_BUCKET_SIZE = int(os.getenv("MATCH_BUCKET_SIZE", "25"))
+
+# Accepted ELO difference: starts at the base band and widens while waiting
+MATCH_BASE_BAND = int(os.getenv("MATCH_BASE_BAND", "50"))
+MATCH_BAND_GROWTH = float(os.getenv("MATCH_BAND_GROWTH", "25"))  # per second waited
+MATCH_MAX_BAND = int(os.getenv("MATCH_MAX_BAND", "400"))
+
+# Seconds between retries for players whose band has widened
+MATCH_TICK = float(os.getenv("MATCH_TICK", "1.0"))
+
+@dataclass(slots=True, eq=False)
+class Ticket:
+    """A player waiting in the quick-match queue"""
+    client_id: str
+    elo: int
+    joined_at: float
+    bucket: int = 0
+
+MatchHandler = Callable[[Ticket, Ticket], Awaitable[None]]
+
+class Matchmaker:
+    """Quick-match queue bucketed by ELO
+
+    Waiting tickets sit in FIFO buckets of MATCH_BUCKET_SIZE rating points;
+    the ids of non-empty buckets are kept sorted, so the closest opponent
+    is found by bisecting to the player's bucket and walking outwards only
+    as far as the band allows. A newcomer is paired immediately when
+    possible, which keeps at most one waiter per bucket in practice, and
+    tick() retries the waiters whose band has widened since they joined.
+    Two players match when their rating difference fits within the wider
+    of their two bands.
+    """
+
+    def __init__(self, bucket_size: int = MATCH_BUCKET_SIZE, base_band: int = MATCH_BASE_BAND,
+                 band_growth: float = MATCH_BAND_GROWTH, max_band: int = MATCH_MAX_BAND,
+                 tick_interval: float = MATCH_TICK):
+        self.bucket_size = bucket_size
+        self.base_band = max(base_band, bucket_size)
+        self.band_growth = band_growth
+        self.max_band = max_band
+        self.tickets: Dict[str, Ticket] = {}
+        self.buckets: Dict[int, Deque[Ticket]] = {}
+        self.keys: List[int] = []
+        self.tick_interval = tick_interval
+        self.last_tick = float("-inf")
+        self.task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.tickets)
+
+    def __contains__(self, client_id: str) -> bool:
+        return client_id in self.tickets
+
+    def band(self, ticket: Ticket, now: float) -> float:
+        return min(self.max_band, self.base_band + self.band_growth * (now - ticket.joined_at))
+
+    def join(self, client_id: str, elo: int, now: Optional[float] = None) -> Optional[Tuple[Ticket, Ticket]]:
+        """Queue a player; returns the pair if an opponent was waiting"""
+        now = time.monotonic() if now is None else now
+        ticket = Ticket(client_id, elo, now, elo // self.bucket_size)
+
+        opponent = self.find_opponent(ticket, now)
+        if opponent is not None:
+            self.remove(opponent)
+            return opponent, ticket
+
+        self.tickets[client_id] = ticket
+        bucket = self.buckets.get(ticket.bucket)
+        if bucket is None:
+            bucket = self.buckets[ticket.bucket] = deque()
+            bisect.insort(self.keys, ticket.bucket)
+        bucket.append(ticket)
+        return None
+
+    def leave(self, client_id: str) -> bool:
+        ticket = self.tickets.get(client_id)
+        if ticket is None:
+            return False
+        self.remove(ticket)
+        return True
+
+    def remove(self, ticket: Ticket):
+        del self.tickets[ticket.client_id]
+        bucket = self.buckets[ticket.bucket]
+        if bucket[0] is ticket:
+            bucket.popleft()
+        else:
+            bucket.remove(ticket)
+        if not bucket:
+            del self.buckets[ticket.bucket]
+            del self.keys[bisect.bisect_left(self.keys, ticket.bucket)]
+
+    def find_opponent(self, ticket: Ticket, now: float) -> Optional[Ticket]:
+        """Closest-rated waiting ticket within either player's band"""
+        reach = self.band(ticket, now)
+        keys = self.keys
+        right = bisect.bisect_left(keys, ticket.bucket)
+        left = right - 1
+        best = None
+        best_diff = None
+
+        # Walk outwards bucket by bucket; stop once no closer rating is possible
+        while left >= 0 or right < len(keys):
+            left_gap = (ticket.bucket - keys[left] - 1) * self.bucket_size if left >= 0 else None
+            right_gap = (keys[right] - ticket.bucket - 1) * self.bucket_size if right < len(keys) else None
+            if right_gap is None or (left_gap is not None and left_gap < right_gap):
+                index, gap = left, left_gap
+                left -= 1
+            else:
+                index, gap = right, right_gap
+                right += 1
+            if gap > self.max_band or (best_diff is not None and gap >= best_diff):
+                break
+
+            # Every ticket in the bucket: a later one may be closer than the
+            # head even though the head, waiting longest, has the widest band.
+            # Equally close tickets go to the one that waited longest.
+            for candidate in self.buckets[keys[index]]:
+                if candidate is ticket:
+                    continue
+                diff = abs(candidate.elo - ticket.elo)
+                if diff <= max(reach, self.band(candidate, now)) and (best_diff is None or diff < best_diff):
+                    best, best_diff = candidate, diff
+        return best
+
+    def tick(self, now: Optional[float] = None) -> List[Tuple[Ticket, Ticket]]:
+        """Pair waiting players whose bands now overlap, oldest first"""
+        now = time.monotonic() if now is None else now
+        pairs = []
+        # A waiter whose band stopped widening before the last tick is left
+        # to newcomers and to waiters still widening, who check it themselves
+        settled = self.last_tick - (self.max_band - self.base_band) / self.band_growth if self.band_growth else now
+        self.last_tick = now
+        heads = sorted((bucket[0] for bucket in self.buckets.values() if bucket[0].joined_at > settled),
+                       key=lambda ticket: ticket.joined_at)
+        for ticket in heads:
+            if ticket.client_id not in self.tickets:
+                continue
+            opponent = self.find_opponent(ticket, now)
+            if opponent is not None:
+                self.remove(ticket)
+                self.remove(opponent)
+                pairs.append((opponent, ticket) if opponent.joined_at <= ticket.joined_at else (ticket, opponent))
+        return pairs
+
+    async def start(self, on_match: MatchHandler):
+        """Retry waiting players every tick_interval, handing pairs to on_match"""
+        self.task = asyncio.create_task(self.run(on_match))
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self, on_match: MatchHandler):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            for first, second in self.tick():
+                try:
+                    await on_match(first, second)
+                except Exception as e:
+                    logger.error("match_start_failed", first=first.client_id, second=second.client_id, error=str(e))
@@ -0,0 +1,230 @@
+import asyncio
+import bisect
+import math
+import os
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds between event loop lag samples
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+
+# Histogram bounds in seconds (handlers, Judge0 requests, fan-out) and in recipients
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30)
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Registry:
+    """Metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics: List["Metric"] = []
+
+    def register(self, metric: "Metric"):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+class Metric:
+    """A named metric, optionally split by labels
+
+    Children per label value are created on first use and cached, so an
+    update on the hot path is a dict lookup and an addition. A metric may
+    instead be given a function that is read when the metrics are scraped,
+    for values already kept elsewhere (queue sizes, connection counts).
+    """
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        self.function: Optional[Callable[[], object]] = None
+        if not self.labelnames:
+            self.labels()
+        registry.register(self)
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self.children[values] = self.new_child()
+        return child
+
+    def set_function(self, function: Callable[[], object]):
+        """Read the value(s) at scrape time; a dict maps label tuples to values"""
+        self.function = function
+
+    def new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> List[Tuple[str, float]]:
+        if self.function is not None:
+            value = self.function()
+            items = value.items() if isinstance(value, dict) else [((), value)]
+            return [(format_labels(self.labelnames, labels), value) for labels, value in items]
+        return [(format_labels(self.labelnames, labels), child.value) for labels, child in self.children.items()]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{self.name}{labels} {format_value(value)}" for labels, value in self.samples())
+        return lines
+
+class ValueChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+class Counter(Metric):
+    type = "counter"
+
+    def new_child(self) -> ValueChild:
+        return ValueChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def new_child(self) -> ValueChild:
+        return ValueChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Registry = REGISTRY):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def new_child(self) -> HistogramChild:
+        return HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, child in self.children.items():
+            cumulative = 0
+            for bound, count in zip(self.bounds + (math.inf,), child.counts):
+                cumulative += count
+                le = format_labels(self.labelnames, labels, f'le="{format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            plain = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{plain} {format_value(child.sum)}")
+            lines.append(f"{self.name}_count{plain} {child.count}")
+        return lines
+
+def render() -> str:
+    return REGISTRY.render()
+
+# Websocket handlers: inline dispatch per event and background handler tasks
+WS_EVENT_SECONDS = Histogram(
+    "shibacoder_ws_event_seconds", "Time to handle a websocket event in the receive loop", ["event"])
+HANDLER_SECONDS = Histogram(
+    "shibacoder_handler_seconds", "Run time of background event handlers", ["handler"])
+
+# Judge0
+JUDGE0_SUBMIT_SECONDS = Histogram(
+    "shibacoder_judge0_submit_seconds", "Latency of Judge0 batch submissions")
+JUDGE0_POLL_SECONDS = Histogram(
+    "shibacoder_judge0_poll_seconds", "Latency of Judge0 batch result polls")
+JUDGE0_POLLS = Counter(
+    "shibacoder_judge0_polls_total", "Judge0 result polls sent")
+JUDGE0_POLLS_PER_BATCH = Histogram(
+    "shibacoder_judge0_polls_per_batch", "Polls needed before a Judge0 batch finished", buckets=COUNT_BUCKETS)
+JUDGE0_ERRORS = Counter(
+    "shibacoder_judge0_errors_total", "Judge0 runs that ended with an API error")
+JUDGE_QUEUE_SECONDS = Histogram(
+    "shibacoder_judge_queue_seconds", "Time a submission waited for a judge run slot")
+
+# Backpressure
+THROTTLED = Counter(
+    "shibacoder_throttled_total", "Client events refused with a throttled reply", ["event", "reason"])
+
+# Broadcast fan-out
+FANOUT_SECONDS = Histogram(
+    "shibacoder_fanout_seconds", "Time to encode and queue a broadcast", ["scope"])
+FANOUT_RECIPIENTS = Histogram(
+    "shibacoder_fanout_recipients", "Connections a broadcast was queued for", ["scope"], buckets=SIZE_BUCKETS)
+SLOW_CONSUMERS = Counter(
+    "shibacoder_slow_consumers_total", "Connections dropped for falling behind on outbound messages")
+
+# Event loop health
+EVENT_LOOP_LAG = Histogram(
+    "shibacoder_event_loop_lag_seconds", "How late the event loop woke a sleeping task")
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """Sample event loop lag until cancelled"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - started - interval))
+
+# Sizes read at scrape time (set_function is called in main.startup)
+OPEN_CONNECTIONS = Gauge("shibacoder_open_connections", "Open websocket connections")
+SPECTATORS = Gauge("shibacoder_spectators", "Clients spectating a lobby")
+ACTIVE_LOBBIES = Gauge("shibacoder_lobbies", "Lobbies by status", ["status"])
+QUEUE_DEPTH = Gauge("shibacoder_queue_depth", "Items waiting in internal queues", ["queue"])
+RESULT_CACHE_REQUESTS = Counter(
+    "shibacoder_result_cache_requests_total", "Submissions by result cache outcome", ["outcome"])
+RESULT_CACHE_HIT_RATIO = Gauge(
+    "shibacoder_result_cache_hit_ratio", "Share of submissions served without a new judge run")
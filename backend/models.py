@@ -0,0 +1,206 @@
+from array import array
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from code_sync import CodeBuffer
+    from scheduler import Timer
+
+# Per-player progress fields, only sent once they have been set
+PROGRESS_FIELDS = ("code", "last_submission", "tests_passed", "total_tests", "completed")
+
+# What compact protocol clients get: no opponent code
+COMPACT_PROGRESS_FIELDS = PROGRESS_FIELDS[1:]
+
+@dataclass(slots=True)
+class Player:
+    """A connected client and the lobby it is in, if any"""
+    id: str
+    name: Optional[str] = None
+    lobby: Optional[str] = None
+    connected_at: float = 0.0
+    # Monotonic time of the last message, checked by the idle timer
+    last_seen: float = 0.0
+    idle_timer: Optional["Timer"] = field(default=None, repr=False)
+    # Token buckets (see rate_limit.RateLimiter)
+    rate_state: Optional[array] = field(default=None, repr=False)
+    # Tournament the player is registered in, if any
+    tournament: Optional[str] = None
+    # Playing under a generated name (see claim_name in main.py): not rated or stored
+    guest: bool = True
+
+@dataclass(slots=True)
+class LobbyPlayer:
+    """A player's seat and progress in one lobby"""
+    id: str
+    name: str
+    guest: bool = False
+    ready: bool = False
+    code: Optional[str] = None
+    last_submission: Optional[float] = None
+    tests_passed: Optional[int] = None
+    total_tests: Optional[int] = None
+    completed: Optional[bool] = None
+    # Live editor text from code_delta events (not part of the lobby views)
+    draft: Optional["CodeBuffer"] = field(default=None, repr=False)
+
+    def to_dict(self, fields=PROGRESS_FIELDS) -> Dict:
+        view = {"id": self.id, "name": self.name, "ready": self.ready}
+        for key in fields:
+            value = getattr(self, key)
+            if value is not None:
+                view[key] = value
+        return view
+
+@dataclass(slots=True, eq=False)
+class Lobby:
+    """A lobby with its players keyed by client id
+
+    The dict views sent to clients (lobbyData and the player list) are
+    built once and reused until the lobby changes, as are the compact
+    variants for compact protocol clients (no player code, the problem by
+    reference) and the spectator view (no player code). Code that mutates a
+    lobby or one of its players outside add_player/remove_player must
+    call changed() so the next view is rebuilt.
+    """
+    id: str
+    name: str
+    type: str
+    created_at: float
+    pin: Optional[str] = None
+    status: str = "waiting"
+    max_players: int = 2
+    players: Dict[str, LobbyPlayer] = field(default_factory=dict)
+    started_at: Optional[float] = None
+    ended_at: Optional[float] = None
+    problem: Optional[Dict] = None
+    # {"id", "hash"} of the problem, sent instead of it to compact clients
+    problem_ref: Optional[Dict] = None
+    winner: Optional[str] = None
+    # Names of the non-guest players who started the game, all rated when it ends
+    rated: List[str] = field(default_factory=list)
+    # Tournament this lobby plays a bracket match for
+    tournament: Optional[str] = None
+    # Worker id of the owner, for lobbies that live on another worker
+    owner: Optional[str] = None
+    # Scheduler timers: the countdown step or time limit, and idle reaping
+    clock: Optional["Timer"] = field(default=None, repr=False)
+    reaper: Optional["Timer"] = field(default=None, repr=False)
+    _view: Optional[Dict] = field(default=None, repr=False)
+    _players_view: Optional[List[Dict]] = field(default=None, repr=False)
+    _compact_view: Optional[Dict] = field(default=None, repr=False)
+    _compact_players_view: Optional[List[Dict]] = field(default=None, repr=False)
+    _spectator_view: Optional[Dict] = field(default=None, repr=False)
+
+    def add_player(self, player: LobbyPlayer):
+        self.players[player.id] = player
+        self.changed()
+
+    def remove_player(self, player_id: str) -> Optional[LobbyPlayer]:
+        player = self.players.pop(player_id, None)
+        self.changed()
+        return player
+
+    def is_full(self) -> bool:
+        return len(self.players) >= self.max_players
+
+    def all_ready(self) -> bool:
+        return self.is_full() and all(player.ready for player in self.players.values())
+
+    def cancel_timers(self):
+        """Stop the lobby's timers (call before dropping the lobby)"""
+        for timer in (self.clock, self.reaper):
+            if timer is not None:
+                timer.cancel()
+        self.clock = self.reaper = None
+
+    def changed(self):
+        """Drop cached views after a change"""
+        self._view = None
+        self._players_view = None
+        self._compact_view = None
+        self._compact_players_view = None
+        self._spectator_view = None
+
+    def players_view(self) -> List[Dict]:
+        """Player list as sent in lobby events (shared, do not modify)"""
+        if self._players_view is None:
+            self._players_view = [player.to_dict() for player in self.players.values()]
+        return self._players_view
+
+    def compact_players_view(self) -> List[Dict]:
+        if self._compact_players_view is None:
+            self._compact_players_view = [player.to_dict(COMPACT_PROGRESS_FIELDS) for player in self.players.values()]
+        return self._compact_players_view
+
+    def view(self) -> Dict:
+        """lobbyData as sent in lobby_created / lobby_joined (shared, do not modify)"""
+        if self._view is None:
+            self._view = self.build_view(self.players_view(), self.problem)
+        return self._view
+
+    def compact_view(self) -> Dict:
+        if self._compact_view is None:
+            self._compact_view = self.build_view(self.compact_players_view(), self.problem_ref)
+        return self._compact_view
+
+    def spectator_view(self) -> Dict:
+        """lobbyData for spectators: every player's progress but not their code"""
+        if self._spectator_view is None:
+            self._spectator_view = self.build_view(self.compact_players_view(), self.problem)
+        return self._spectator_view
+
+    def build_view(self, players: List[Dict], problem: Optional[Dict]) -> Dict:
+        view = {
+            "id": self.id,
+            "name": self.name,
+            "type": self.type,
+            "pin": self.pin,
+            "status": self.status,
+            "players": players,
+            "maxPlayers": self.max_players,
+            "createdAt": self.created_at
+        }
+        for key, value in (("started_at", self.started_at), ("ended_at", self.ended_at),
+                           ("problem", problem), ("winner", self.winner)):
+            if value is not None:
+                view[key] = value
+        return view
+
+    def listing(self) -> Dict:
+        """Entry in the public lobby list"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "playerCount": len(self.players),
+            "maxPlayers": self.max_players,
+            "status": self.status,
+            "createdAt": self.created_at
+        }
+
+    def summary(self, owner: str) -> Dict:
+        """What other workers need to list this lobby and route its players"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "type": self.type,
+            "status": self.status,
+            "players": [{"id": p.id, "name": p.name} for p in self.players.values()],
+            "maxPlayers": self.max_players,
+            "createdAt": self.created_at,
+            "owner": owner
+        }
+
+    @classmethod
+    def from_summary(cls, summary: Dict) -> "Lobby":
+        """Stand-in for a lobby owned by another worker"""
+        return cls(
+            id=summary["id"],
+            name=summary["name"],
+            type=summary["type"],
+            created_at=summary["createdAt"],
+            status=summary["status"],
+            max_players=summary["maxPlayers"],
+            players={p["id"]: LobbyPlayer(p["id"], p["name"]) for p in summary["players"]},
+            owner=summary["owner"]
+        )
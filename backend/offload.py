@@ -0,0 +1,28 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+# Bounded pool for synchronous judging work (scoring, output comparison)
+OFFLOAD_THREADS = int(os.getenv("OFFLOAD_THREADS", "4"))
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+def get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=OFFLOAD_THREADS, thread_name_prefix="offload")
+    return _pool
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a synchronous function in the offload pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(), functools.partial(func, *args, **kwargs))
+
+def shutdown_pool():
+    """Stop the offload pool (called on app shutdown)"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,138 @@
+import glob
+import hashlib
+import json
+import os
+import random
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from executors import encode_b64
+from result_cache import test_set_version
+
+# Load environment variables
+load_dotenv()
+
+# Directory of problem definitions, one JSON file per problem
+PROBLEMS_DIR = os.getenv("PROBLEMS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "problems"))
+
+# Order tests are judged in: "cheap" runs the cheapest first (a test's "cost",
+# else its input size) so failing code fails fast; "file" keeps the file order
+TEST_ORDER = os.getenv("TEST_ORDER", "cheap")
+
+# Fields of a problem file sent to players in game_start
+PUBLIC_FIELDS = ("id", "title", "description", "examples", "template", "timeLimit")
+REQUIRED_FIELDS = PUBLIC_FIELDS + ("difficulty", "tests")
+
+def view_digest(view: Dict) -> str:
+    """Content hash of a problem view (stable across processes and restarts)"""
+    canonical = json.dumps(view, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+@dataclass(slots=True, eq=False)
+class Problem:
+    """A problem with its test suite prepared for the judges
+
+    view is what players see. Tests are stored in judging order (see
+    TEST_ORDER); each keeps its plain input and expected output and also
+    carries base64 copies for Judge0, so nothing is re-encoded per
+    submission. version is the test set hash used in result cache keys;
+    digest hashes the view, so clients can cache problems by id and digest.
+    """
+    id: str
+    title: str
+    difficulty: str
+    tags: Tuple[str, ...]
+    time_limit: int
+    view: Dict
+    test_cases: List[Dict]
+    version: str
+    digest: str
+
+    @property
+    def reference(self) -> Dict:
+        """Stand-in for the view sent to clients that cache problems"""
+        return {"id": self.id, "hash": self.digest, "timeLimit": self.time_limit}
+
+    @classmethod
+    def from_dict(cls, data: Dict, test_order: str = TEST_ORDER) -> "Problem":
+        missing = [field for field in REQUIRED_FIELDS if field not in data]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+        if not data["tests"]:
+            raise ValueError("no tests")
+
+        tests = data["tests"]
+        if test_order == "cheap":
+            tests = sorted(tests, key=lambda test: test.get("cost", len(test["input"])))
+        elif test_order != "file":
+            raise ValueError(f"unknown TEST_ORDER '{test_order}'")
+
+        test_cases = [{
+            "input": test["input"],
+            "expected_output": test["expected_output"],
+            "stdin_b64": encode_b64(test["input"]),
+            "expected_output_b64": encode_b64(test["expected_output"])
+        } for test in tests]
+
+        view = {field: data[field] for field in PUBLIC_FIELDS}
+        return cls(
+            id=data["id"],
+            title=data["title"],
+            difficulty=data["difficulty"],
+            tags=tuple(data.get("tags", ())),
+            time_limit=data["timeLimit"],
+            view=view,
+            test_cases=test_cases,
+            version=test_set_version(test_cases),
+            digest=view_digest(view)
+        )
+
+class ProblemBank:
+    """Problems loaded once at startup, indexed by id, difficulty and tag"""
+
+    def __init__(self, problems: List[Problem]):
+        self.problems: Dict[str, Problem] = {}
+        self.by_difficulty: Dict[str, List[Problem]] = {}
+        self.by_tag: Dict[str, List[Problem]] = {}
+        self.all: List[Problem] = []
+
+        for problem in problems:
+            if problem.id in self.problems:
+                raise ValueError(f"Duplicate problem id '{problem.id}'")
+            self.problems[problem.id] = problem
+            self.all.append(problem)
+            self.by_difficulty.setdefault(problem.difficulty, []).append(problem)
+            for tag in problem.tags:
+                self.by_tag.setdefault(tag, []).append(problem)
+
+    @classmethod
+    def load(cls, directory: str = PROBLEMS_DIR) -> "ProblemBank":
+        """Read every *.json problem file in directory"""
+        problems = []
+        for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    problems.append(Problem.from_dict(json.load(f)))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"Invalid problem file {path}: {e}") from e
+
+        if not problems:
+            raise ValueError(f"No problems found in {directory}")
+        return cls(problems)
+
+    def __len__(self) -> int:
+        return len(self.all)
+
+    def get(self, problem_id: str) -> Optional[Problem]:
+        return self.problems.get(problem_id)
+
+    def random(self, difficulty: Optional[str] = None, tag: Optional[str] = None) -> Optional[Problem]:
+        """Pick a problem uniformly at random (optionally by difficulty or tag)"""
+        if difficulty is not None:
+            candidates = self.by_difficulty.get(difficulty, [])
+        elif tag is not None:
+            candidates = self.by_tag.get(tag, [])
+        else:
+            candidates = self.all
+        return random.choice(candidates) if candidates else None
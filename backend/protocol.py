@@ -0,0 +1,135 @@
+import json
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from fastapi import WebSocket
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # The compact protocol is only offered when msgpack is installed
+    msgpack = None
+
+# Numeric ids of the compact protocol. Append only: a client keeps working
+# as long as the ids it knows never change meaning.
+EVENTS = (
+    # Client to server
+    "get_lobby_list", "create_lobby", "join_lobby", "leave_lobby", "player_ready",
+    "submit_code", "queue_join", "queue_leave", "get_problem",
+    # Server to client
+    "error", "lobby_list", "lobby_list_update", "lobby_list_delta", "lobby_created",
+    "lobby_joined", "lobby_left", "lobby_closed", "player_joined", "player_left",
+    "player_ready_update", "countdown_start", "countdown_update", "countdown_cancelled",
+    "game_start", "test_progress", "test_results", "progress_update", "game_finished",
+    "queue_joined", "queue_left", "problem", "session", "session_resumed", "player_connection",
+    "throttled", "spectate_lobby", "stop_spectating", "spectating", "spectating_stopped",
+    "code_delta", "code_update", "code_resync",
+    "create_tournament", "join_tournament", "leave_tournament", "start_tournament", "get_tournament",
+    "tournament_created", "tournament_joined", "tournament_left", "tournament_update", "tournament",
+    "tournament_finished", "get_leaderboard", "leaderboard"
+)
+EVENT_IDS: Dict[str, int] = {event: index for index, event in enumerate(EVENTS)}
+
+# Websocket subprotocol names offered in Sec-WebSocket-Protocol
+JSON_SUBPROTOCOL = "shibacoder.json"
+MSGPACK_SUBPROTOCOL = "shibacoder.msgpack"
+
+def dumps(value: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value)
+
+class Message:
+    """An outbound event, encoded at most once per wire format
+
+    Broadcasts build one Message and hand it to every recipient's outbox;
+    the first JSON client renders the text and the first compact client
+    the binary frame, and everyone after them reuses it. compact, when
+    given, replaces data for compact clients (e.g. a problem reference
+    instead of the full problem).
+    """
+    __slots__ = ("event", "data", "compact", "_text", "_packed")
+
+    def __init__(self, event: str, data: Any, compact: Any = None):
+        self.event = event
+        self.data = data
+        self.compact = compact
+        self._text: Optional[str] = None
+        self._packed: Optional[bytes] = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = dumps({"event": self.event, "data": self.data})
+        return self._text
+
+    @property
+    def packed(self) -> bytes:
+        if self._packed is None:
+            data = self.data if self.compact is None else self.compact
+            self._packed = msgpack.packb([EVENT_IDS.get(self.event, self.event), data])
+        return self._packed
+
+class JsonProtocol:
+    """The default protocol: {"event": name, "data": {...}} text frames"""
+    name = "json"
+
+    def __init__(self, subprotocol: Optional[str] = None):
+        # Echoed back when the client asked for it by name
+        self.subprotocol = subprotocol
+
+    async def receive(self, websocket: WebSocket) -> Tuple[Any, Any]:
+        message = json.loads(await websocket.receive_text())
+        return message.get("event"), message.get("data", {})
+
+    async def send(self, websocket: WebSocket, message: Message):
+        await websocket.send_text(message.text)
+
+class MsgpackProtocol(JsonProtocol):
+    """Compact protocol: MessagePack [event id, data] binary frames
+
+    Event ids index EVENTS (unknown names may still be sent as strings).
+    Static payloads are sent by reference, e.g. game_start carries the
+    problem's {"id", "hash"}; clients fetch a problem they have not cached
+    with get_problem or GET /problems/{id}.
+    """
+    name = "msgpack"
+
+    async def receive(self, websocket: WebSocket) -> Tuple[Any, Any]:
+        event, data = msgpack.unpackb(await websocket.receive_bytes())
+        if isinstance(event, int):
+            event = EVENTS[event] if 0 <= event < len(EVENTS) else None
+        return event, data if data is not None else {}
+
+    async def send(self, websocket: WebSocket, message: Message):
+        await websocket.send_bytes(message.packed)
+
+class RelayProtocol:
+    """Passes whole messages to a RemoteSocket, which encodes them on the client's own worker"""
+    name = "relay"
+
+    async def send(self, websocket, message: Message):
+        await websocket.send_message(message)
+
+JSON = JsonProtocol()
+NAMED_JSON = JsonProtocol(JSON_SUBPROTOCOL)
+MSGPACK = MsgpackProtocol(MSGPACK_SUBPROTOCOL)
+RELAY = RelayProtocol()
+
+def negotiate(offered: Sequence[str]) -> JsonProtocol:
+    """Pick the protocol from the client's Sec-WebSocket-Protocol list (JSON by default)"""
+    if MSGPACK_SUBPROTOCOL in offered and msgpack is not None:
+        return MSGPACK
+    if JSON_SUBPROTOCOL in offered:
+        return NAMED_JSON
+    return JSON
+
+def describe() -> Dict:
+    """What a client needs to speak the compact protocol"""
+    return {
+        "subprotocols": [JSON_SUBPROTOCOL] + ([MSGPACK_SUBPROTOCOL] if msgpack is not None else []),
+        "events": EVENT_IDS
+    }
@@ -0,0 +1,83 @@
+import math
+import os
+from array import array
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+Limit = Tuple[float, float]
+
+def parse_limit(value: str) -> Optional[Limit]:
+    """"rate,burst" (events per second, bucket size); "0" turns the limit off"""
+    parts = [float(part) for part in value.split(",")]
+    rate = parts[0]
+    if rate <= 0:
+        return None
+    burst = parts[1] if len(parts) > 1 else max(1.0, rate)
+    return rate, max(1.0, burst)
+
+# Websocket events per client: RATE_LIMIT_<EVENT>="rate,burst". Events
+# without a limit of their own share the RATE_LIMIT_DEFAULT bucket.
+DEFAULT_LIMITS = {
+    "submit_code": "0.5,5",
+    "get_lobby_list": "5,10",
+    "create_lobby": "0.2,3",
+    "join_lobby": "1,5",
+    "queue_join": "1,5",
+    "player_ready": "1,5",
+    "get_problem": "1,5",
+    "spectate_lobby": "1,5",
+    "code_delta": "30,60",
+    "create_tournament": "0.1,2",
+    "join_tournament": "1,5",
+    "get_tournament": "1,5",
+    "get_leaderboard": "1,5"
+}
+RATE_LIMITS: Dict[str, Optional[Limit]] = {
+    event: parse_limit(os.getenv(f"RATE_LIMIT_{event.upper()}", default))
+    for event, default in DEFAULT_LIMITS.items()
+}
+RATE_LIMIT_DEFAULT = parse_limit(os.getenv("RATE_LIMIT_DEFAULT", "20,40"))
+
+class RateLimiter:
+    """Token buckets per client and event type
+
+    A client's state is one flat array of (tokens, last refill) pairs, one
+    pair per limited event plus one shared by every other event, so it
+    costs the same for every client no matter what it sends. Buckets are
+    refilled lazily when checked; nothing runs in the background.
+    """
+
+    def __init__(self, limits: Dict[str, Optional[Limit]] = RATE_LIMITS,
+                 default: Optional[Limit] = RATE_LIMIT_DEFAULT):
+        limits = {event: limit for event, limit in limits.items() if limit is not None}
+        self.index = {event: i for i, event in enumerate(limits)}
+        self.other = len(limits)
+        self.limits = list(limits.values()) + [default]
+
+    def new_state(self) -> array:
+        """Full buckets for a new client"""
+        state = array("d")
+        for limit in self.limits:
+            state.extend((limit[1] if limit else 0.0, 0.0))
+        return state
+
+    def check(self, state: array, event: str, now: float) -> float:
+        """Take a token for event; returns 0 if allowed, else seconds until one is available"""
+        i = self.index.get(event, self.other)
+        limit = self.limits[i]
+        if limit is None:
+            return 0.0
+        rate, burst = limit
+        tokens = state[2 * i]
+        if state[2 * i + 1]:
+            tokens = min(burst, tokens + (now - state[2 * i + 1]) * rate)
+        state[2 * i + 1] = now
+        if tokens >= 1.0:
+            state[2 * i] = tokens - 1.0
+            return 0.0
+        state[2 * i] = tokens
+        return math.ceil((1.0 - tokens) / rate * 10) / 10
@@ -0,0 +1,227 @@
+import bisect
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from log import get_logger
+from matchmaking import MATCH_DEFAULT_ELO
+from storage import Database
+
+# Load environment variables
+load_dotenv()
+
+logger = get_logger("ratings")
+
+# ELO points at stake in a game between two equally rated players
+RATING_K_FACTOR = float(os.getenv("RATING_K_FACTOR", "32"))
+
+# Ratings are kept within this range (one rank index slot per point)
+RATING_MIN = int(os.getenv("RATING_MIN", "0"))
+RATING_MAX = int(os.getenv("RATING_MAX", "4000"))
+
+# Leaderboard page size: default and largest accepted
+LEADERBOARD_PAGE_SIZE = int(os.getenv("LEADERBOARD_PAGE_SIZE", "50"))
+LEADERBOARD_MAX_PAGE_SIZE = int(os.getenv("LEADERBOARD_MAX_PAGE_SIZE", "100"))
+
+SELECT_RATINGS = "SELECT username, elo FROM users WHERE elo IS NOT NULL"
+
+def expected_score(rating: int, opponent: int) -> float:
+    return 1.0 / (1.0 + 10.0 ** ((opponent - rating) / 400.0))
+
+class RankIndex:
+    """Rated players ordered best first, for rank lookups and leaderboard pages
+
+    A Fenwick tree counts players per rating point, ordered from
+    RATING_MAX down, so the number of players rated above any rating is
+    a prefix sum and the player at any position is found by descending
+    the tree, both O(log R) for R rating points whatever the number of
+    players. Players on the same rating share a rank and are listed by
+    name, kept sorted per rating. Updates are one tree update plus a
+    bisect in the player's rating.
+    """
+    __slots__ = ("low", "high", "size", "tree", "names", "count", "top_bit")
+
+    def __init__(self, low: int = RATING_MIN, high: int = RATING_MAX):
+        self.low = low
+        self.high = high
+        self.size = high - low + 1
+        self.tree = [0] * (self.size + 1)
+        self.names: Dict[int, List[str]] = {}
+        self.count = 0
+        self.top_bit = 1 << (self.size.bit_length() - 1)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def slot(self, rating: int) -> int:
+        return self.high - rating + 1
+
+    def update(self, rating: int, change: int):
+        slot = self.slot(rating)
+        while slot <= self.size:
+            self.tree[slot] += change
+            slot += slot & -slot
+        self.count += change
+
+    def above(self, rating: int) -> int:
+        """Players rated strictly higher"""
+        slot = self.slot(rating) - 1
+        total = 0
+        while slot > 0:
+            total += self.tree[slot]
+            slot -= slot & -slot
+        return total
+
+    def find(self, position: int) -> Tuple[int, int]:
+        """Rating of the player at a 1-based position, and how many players are rated above it"""
+        slot = 0
+        before = 0
+        step = self.top_bit
+        while step:
+            following = slot + step
+            if following <= self.size and before + self.tree[following] < position:
+                slot = following
+                before += self.tree[following]
+            step >>= 1
+        return self.high - slot, before
+
+    def add(self, name: str, rating: int):
+        bisect.insort(self.names.setdefault(rating, []), name)
+        self.update(rating, 1)
+
+    def remove(self, name: str, rating: int):
+        names = self.names[rating]
+        del names[bisect.bisect_left(names, name)]
+        if not names:
+            del self.names[rating]
+        self.update(rating, -1)
+
+    def build(self, ratings: Iterable[Tuple[str, int]]):
+        """Replace the contents in one pass (sorting each rating's names once)"""
+        self.names = {}
+        for name, rating in ratings:
+            self.names.setdefault(rating, []).append(name)
+        counts = [0] * (self.size + 1)
+        for rating, names in self.names.items():
+            names.sort()
+            counts[self.slot(rating)] = len(names)
+        # Linear-time Fenwick construction from the per-slot counts
+        for slot in range(1, self.size + 1):
+            parent = slot + (slot & -slot)
+            if parent <= self.size:
+                counts[parent] += counts[slot]
+        self.tree = counts
+        self.count = sum(len(names) for names in self.names.values())
+
+    def page(self, offset: int, limit: int) -> List[Tuple[int, str, int]]:
+        """(rank, name, rating) of the players at positions offset+1 ... offset+limit"""
+        entries = []
+        position = offset + 1
+        while len(entries) < limit and position <= self.count:
+            rating, before = self.find(position)
+            names = self.names[rating]
+            start = position - before - 1
+            for name in names[start:start + limit - len(entries)]:
+                entries.append((before + 1, name, rating))
+            position = before + len(names) + 1
+        return entries
+
+class RatingService:
+    """Players' ELO ratings, updated as games finish
+
+    Every player who started a game is rated when it ends, including
+    those who left early, except guests on generated names (see
+    claim_name in main.py): the winner scores 1 against each opponent,
+    the others 0, and a game without a winner is a draw for everyone.
+    With more than two players each pairing is rated with K divided by
+    the number of opponents. Ratings are loaded from users.elo at
+    startup and saved by the MatchStore together with the game, so a
+    new rating is never awaited on.
+
+    Players are identified by name, and names are not authenticated:
+    anyone may play (and be rated) under a name nobody connected is
+    using (see claim_name in main.py), so the leaderboard is only as
+    trustworthy as its players.
+    """
+
+    def __init__(self, database: Optional[Database], k_factor: float = RATING_K_FACTOR):
+        self.database = database
+        self.k_factor = k_factor
+        self.ratings: Dict[str, int] = {}
+        self.index = RankIndex()
+        self.games = 0
+
+    def __len__(self) -> int:
+        return len(self.ratings)
+
+    def clamp(self, rating: int) -> int:
+        return max(RATING_MIN, min(rating, RATING_MAX))
+
+    async def load(self):
+        """Read stored ratings; call once the database has started"""
+        if self.database is None:
+            return
+        started = time.perf_counter()
+        rows = await self.database.fetch(SELECT_RATINGS)
+        self.ratings = {name: self.clamp(int(elo)) for name, elo in rows}
+        self.index.build(self.ratings.items())
+        logger.info("ratings_loaded", players=len(self.ratings),
+                    seconds=round(time.perf_counter() - started, 3))
+
+    def rating(self, name: Optional[str]) -> int:
+        return self.ratings.get(name, MATCH_DEFAULT_ELO) if name else MATCH_DEFAULT_ELO
+
+    def rank(self, name: str) -> Optional[int]:
+        """1-based rank (ties share one), or None for players without a rated game"""
+        rating = self.ratings.get(name)
+        if rating is None:
+            return None
+        return self.index.above(rating) + 1
+
+    def entry(self, name: str) -> Optional[Dict]:
+        rating = self.ratings.get(name)
+        if rating is None:
+            return None
+        return {"rank": self.index.above(rating) + 1, "name": name, "elo": rating}
+
+    def record(self, names: List[str], winner: Optional[str]) -> Dict[str, Dict]:
+        """Rate a finished game; returns {name: {"elo", "change", "rank"}} for its players"""
+        names = list(dict.fromkeys(name for name in names if name))
+        if len(names) < 2:
+            return {}
+        before = {name: self.rating(name) for name in names}
+        k_factor = self.k_factor / (len(names) - 1)
+        changes = {}
+        for name in names:
+            expected = actual = 0.0
+            for opponent in names:
+                if opponent == name:
+                    continue
+                expected += expected_score(before[name], before[opponent])
+                if winner is None:
+                    actual += 0.5
+                elif name == winner:
+                    actual += 1.0
+            changes[name] = round(k_factor * (actual - expected))
+
+        for name in names:
+            rating = self.clamp(before[name] + changes[name])
+            if name in self.ratings:
+                self.index.remove(name, self.ratings[name])
+            self.ratings[name] = rating
+            self.index.add(name, rating)
+        self.games += 1
+        return {name: {"elo": self.ratings[name], "change": self.ratings[name] - before[name],
+                       "rank": self.index.above(self.ratings[name]) + 1} for name in names}
+
+    def leaderboard(self, offset: int = 0, limit: int = LEADERBOARD_PAGE_SIZE) -> Dict:
+        return {
+            "total": len(self.index),
+            "offset": offset,
+            "players": [{"rank": rank, "name": name, "elo": rating}
+                        for rank, name, rating in self.index.page(offset, limit)]
+        }
+
+    def stats(self) -> dict:
+        return {"players": len(self.ratings), "games": self.games}
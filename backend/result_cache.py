@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from admission import AdmissionQueue
+from executors import Executor
+from log import get_logger
+
+# Load environment variables
+load_dotenv()
+
+logger = get_logger("result_cache")
+
+# Judged submissions kept for reuse (0 disables the cache) and how long they stay valid
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "600"))
+
+# Verdicts that depend on load rather than on the code are never reused
+UNCACHEABLE_STATUSES = {"Time Limit Exceeded"}
+
+def normalize_source(code: str) -> str:
+    """Source with line endings normalized to \\n
+
+    Only line endings: trailing whitespace can sit inside a string
+    literal or turn a line continuation into a syntax error, and blank
+    lines shift the line numbers in error output.
+    """
+    return code.replace("\r\n", "\n").replace("\r", "\n")
+
+def test_set_version(test_cases: list) -> str:
+    """Content hash identifying a set of test cases"""
+    encoded = json.dumps([[case["input"], case["expected_output"]] for case in test_cases])
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def submission_key(code: str, language: str, version: str) -> str:
+    digest = hashlib.sha256()
+    for part in (language, version, normalize_source(code)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class InFlight:
+    """A submission being judged, shared by identical requests"""
+    __slots__ = ("task", "verdicts", "listeners", "waiters")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.verdicts: List[dict] = []
+        self.listeners: List = []
+        self.waiters = 0
+
+class CachedExecutor(Executor):
+    """Executor wrapper that reuses results of identical submissions
+
+    Results are keyed by a hash of the normalized source, the language
+    and the test set, and kept in an LRU map with a TTL. An identical
+    submission arriving while the first is still being judged waits for
+    that run instead of starting another; it still gets each verdict
+    through on_result (replayed from the cache on a hit). A cancelled
+    waiter leaves the run going for the others, but once every waiter
+    is gone the run is cancelled too. Only complete
+    runs are cached: any infrastructure error, time limit verdict or
+    early stop means the next identical submission is judged again. A
+    backend that is not cacheable (the fake one) is passed straight
+    through.
+
+    Runs that do reach the backend go through the admission queue, if
+    given: group (the lobby) decides whose turn it is when runs have to
+    wait, and a full queue raises admission.Overloaded before anything
+    is started.
+    """
+
+    def __init__(self, backend: Executor, max_entries: int = RESULT_CACHE_SIZE,
+                 ttl: float = RESULT_CACHE_TTL, admission: Optional[AdmissionQueue] = None):
+        self.backend = backend
+        self.admission = admission
+        self.name = backend.name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Tuple[float, dict, List[dict]]]" = OrderedDict()
+        self.in_flight: Dict[Tuple[str, bool], InFlight] = {}
+        self.hits = 0
+        self.deduplicated = 0
+        self.misses = 0
+
+    async def start(self):
+        await self.backend.start()
+
+    async def stop(self):
+        await self.backend.stop()
+
+    async def run(self, code: str, test_cases: list, on_result=None, stop_on_failure: bool = False,
+                  language: str = "python", version: Optional[str] = None, group: Optional[str] = None) -> dict:
+        if self.max_entries <= 0 or not self.backend.cacheable:
+            if self.admission is not None:
+                self.admission.check()
+            self.misses += 1
+            return await self.judge(code, test_cases, on_result, stop_on_failure, group)
+
+        key = submission_key(code, language, version or test_set_version(test_cases))
+
+        cached = self.lookup(key)
+        if cached is not None:
+            self.hits += 1
+            result, verdicts = cached
+            if on_result:
+                for verdict in verdicts:
+                    await on_result(verdict)
+            return dict(result)
+
+        # A full run cannot share a run that may stop early, so the mode is part of the key
+        flight = self.in_flight.get((key, stop_on_failure))
+        if flight is not None:
+            self.deduplicated += 1
+        else:
+            if self.admission is not None:
+                self.admission.check()
+            self.misses += 1
+            flight = InFlight()
+            flight.task = asyncio.create_task(self.execute(key, flight, code, test_cases, stop_on_failure, group))
+            self.in_flight[(key, stop_on_failure)] = flight
+
+        # Follow the shared run and catch up on verdicts already in
+        flight.waiters += 1
+        try:
+            if on_result:
+                earlier = list(flight.verdicts)
+                flight.listeners.append(on_result)
+                for verdict in earlier:
+                    await on_result(verdict)
+            # Shielded: a superseded submission must not cancel the run for others
+            return dict(await asyncio.shield(flight.task))
+        finally:
+            flight.waiters -= 1
+            if on_result in flight.listeners:
+                flight.listeners.remove(on_result)
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is left to use the result: stop judging, and let a new identical run start fresh
+                self.forget(key, stop_on_failure, flight)
+                flight.task.cancel()
+
+    async def judge(self, code: str, test_cases: list, on_result, stop_on_failure: bool,
+                    group: Optional[str]) -> dict:
+        """Run on the backend once admitted"""
+        if self.admission is None:
+            return await self.backend.run(code, test_cases, on_result=on_result, stop_on_failure=stop_on_failure)
+        async with self.admission.slot(group):
+            return await self.backend.run(code, test_cases, on_result=on_result, stop_on_failure=stop_on_failure)
+
+    async def execute(self, key: str, flight: InFlight, code: str, test_cases: list, stop_on_failure: bool,
+                      group: Optional[str]) -> dict:
+        """Run the submission once, fanning verdicts out to every waiter"""
+        async def on_result(verdict: dict):
+            flight.verdicts.append(verdict)
+            for listener in list(flight.listeners):
+                try:
+                    await listener(verdict)
+                except Exception as e:
+                    logger.error("verdict_delivery_failed", error=str(e))
+
+        try:
+            result = await self.judge(code, test_cases, on_result, stop_on_failure, group)
+        finally:
+            self.forget(key, stop_on_failure, flight)
+
+        complete = len(flight.verdicts) == len(test_cases) and len(result.get("errors", [])) == sum(
+            1 for verdict in flight.verdicts if verdict["error"])
+        if complete and not any(verdict["status"] in UNCACHEABLE_STATUSES for verdict in flight.verdicts):
+            self.store(key, result, sorted(flight.verdicts, key=lambda verdict: verdict["test"]))
+        return result
+
+    def forget(self, key: str, stop_on_failure: bool, flight: InFlight):
+        if self.in_flight.get((key, stop_on_failure)) is flight:
+            del self.in_flight[(key, stop_on_failure)]
+
+    def lookup(self, key: str) -> Optional[Tuple[dict, List[dict]]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, result, verdicts = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return result, verdicts
+
+    def store(self, key: str, result: dict, verdicts: List[dict]):
+        self.entries[key] = (time.monotonic() + self.ttl, result, verdicts)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Cache counters; every hit or deduplicated request saved a judge run"""
+        requests = self.hits + self.deduplicated + self.misses
+        return {
+            "hits": self.hits,
+            "deduplicated": self.deduplicated,
+            "misses": self.misses,
+            "hitRatio": (self.hits + self.deduplicated) / requests if requests else 0.0,
+            "entries": len(self.entries),
+            "inFlight": len(self.in_flight)
+        }
@@ -0,0 +1,111 @@
+"""Single-use sandbox worker for the local executor
+
+Started ahead of time by LocalExecutor so interpreter startup is off the
+submission path. On Linux it first moves into a network namespace of its
+own (no interfaces but a downed loopback) and, when started as root,
+switches to the unprivileged SANDBOX_UID, so the submission can neither
+reach the network nor read the server's /proc (its environment holds
+secrets). It then writes one ready byte to stdout: "R" when both worked,
+"P" when isolation is partial. It reads one JSON header line from stdin
+(code and limits), applies rlimits to itself and runs the submission as
+__main__ with the rest of stdin as its input. Exit codes: the
+submission's own status, 1 for an uncaught exception, 113 for a syntax
+error.
+"""
+import ctypes
+import json
+import os
+import sys
+import traceback
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+EXIT_COMPILE_ERROR = 113
+
+# Standard library modules solutions commonly use, imported while the files
+# are still readable (the interpreter may live where SANDBOX_UID cannot look)
+PRELOAD = ("array", "bisect", "collections", "copy", "dataclasses", "decimal", "fractions",
+           "functools", "heapq", "itertools", "math", "operator", "random", "re",
+           "statistics", "string", "typing")
+
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+PR_SET_NO_NEW_PRIVS = 38
+
+def isolate(uid: int) -> bool:
+    """Leave the network and, as root, drop to uid; True if both happened"""
+    if not sys.platform.startswith("linux"):
+        return False
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0)
+    if os.geteuid() == 0:
+        networked = libc.unshare(CLONE_NEWNET) != 0
+        os.setgroups([])
+        os.setgid(uid)
+        os.setuid(uid)
+        return not networked
+    # Without root a user namespace is needed to get a network namespace; the
+    # server's /proc stays readable since the worker keeps the server's uid
+    libc.unshare(CLONE_NEWUSER | CLONE_NEWNET)
+    return False
+
+def apply_limits(cpu_seconds: int, memory_bytes: int):
+    """Cap CPU time, address space, file writes, open files and processes"""
+    if resource is None:
+        return
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (1024 * 1024, 1024 * 1024))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (32, 32))
+    # No new processes or threads (counted per user, so a fork bomb fails at once)
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+
+def main():
+    for name in PRELOAD:
+        __import__(name)
+    isolated = isolate(int(os.environ.get("SANDBOX_UID", "65534")))
+
+    # Signal readiness so the pool only hands out fully started interpreters
+    sys.stdout.buffer.write(b"R" if isolated else b"P")
+    sys.stdout.flush()
+
+    header = sys.stdin.buffer.readline()
+    if not header:
+        return
+    job = json.loads(header)
+
+    try:
+        program = compile(job["code"], "solution.py", "exec")
+    except (SyntaxError, ValueError):
+        traceback.print_exc(limit=0)
+        sys.stderr.flush()
+        os._exit(EXIT_COMPILE_ERROR)
+
+    apply_limits(job["cpu_seconds"], job["memory_bytes"])
+
+    status = 0
+    try:
+        exec(program, {"__name__": "__main__", "__builtins__": __builtins__})
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            status = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            status = 1
+    except BaseException:
+        # Hide this worker's frame so the traceback points at the submission
+        exc_type, exc_value, exc_tb = sys.exc_info()
+        traceback.print_exception(exc_type, exc_value, exc_tb.tb_next)
+        status = 1
+
+    # Skip interpreter teardown so measured runtime is the submission's own
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(status)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import asyncio
+import math
+import os
+from typing import Callable, List, Optional, Set
+
+from dotenv import load_dotenv
+from log import get_logger
+
+# Load environment variables
+load_dotenv()
+
+logger = get_logger("scheduler")
+
+# Timer resolution in seconds and slots in the wheel (one revolution = tick * slots)
+SCHEDULER_TICK = float(os.getenv("SCHEDULER_TICK", "0.1"))
+SCHEDULER_SLOTS = int(os.getenv("SCHEDULER_SLOTS", "1024"))
+
+class Timer:
+    """A scheduled callback; cancel() removes it from the wheel in O(1)"""
+    __slots__ = ("scheduler", "deadline", "callback", "args", "slot")
+
+    def __init__(self, scheduler: "Scheduler", deadline: int, callback: Callable, args: tuple):
+        self.scheduler = scheduler
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.slot: Optional[Set["Timer"]] = None
+
+    @property
+    def active(self) -> bool:
+        return self.slot is not None
+
+    def cancel(self):
+        if self.slot is not None:
+            self.slot.discard(self)
+            self.slot = None
+            self.scheduler.count -= 1
+
+class Scheduler:
+    """Hashed timer wheel driving every game and connection timer from one task
+
+    A timer lands in slot deadline % slots; each tick the task visits one
+    slot and fires the timers that are due, leaving longer timers for a
+    later revolution. Scheduling and cancelling are set operations, so
+    tens of thousands of lobbies cost one Timer each instead of one
+    sleeping task each. Callbacks may be plain functions or coroutine
+    functions; coroutines run as tasks so a slow one never delays the wheel.
+    """
+
+    def __init__(self, tick: float = SCHEDULER_TICK, slots: int = SCHEDULER_SLOTS):
+        self.tick = tick
+        self.wheel: List[Set[Timer]] = [set() for _ in range(slots)]
+        self.current = 0
+        self.count = 0
+        self.started_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.running: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def call_later(self, delay: float, callback: Callable, *args) -> Timer:
+        """Run callback(*args) after delay seconds (rounded up to the next tick)"""
+        deadline = self.current + max(1, math.ceil(delay / self.tick))
+        timer = Timer(self, deadline, callback, args)
+        timer.slot = self.wheel[deadline % len(self.wheel)]
+        timer.slot.add(timer)
+        self.count += 1
+        return timer
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for task in list(self.running):
+            task.cancel()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.started_at = loop.time() - self.current * self.tick
+        while True:
+            # Sleep to the next tick boundary; catch up on every tick missed while busy
+            due = self.started_at + (self.current + 1) * self.tick
+            await asyncio.sleep(max(0.0, due - loop.time()))
+            target = int((loop.time() - self.started_at) / self.tick)
+            while self.current < target:
+                self.current += 1
+                self.advance()
+
+    def advance(self) -> int:
+        """Fire the timers due at the current tick; returns how many fired"""
+        slot = self.wheel[self.current % len(self.wheel)]
+        if not slot:
+            return 0
+        due = [timer for timer in slot if timer.deadline <= self.current]
+        for timer in due:
+            timer.cancel()
+            self.fire(timer)
+        return len(due)
+
+    def fire(self, timer: Timer):
+        try:
+            result = timer.callback(*timer.args)
+            if asyncio.iscoroutine(result):
+                task = asyncio.create_task(result)
+                self.running.add(task)
+                task.add_done_callback(self.finished)
+        except Exception as e:
+            logger.error("timer_failed", callback=getattr(timer.callback, "__name__", "?"), error=str(e))
+
+    def finished(self, task: asyncio.Task):
+        self.running.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error("timer_task_failed", task=task.get_coro().__name__, error=str(task.exception()))
@@ -0,0 +1,73 @@
+import os
+import secrets
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from client_tasks import ClientTasks
+from scheduler import Timer
+
+# Load environment variables
+load_dotenv()
+
+# Seconds a dropped connection's player slot is held for it to resume (0 disables resuming)
+SESSION_GRACE_PERIOD = float(os.getenv("SESSION_GRACE_PERIOD", "30"))
+
+# Most recent messages kept per session for replay after a reconnect
+SESSION_REPLAY_LIMIT = int(os.getenv("SESSION_REPLAY_LIMIT", "64"))
+
+class Session:
+    """A client across connections: its id, resume token and background tasks
+
+    The token is issued once, in the "session" event. A client that loses
+    its connection reconnects with /ws?session=<token>&seq=<n>, where n is
+    the number of messages it has received in the session so far (the
+    session event included). The server answers with session_resumed
+    and resends what the client missed from the outbox history, or, when
+    that is no longer kept, a snapshot of its lobby to resync from.
+    """
+    __slots__ = ("client_id", "token", "tasks", "expiry")
+
+    def __init__(self, client_id: str, token: str):
+        self.client_id = client_id
+        self.token = token
+        self.tasks = ClientTasks(client_id)
+        # Grace timer while the client is disconnected
+        self.expiry: Optional[Timer] = None
+
+    @property
+    def detached(self) -> bool:
+        return self.expiry is not None
+
+class SessionStore:
+    """Sessions on this worker by token and by client id"""
+
+    def __init__(self):
+        self.by_token: Dict[str, Session] = {}
+        self.by_client: Dict[str, Session] = {}
+
+    def __len__(self) -> int:
+        return len(self.by_client)
+
+    def create(self, client_id: str) -> Session:
+        session = Session(client_id, secrets.token_urlsafe(24))
+        self.by_token[session.token] = session
+        self.by_client[client_id] = session
+        return session
+
+    def find(self, token: Optional[str]) -> Optional[Session]:
+        return self.by_token.get(token) if token else None
+
+    def get(self, client_id: str) -> Optional[Session]:
+        return self.by_client.get(client_id)
+
+    def remove(self, client_id: str) -> Optional[Session]:
+        session = self.by_client.pop(client_id, None)
+        if session is not None:
+            del self.by_token[session.token]
+            if session.expiry is not None:
+                session.expiry.cancel()
+                session.expiry = None
+        return session
+
+    def detached(self) -> int:
+        return sum(1 for session in self.by_client.values() if session.detached)
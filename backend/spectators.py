@@ -0,0 +1,104 @@
+import asyncio
+import os
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from log import get_logger
+from metrics import FANOUT_RECIPIENTS, FANOUT_SECONDS
+from protocol import Message
+
+logger = get_logger("spectators")
+
+# Seconds between progress_update messages to a lobby's spectators
+SPECTATOR_PROGRESS_INTERVAL = float(os.getenv("SPECTATOR_PROGRESS_INTERVAL", "1.0"))
+
+# Most spectators one lobby accepts
+SPECTATOR_LIMIT = int(os.getenv("SPECTATOR_LIMIT", "1000"))
+
+# Lobby events spectators see (progress_update is sampled separately; test
+# verdicts and results stay private to the submitting player)
+SPECTATOR_EVENTS = {
+    "player_joined", "player_left", "player_ready_update", "countdown_start",
+    "countdown_update", "countdown_cancelled", "game_start", "game_finished"
+}
+
+# Events where a spectator who is behind only needs the newest one
+SPECTATOR_COALESCE = {"player_ready_update", "countdown_update", "progress_update"}
+
+class SpectatorFeed:
+    """Spectators per lobby, fed separately from the lobby's players
+
+    publish() only collects the lobby's encoded messages; they are pushed
+    to every spectator in one loop callback after the current handler has
+    finished, so however many watch a match, its players' outboxes are
+    queued (and their writers started) first. Spectators share the
+    message objects, so each is encoded once per wire format no matter
+    how many receive it.
+    """
+
+    def __init__(self, push: Callable[[str, Message, Optional[str]], None]):
+        self.push = push
+        self.lobbies: Dict[str, Set[str]] = {}
+        self.watching: Dict[str, str] = {}
+        self.pending: Dict[str, List[Tuple[Message, Optional[str]]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.watching)
+
+    def count(self, lobby_id: str) -> int:
+        return len(self.lobbies.get(lobby_id, ()))
+
+    def lobby_of(self, client_id: str) -> Optional[str]:
+        return self.watching.get(client_id)
+
+    def add(self, client_id: str, lobby_id: str):
+        """Watch a lobby, instead of any lobby watched before"""
+        self.remove(client_id)
+        self.watching[client_id] = lobby_id
+        self.lobbies.setdefault(lobby_id, set()).add(client_id)
+
+    def remove(self, client_id: str) -> Optional[str]:
+        """Stop watching; returns the lobby that was watched"""
+        lobby_id = self.watching.pop(client_id, None)
+        if lobby_id is not None:
+            spectators = self.lobbies[lobby_id]
+            spectators.discard(client_id)
+            if not spectators:
+                del self.lobbies[lobby_id]
+                self.pending.pop(lobby_id, None)
+        return lobby_id
+
+    def close(self, lobby_id: str, message: Optional[Message] = None) -> Set[str]:
+        """Send a last message, then drop every spectator of a closing lobby"""
+        if message is not None:
+            self.publish(lobby_id, message)
+        self.flush(lobby_id)
+        spectators = self.lobbies.pop(lobby_id, set())
+        for client_id in spectators:
+            del self.watching[client_id]
+        return spectators
+
+    def publish(self, lobby_id: str, message: Message, coalesce_key: Optional[str] = None):
+        """Queue a message for the lobby's spectators at the end of this loop iteration"""
+        if lobby_id not in self.lobbies:
+            return
+        pending = self.pending.get(lobby_id)
+        if pending is None:
+            pending = self.pending[lobby_id] = []
+            asyncio.get_running_loop().call_soon(self.flush, lobby_id)
+        pending.append((message, coalesce_key))
+
+    def flush(self, lobby_id: str):
+        messages = self.pending.pop(lobby_id, None)
+        spectators = self.lobbies.get(lobby_id)
+        if not messages or not spectators:
+            return
+        started = time.perf_counter()
+        try:
+            for client_id in list(spectators):
+                for message, coalesce_key in messages:
+                    self.push(client_id, message, coalesce_key)
+        except Exception as e:
+            logger.error("spectator_fanout_failed", lobby_id=lobby_id, error=str(e))
+        FANOUT_SECONDS.labels("spectators").observe(time.perf_counter() - started)
+        FANOUT_RECIPIENTS.labels("spectators").observe(len(spectators))
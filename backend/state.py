@@ -0,0 +1,257 @@
+import asyncio
+import json
+import os
+import socket
+from typing import Awaitable, Callable, List, Optional, Set
+
+from dotenv import load_dotenv
+from log import get_logger
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # Only needed for STATE_BACKEND=redis
+    redis = None
+
+# Load environment variables
+load_dotenv()
+
+logger = get_logger("state")
+
+# Shared state backend: memory (single process) or redis (multiple workers)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = os.getenv("REDIS_PREFIX", "shibacoder")
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+# Workers refresh a liveness key; workers that stop refreshing are presumed
+# crashed and their lobbies removed at the next heartbeat of any other worker
+WORKER_HEARTBEAT = float(os.getenv("WORKER_HEARTBEAT", "10"))
+WORKER_TTL = int(os.getenv("WORKER_TTL", "30"))
+
+MessageHandler = Callable[[dict], Awaitable[None]]
+
+class StateBackend:
+    """Lobby directory and messaging shared between server workers
+
+    Every lobby lives in the memory of the worker that created it (its
+    owner), so all traffic between players on one worker stays local.
+    The backend lets workers share lobby summaries for the lobby list and
+    send each other messages, e.g. to forward a client's events to the
+    worker that owns its lobby or to deliver events to a client connected
+    to another worker.
+    """
+    name = "base"
+    shared = False
+
+    def __init__(self, worker_id: str = WORKER_ID):
+        self.worker_id = worker_id
+
+    async def start(self, on_message: MessageHandler):
+        """Begin delivering messages addressed to this worker to on_message"""
+
+    async def stop(self):
+        pass
+
+    async def send_to_worker(self, worker_id: str, message: dict):
+        """Send a message to one worker"""
+
+    async def broadcast(self, message: dict):
+        """Send a message to every other worker"""
+
+    async def save_lobby(self, summary: dict):
+        """Store the shareable summary of a lobby owned by this worker"""
+
+    async def delete_lobby(self, lobby_id: str):
+        pass
+
+    async def load_lobbies(self) -> List[dict]:
+        """Summaries of lobbies owned by live workers (used at startup)"""
+        return []
+
+class MemoryStateBackend(StateBackend):
+    """Single-process backend: every lobby is local, so there is nothing to share"""
+    name = "memory"
+
+class RedisStateBackend(StateBackend):
+    """Redis-backed backend for running several workers or instances
+
+    Lobby summaries are kept in a hash, messages travel over pub/sub with
+    one channel per worker plus a broadcast channel. Works against any
+    server speaking the Redis protocol (redis-server, fakeredis).
+
+    A worker that shuts down announces it with "worker_stopped"; one that
+    crashes is noticed by the others once its liveness key expires: each
+    heartbeat checks the owners of the listed lobbies and the workers
+    heard from, deletes a dead worker's lobbies and sends
+    "worker_stopped" on its behalf (handled locally as well).
+    """
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str = REDIS_URL, client=None, worker_id: str = WORKER_ID,
+                 prefix: str = REDIS_PREFIX):
+        super().__init__(worker_id)
+        if client is None and redis is None:
+            raise RuntimeError("STATE_BACKEND=redis requires the 'redis' package")
+        self.url = url
+        self.redis = client
+        self.prefix = prefix
+        self.pubsub = None
+        self.tasks: List[asyncio.Task] = []
+        self.on_message: Optional[MessageHandler] = None
+        # Other workers that have sent messages, checked for liveness
+        self.peers: Set[str] = set()
+
+    def channel(self, worker_id: Optional[str] = None) -> str:
+        if worker_id is None:
+            return f"{self.prefix}:broadcast"
+        return f"{self.prefix}:worker:{worker_id}"
+
+    @property
+    def lobbies_key(self) -> str:
+        return f"{self.prefix}:lobbies"
+
+    def alive_key(self, worker_id: str) -> str:
+        return f"{self.prefix}:alive:{worker_id}"
+
+    async def start(self, on_message: MessageHandler):
+        if self.redis is None:
+            self.redis = redis.from_url(self.url)
+        await self.redis.set(self.alive_key(self.worker_id), 1, ex=WORKER_TTL)
+        self.on_message = on_message
+
+        self.pubsub = self.redis.pubsub()
+        await self.pubsub.subscribe(self.channel(self.worker_id), self.channel())
+        self.tasks = [
+            asyncio.create_task(self.listen(on_message)),
+            asyncio.create_task(self.heartbeat())
+        ]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+            self.pubsub = None
+        if self.redis is not None:
+            await self.redis.delete(self.alive_key(self.worker_id))
+            await self.redis.aclose()
+
+    async def listen(self, on_message: MessageHandler):
+        while True:
+            try:
+                async for item in self.pubsub.listen():
+                    if item["type"] == "message":
+                        await self.dispatch(item["data"], on_message)
+            except Exception as e:
+                # pubsub resubscribes to its channels when it reconnects
+                logger.warning("redis_pubsub_lost", error=str(e))
+                await asyncio.sleep(1)
+
+    async def dispatch(self, data: bytes, on_message: MessageHandler):
+        message = json.loads(data)
+        if message.get("origin") == self.worker_id:
+            return
+        if message.get("type") == "worker_stopped":
+            self.peers.discard(message.get("worker", message.get("origin")))
+        else:
+            self.peers.add(message.get("origin"))
+        try:
+            await on_message(message)
+        except Exception as e:
+            logger.error("worker_message_failed", type=message.get("type"), origin=message.get("origin"), error=str(e))
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(WORKER_HEARTBEAT)
+            try:
+                await self.redis.set(self.alive_key(self.worker_id), 1, ex=WORKER_TTL)
+                await self.prune_dead_workers()
+            except Exception as e:
+                logger.warning("worker_heartbeat_failed", error=str(e))
+
+    async def prune_dead_workers(self):
+        """Remove the lobbies of workers whose liveness key has expired and announce them"""
+        summaries = {lobby_id: json.loads(value)
+                     for lobby_id, value in (await self.redis.hgetall(self.lobbies_key)).items()}
+        workers = list(({summary["owner"] for summary in summaries.values()} | self.peers) - {self.worker_id})
+        if not workers:
+            return
+        alive = await self.redis.mget([self.alive_key(worker) for worker in workers])
+        for worker, flag in zip(workers, alive):
+            if flag:
+                continue
+            stale = [lobby_id for lobby_id, summary in summaries.items() if summary["owner"] == worker]
+            if stale:
+                await self.redis.hdel(self.lobbies_key, *stale)
+            logger.warning("worker_lost", worker=worker, lobbies=len(stale))
+            message = {"type": "worker_stopped", "worker": worker}
+            await self.broadcast(message)
+            await self.dispatch(json.dumps({**message, "origin": worker}), self.on_message)
+
+    async def publish(self, channel: str, message: dict):
+        await self.redis.publish(channel, json.dumps({**message, "origin": self.worker_id}))
+
+    async def send_to_worker(self, worker_id: str, message: dict):
+        await self.publish(self.channel(worker_id), message)
+
+    async def broadcast(self, message: dict):
+        await self.publish(self.channel(), message)
+
+    async def save_lobby(self, summary: dict):
+        await self.redis.hset(self.lobbies_key, summary["id"], json.dumps(summary))
+
+    async def delete_lobby(self, lobby_id: str):
+        await self.redis.hdel(self.lobbies_key, lobby_id)
+
+    async def load_lobbies(self) -> List[dict]:
+        summaries = [json.loads(value) for value in (await self.redis.hgetall(self.lobbies_key)).values()]
+        owners = list({summary["owner"] for summary in summaries})
+        if not owners:
+            return []
+        alive = await self.redis.mget([self.alive_key(owner) for owner in owners])
+        live_owners = {owner for owner, flag in zip(owners, alive) if flag}
+        return [summary for summary in summaries if summary["owner"] in live_owners]
+
+STATE_BACKENDS = {
+    "memory": MemoryStateBackend,
+    "redis": RedisStateBackend
+}
+
+def create_state_backend(name: str = STATE_BACKEND) -> StateBackend:
+    """Instantiate the backend selected by STATE_BACKEND"""
+    if name not in STATE_BACKENDS:
+        raise ValueError(f"Unknown state backend '{name}' (expected one of {', '.join(STATE_BACKENDS)})")
+    return STATE_BACKENDS[name]()
+
+class RemoteSocket:
+    """Stand-in websocket for a client connected to another worker
+
+    The owner of a lobby wraps one of these in an Outbox for every player
+    whose connection lives elsewhere, so broadcast_to_lobby reaches them
+    like any local player: each message is relayed to the worker holding
+    the real socket, which encodes it and pushes it to the client.
+    """
+
+    def __init__(self, state: StateBackend, worker_id: str, client_id: str):
+        self.state = state
+        self.worker_id = worker_id
+        self.client_id = client_id
+
+    async def send_message(self, message):
+        # Sent unencoded: the client's worker renders it in the client's protocol
+        await self.state.send_to_worker(self.worker_id, {
+            "type": "deliver",
+            "client_id": self.client_id,
+            "event": message.event,
+            "data": message.data,
+            "compact": message.compact
+        })
+
+    async def close(self, code: int = 1000):
+        await self.state.send_to_worker(self.worker_id, {
+            "type": "drop",
+            "client_id": self.client_id,
+            "code": code
+        })
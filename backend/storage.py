@@ -0,0 +1,372 @@
+import asyncio
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from log import get_logger
+
+try:
+    import asyncpg
+except ImportError:  # Only needed for Postgres
+    asyncpg = None
+
+# Load environment variables
+load_dotenv()
+
+logger = get_logger("storage")
+
+# Where match results are stored: sqlite:///path for local runs,
+# postgresql://... in production, or empty to keep nothing
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///shibacoder.db")
+
+# Connections kept open to the database
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "4"))
+
+# Write-behind queue: results written per transaction, how long a partial
+# batch waits for more, and how many results may wait before new ones are dropped
+STORAGE_BATCH_SIZE = int(os.getenv("STORAGE_BATCH_SIZE", "200"))
+STORAGE_FLUSH_INTERVAL = float(os.getenv("STORAGE_FLUSH_INTERVAL", "0.5"))
+STORAGE_QUEUE_LIMIT = int(os.getenv("STORAGE_QUEUE_LIMIT", "10000"))
+STORAGE_RETRIES = int(os.getenv("STORAGE_RETRIES", "3"))
+
+# Tables for SQLite; Postgres uses database_schema.sql at the repository root
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+  id text primary key,
+  username text not null unique,
+  elo integer default 1000,
+  created_at text default current_timestamp
+);
+CREATE TABLE IF NOT EXISTS matches (
+  id text primary key,
+  lobby_id text not null,
+  problem_id text,
+  winner_id text references users(id) on delete set null,
+  started_at text,
+  ended_at text not null
+);
+CREATE TABLE IF NOT EXISTS match_players (
+  match_id text references matches(id) on delete cascade,
+  user_id text references users(id) on delete cascade,
+  tests_passed integer not null default 0,
+  total_tests integer not null default 0,
+  completed boolean not null default false,
+  completion_time real,
+  primary key (match_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_matches_ended_at ON matches(ended_at);
+CREATE INDEX IF NOT EXISTS idx_match_players_user_id ON match_players(user_id);
+"""
+
+# Statements use "?" placeholders; Postgres gets them renumbered as $1, $2, ...
+INSERT_USER = "INSERT INTO users (id, username) VALUES (?, ?) ON CONFLICT (username) DO NOTHING"
+INSERT_MATCH = (
+    "INSERT INTO matches (id, lobby_id, problem_id, winner_id, started_at, ended_at) "
+    "VALUES (?, ?, ?, (SELECT id FROM users WHERE username = ?), ?, ?)"
+)
+INSERT_MATCH_PLAYER = (
+    "INSERT INTO match_players (match_id, user_id, tests_passed, total_tests, completed, completion_time) "
+    "VALUES (?, (SELECT id FROM users WHERE username = ?), ?, ?, ?, ?) ON CONFLICT DO NOTHING"
+)
+UPDATE_USER_ELO = "UPDATE users SET elo = ? WHERE username = ?"
+
+Batch = List[Tuple[str, List[tuple]]]
+
+class Database:
+    """Pooled async access to the database
+
+    execute_batch runs several executemany statements in one transaction;
+    fetch returns rows as tuples. Statements are written with "?"
+    placeholders and must be valid in both SQLite and Postgres.
+    """
+    name = "none"
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def execute_batch(self, statements: Batch):
+        raise NotImplementedError
+
+    async def fetch(self, sql: str, args: Sequence = ()) -> List[tuple]:
+        raise NotImplementedError
+
+class SqliteDatabase(Database):
+    """SQLite through a pool of connections, each used on its own thread
+
+    sqlite3 blocks, so every call runs in a dedicated thread pool (kept
+    apart from the judging offload pool) with a connection checked out
+    of an asyncio queue. WAL mode lets reads proceed during a write.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str, pool_size: int = DATABASE_POOL_SIZE):
+        self.path = path
+        self.pool_size = max(1, pool_size)
+        self.threads: Optional[ThreadPoolExecutor] = None
+        self.connections: Optional[asyncio.Queue] = None
+
+    async def start(self):
+        self.threads = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="sqlite")
+        self.connections = asyncio.Queue()
+        for _ in range(self.pool_size):
+            self.connections.put_nowait(await self.run_in_thread(self.connect))
+
+        connection = await self.connections.get()
+        try:
+            await self.run_in_thread(connection.executescript, SQLITE_SCHEMA)
+        finally:
+            self.connections.put_nowait(connection)
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        connection.execute("PRAGMA busy_timeout=5000")
+        return connection
+
+    async def stop(self):
+        if self.connections is not None:
+            while not self.connections.empty():
+                self.connections.get_nowait().close()
+            self.connections = None
+        if self.threads is not None:
+            self.threads.shutdown(wait=True)
+            self.threads = None
+
+    async def run_in_thread(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.threads, func, *args)
+
+    async def execute_batch(self, statements: Batch):
+        connection = await self.connections.get()
+        try:
+            await self.run_in_thread(self.write, connection, statements)
+        finally:
+            self.connections.put_nowait(connection)
+
+    @staticmethod
+    def write(connection: sqlite3.Connection, statements: Batch):
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, rows in statements:
+                connection.executemany(sql, [tuple(
+                    value.isoformat() if isinstance(value, datetime) else value for value in row
+                ) for row in rows])
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    async def fetch(self, sql: str, args: Sequence = ()) -> List[tuple]:
+        connection = await self.connections.get()
+        try:
+            return await self.run_in_thread(lambda: connection.execute(sql, tuple(args)).fetchall())
+        finally:
+            self.connections.put_nowait(connection)
+
+def numbered_placeholders(sql: str) -> str:
+    """Rewrite "?" placeholders as Postgres's $1, $2, ..."""
+    parts = sql.split("?")
+    return "".join(part + (f"${i + 1}" if i < len(parts) - 1 else "") for i, part in enumerate(parts))
+
+class PostgresDatabase(Database):
+    """Postgres through an asyncpg connection pool"""
+    name = "postgres"
+
+    def __init__(self, url: str, pool_size: int = DATABASE_POOL_SIZE):
+        if asyncpg is None:
+            raise RuntimeError("DATABASE_URL points to Postgres but asyncpg is not installed")
+        self.url = url
+        self.pool_size = max(1, pool_size)
+        self.pool = None
+
+    async def start(self):
+        self.pool = await asyncpg.create_pool(self.url, min_size=1, max_size=self.pool_size)
+
+    async def stop(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def execute_batch(self, statements: Batch):
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                for sql, rows in statements:
+                    await connection.executemany(numbered_placeholders(sql), rows)
+
+    async def fetch(self, sql: str, args: Sequence = ()) -> List[tuple]:
+        async with self.pool.acquire() as connection:
+            return [tuple(row) for row in await connection.fetch(numbered_placeholders(sql), *args)]
+
+def create_database(url: str = DATABASE_URL) -> Optional[Database]:
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SqliteDatabase(url[len("sqlite:///"):])
+    if url.startswith(("postgres://", "postgresql://")):
+        return PostgresDatabase(url)
+    raise ValueError(f"Unsupported DATABASE_URL '{url}' (expected sqlite:/// or postgresql://)")
+
+def to_timestamp(seconds: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(seconds, timezone.utc) if seconds is not None else None
+
+@dataclass(slots=True)
+class PlayerResult:
+    name: str
+    tests_passed: int
+    total_tests: int
+    completed: bool
+    completion_time: Optional[float] = None
+
+@dataclass(slots=True)
+class MatchResult:
+    """A finished game as it is written to the database"""
+    lobby_id: str
+    problem_id: Optional[str]
+    winner: Optional[str]
+    started_at: Optional[float]
+    ended_at: float
+    players: List[PlayerResult]
+    # New ratings of everyone rated for the game, including players who left it
+    ratings: Dict[str, int] = field(default_factory=dict)
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+
+class MatchStore:
+    """Write-behind queue of finished games
+
+    record() only appends to a bounded queue, so the game never waits on
+    the database. A background writer drains it in batches of up to
+    STORAGE_BATCH_SIZE results, each batch in a single transaction along
+    with the players' new ratings (in game order, so the last one wins); a
+    failed batch is retried with backoff and dropped after STORAGE_RETRIES
+    attempts. stop() writes whatever is still queued.
+    """
+
+    def __init__(self, database: Optional[Database], batch_size: int = STORAGE_BATCH_SIZE,
+                 flush_interval: float = STORAGE_FLUSH_INTERVAL, queue_limit: int = STORAGE_QUEUE_LIMIT):
+        self.database = database
+        self.name = database.name if database else "none"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_limit)
+        self.writer: Optional[asyncio.Task] = None
+        self.closing = False
+        self.overflowing = False
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed = 0
+
+    async def start(self):
+        if self.database is None:
+            return
+        await self.database.start()
+        self.writer = asyncio.create_task(self.write_loop())
+
+    async def stop(self):
+        if self.writer is not None:
+            # The writer drains the queue before exiting; None wakes it if idle
+            self.closing = True
+            try:
+                self.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+            await self.writer
+            self.writer = None
+        if self.database is not None:
+            await self.database.stop()
+
+    def record(self, result: MatchResult):
+        if self.database is None:
+            return
+        try:
+            self.queue.put_nowait(result)
+        except asyncio.QueueFull:
+            # Logged once per overflow, not once per dropped result
+            if not self.overflowing:
+                logger.warning("storage_queue_full", queued=self.queue.qsize())
+            self.overflowing = True
+            self.dropped += 1
+        else:
+            self.overflowing = False
+
+    def take_batch(self, limit: int) -> List[MatchResult]:
+        batch = []
+        while len(batch) < limit and not self.queue.empty():
+            result = self.queue.get_nowait()
+            if result is not None:
+                batch.append(result)
+        return batch
+
+    async def write_loop(self):
+        while not (self.closing and self.queue.empty()):
+            result = await self.queue.get()
+            batch = [result] if result is not None else []
+
+            # Give a partial batch a moment to fill up (unless shutting down)
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                batch.extend(self.take_batch(self.batch_size - len(batch)))
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or remaining <= 0 or self.closing:
+                    break
+                try:
+                    result = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if result is not None:
+                    batch.append(result)
+            if batch:
+                await self.write_batch(batch)
+
+    async def write_batch(self, batch: List[MatchResult]):
+        statements = self.statements(batch)
+        for attempt in range(STORAGE_RETRIES):
+            try:
+                await self.database.execute_batch(statements)
+                self.written += len(batch)
+                self.batches += 1
+                return
+            except Exception as e:
+                logger.warning("storage_write_failed", results=len(batch), attempt=attempt + 1, error=str(e))
+                await asyncio.sleep(min(2 ** attempt * 0.5, 5.0))
+        self.failed += len(batch)
+
+    @staticmethod
+    def statements(batch: List[MatchResult]) -> Batch:
+        names = sorted({player.name for result in batch for player in result.players}
+                       | {name for result in batch for name in result.ratings})
+        statements = [
+            (INSERT_USER, [(str(uuid.uuid4()), name) for name in names]),
+            (INSERT_MATCH, [(
+                result.id, result.lobby_id, result.problem_id, result.winner,
+                to_timestamp(result.started_at), to_timestamp(result.ended_at)
+            ) for result in batch]),
+            (INSERT_MATCH_PLAYER, [(
+                result.id, player.name, player.tests_passed, player.total_tests,
+                player.completed, player.completion_time
+            ) for result in batch for player in result.players])
+        ]
+        ratings = [(elo, name) for result in batch for name, elo in result.ratings.items()]
+        if ratings:
+            statements.append((UPDATE_USER_ELO, ratings))
+        return statements
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed
+        }
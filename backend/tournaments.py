@@ -0,0 +1,238 @@
+import os
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from scheduler import Timer
+
+# Load environment variables
+load_dotenv()
+
+# Bracket sizes accepted by create_tournament
+TOURNAMENT_MIN_PLAYERS = int(os.getenv("TOURNAMENT_MIN_PLAYERS", "2"))
+TOURNAMENT_MAX_PLAYERS = int(os.getenv("TOURNAMENT_MAX_PLAYERS", "1024"))
+
+# Seconds a tournament takes registrations before it starts with whoever joined
+TOURNAMENT_REGISTRATION_TIMEOUT = float(os.getenv("TOURNAMENT_REGISTRATION_TIMEOUT", "3600"))
+
+# Seconds between seating a match and its countdown, and between two match
+# starts (which spreads a round's judge runs instead of starting them at once)
+TOURNAMENT_MATCH_DELAY = float(os.getenv("TOURNAMENT_MATCH_DELAY", "5"))
+TOURNAMENT_STAGGER = float(os.getenv("TOURNAMENT_STAGGER", "0.05"))
+
+# Seconds between tournament_update summaries to entrants
+TOURNAMENT_UPDATE_INTERVAL = float(os.getenv("TOURNAMENT_UPDATE_INTERVAL", "1.0"))
+
+def bracket_size(players: int) -> int:
+    """Smallest power of two that seats everyone"""
+    size = 2
+    while size < players:
+        size *= 2
+    return size
+
+def seed_positions(size: int) -> List[int]:
+    """Seeds in bracket order, so seeds 1 and 2 can only meet in the final
+
+    [1, 4, 2, 3] for four: round one is 1 v 4 and 2 v 3.
+    """
+    order = [1]
+    while len(order) < size:
+        total = len(order) * 2 + 1
+        order = [seed for top in order for seed in (top, total - top)]
+    return order
+
+@dataclass(slots=True, eq=False)
+class Entrant:
+    """A player registered in a tournament"""
+    client_id: str
+    name: str
+    elo: int
+    seed: int = 0
+    eliminated: bool = False
+    # Left or disconnected; any match still ahead is a walkover for the opponent
+    forfeited: bool = False
+
+@dataclass(slots=True, eq=False)
+class Match:
+    """One bracket match; a slot left None is a bye"""
+    round: int
+    index: int
+    players: List[Optional[Entrant]] = field(default_factory=lambda: [None, None])
+    # Feeder matches decided so far (round one is seeded, so always 2)
+    decided: int = 0
+    winner: Optional[Entrant] = None
+    done: bool = False
+    lobby_id: Optional[str] = None
+
+    def view(self) -> Dict:
+        return {
+            "players": [entrant.name if entrant else None for entrant in self.players],
+            "winner": self.winner.name if self.winner else None,
+            "lobbyId": self.lobby_id
+        }
+
+@dataclass(slots=True, eq=False)
+class Tournament:
+    """A single-elimination bracket
+
+    Players register until the bracket is full or the organizer starts
+    it; they are then seeded by ELO (ties by registration order) into a
+    bracket of the next power of two, top seeds getting the byes. A match
+    is playable once both its feeder matches are decided. Byes, forfeits
+    and empty slots are settled at once without a game, so report() and
+    start() only ever return matches between two players who still want
+    to play. Matches advance independently: a fast half of the bracket
+    does not wait for the rest of its round.
+    """
+    id: str
+    name: str
+    capacity: int
+    created_by: str
+    created_at: float
+    status: str = "registering"
+    entrants: Dict[str, Entrant] = field(default_factory=dict)
+    rounds: List[List[Match]] = field(default_factory=list)
+    by_lobby: Dict[str, Match] = field(default_factory=dict)
+    champion: Optional[Entrant] = None
+    started_at: Optional[float] = None
+    ended_at: Optional[float] = None
+    # Registration deadline, later the cleanup of a finished tournament
+    clock: Optional["Timer"] = field(default=None, repr=False)
+    # Monotonic time the next match may start (see TOURNAMENT_STAGGER)
+    next_start: float = 0.0
+    _view: Optional[Dict] = field(default=None, repr=False)
+
+    def is_full(self) -> bool:
+        return len(self.entrants) >= self.capacity
+
+    def join(self, client_id: str, name: str, elo: int) -> Entrant:
+        entrant = Entrant(client_id, name, elo)
+        self.entrants[client_id] = entrant
+        self.changed()
+        return entrant
+
+    def leave(self, client_id: str) -> Optional[Entrant]:
+        """Unregister, or once started, forfeit whatever is left to play"""
+        entrant = self.entrants.get(client_id)
+        if entrant is None:
+            return None
+        if self.status == "registering":
+            del self.entrants[client_id]
+        else:
+            entrant.forfeited = True
+        self.changed()
+        return entrant
+
+    def start(self) -> List[Match]:
+        """Seed the bracket; returns the first matches to play"""
+        ranked = sorted(self.entrants.values(), key=lambda entrant: -entrant.elo)
+        for seed, entrant in enumerate(ranked, 1):
+            entrant.seed = seed
+        size = bracket_size(len(ranked))
+        self.rounds = []
+        matches = size // 2
+        while matches:
+            self.rounds.append([Match(len(self.rounds), index) for index in range(matches)])
+            matches //= 2
+
+        positions = seed_positions(size)
+        for index, match in enumerate(self.rounds[0]):
+            for slot in range(2):
+                seed = positions[index * 2 + slot]
+                match.players[slot] = ranked[seed - 1] if seed <= len(ranked) else None
+            match.decided = 2
+
+        self.status = "running"
+        self.started_at = time.time()
+        self.changed()
+        ready = []
+        for match in self.rounds[0]:
+            ready.extend(self.settle(match))
+        return ready
+
+    def current_round(self) -> int:
+        """First round with a match still undecided"""
+        for number, matches in enumerate(self.rounds):
+            if not all(match.done for match in matches):
+                return number
+        return len(self.rounds)
+
+    def tiebreak(self, match: Match) -> Optional[Entrant]:
+        """Who advances from a drawn match: the better seed still in the tournament"""
+        present = [entrant for entrant in match.players if entrant is not None and not entrant.forfeited]
+        return min(present, key=lambda entrant: entrant.seed) if present else None
+
+    def report(self, match: Match, winner: Optional[Entrant]) -> List[Match]:
+        """Record a played match; returns matches that became playable"""
+        if match.done:
+            return []
+        if winner is None:
+            winner = self.tiebreak(match)
+        return self.decide(match, winner)
+
+    def walkover(self, match: Match) -> List[Match]:
+        """Decide a match that will not be played because a player forfeited"""
+        if match.done:
+            return []
+        return self.settle(match)
+
+    def settle(self, match: Match) -> List[Match]:
+        """A match whose players are known: playable, or decided without a game"""
+        present = [entrant for entrant in match.players if entrant is not None and not entrant.forfeited]
+        if len(present) == 2:
+            return [match]
+        # A bye or a forfeit; if nobody is left the slot stays empty
+        return self.decide(match, present[0] if present else None)
+
+    def decide(self, match: Match, winner: Optional[Entrant]) -> List[Match]:
+        match.done = True
+        match.winner = winner
+        for entrant in match.players:
+            if entrant is not None and entrant is not winner:
+                entrant.eliminated = True
+        self.changed()
+
+        if match.round + 1 == len(self.rounds):
+            self.status = "finished"
+            self.ended_at = time.time()
+            self.champion = winner
+            return []
+        following = self.rounds[match.round + 1][match.index // 2]
+        following.players[match.index % 2] = winner
+        following.decided += 1
+        if following.decided < 2:
+            return []
+        return self.settle(following)
+
+    def changed(self):
+        self._view = None
+
+    def summary(self) -> Dict:
+        """Small status for tournament_update broadcasts"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "players": len(self.entrants),
+            "capacity": self.capacity,
+            "round": self.current_round() if self.rounds else None,
+            "rounds": len(self.rounds) or bracket_size(self.capacity).bit_length() - 1,
+            "remaining": sum(1 for entrant in self.entrants.values()
+                             if not entrant.eliminated and not entrant.forfeited),
+            "champion": self.champion.name if self.champion else None
+        }
+
+    def view(self) -> Dict:
+        """Full bracket (shared, do not modify); rebuilt only after a change"""
+        if self._view is None:
+            self._view = {
+                **self.summary(),
+                "createdAt": self.created_at,
+                "startedAt": self.started_at,
+                "endedAt": self.ended_at,
+                "bracket": [[match.view() for match in matches] for matches in self.rounds]
+            }
+        return self._view
@@ -1,4 +1,6 @@
 -- First, drop existing tables to remove foreign key constraints
+DROP TABLE IF EXISTS match_players;
+DROP TABLE IF EXISTS matches;
 DROP TABLE IF EXISTS lobbies;
 DROP TABLE IF EXISTS users;
 
@@ -22,7 +24,30 @@ CREATE TABLE lobbies (
   created_at timestamp with time zone default timezone('utc', now())
 );
 
+-- Create MATCHES table, one row per finished game (written by the backend)
+CREATE TABLE matches (
+  id uuid primary key default gen_random_uuid(),
+  lobby_id text not null,
+  problem_id text,
+  winner_id uuid references users(id) on delete set null,
+  started_at timestamp with time zone,
+  ended_at timestamp with time zone not null
+);
+
+-- Create MATCH_PLAYERS table with each player's final score
+CREATE TABLE match_players (
+  match_id uuid references matches(id) on delete cascade,
+  user_id uuid references users(id) on delete cascade,
+  tests_passed integer not null default 0,
+  total_tests integer not null default 0,
+  completed boolean not null default false,
+  completion_time double precision,
+  primary key (match_id, user_id)
+);
+
 -- Add indexes for better performance
 CREATE INDEX idx_users_username ON users(username);
 CREATE INDEX idx_lobbies_status ON lobbies(status);
-CREATE INDEX idx_lobbies_host_id ON lobbies(host_id); 
\ No newline at end of file
+CREATE INDEX idx_lobbies_host_id ON lobbies(host_id); 
+CREATE INDEX idx_matches_ended_at ON matches(ended_at);
+CREATE INDEX idx_match_players_user_id ON match_players(user_id);
\ No newline at end of file
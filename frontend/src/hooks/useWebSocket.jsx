@@ -16,49 +16,88 @@ export const WebSocketProvider = ({ children }) => {
   const [connected, setConnected] = useState(false)
   const [error, setError] = useState(null)
   const eventHandlers = useRef({})
+  // Resumable session: the token from the "session" event and how many messages we have received
+  const session = useRef({ token: null, received: 0, gracePeriod: 0, lostAt: null })
 
   useEffect(() => {
-    // Create WebSocket connection using config
-    console.log('Connecting to WebSocket:', config.wsUrl)
-    const ws = new WebSocket(config.wsUrl)
-
-    // Connection event handlers
-    ws.onopen = () => {
-      console.log('Connected to WebSocket server')
-      setConnected(true)
-      setError(null)
-      setSocket(ws)
-    }
+    let ws = null
+    let retryTimer = null
+    let closing = false
 
-    ws.onclose = (event) => {
-      console.log('Disconnected from WebSocket server:', event.reason)
-      setConnected(false)
-      setSocket(null)
-    }
+    const connect = () => {
+      // Reconnect into the same session (and lobby) while the server still holds it
+      const { token, received } = session.current
+      const url = token ? `${config.wsUrl}?session=${encodeURIComponent(token)}&seq=${received}` : config.wsUrl
+      console.log('Connecting to WebSocket:', config.wsUrl)
+      ws = new WebSocket(url)
 
-    ws.onerror = (err) => {
-      console.error('WebSocket error:', err)
-      setError('Connection error')
-      setConnected(false)
-    }
+      // Connection event handlers
+      ws.onopen = () => {
+        console.log('Connected to WebSocket server')
+        setConnected(true)
+        setError(null)
+        setSocket(ws)
+      }
+
+      ws.onclose = (event) => {
+        console.log('Disconnected from WebSocket server:', event.reason)
+        setConnected(false)
+        setSocket(null)
+        if (closing) return
+
+        // Closed for inactivity: the server has ended the session, so start a new one
+        if (event.code === 1001 && event.reason === 'idle') {
+          session.current = { token: null, received: 0, gracePeriod: 0, lostAt: null }
+          setError('Disconnected after being idle')
+          retryTimer = setTimeout(connect, 1000)
+          return
+        }
 
-    ws.onmessage = (event) => {
-      try {
-        const message = JSON.parse(event.data)
-        const { event: eventName, data } = message
-        
-        // Call registered event handlers
-        if (eventHandlers.current[eventName]) {
-          eventHandlers.current[eventName].forEach(handler => handler(data))
+        // Retry until the grace period is over, then start a new session
+        const now = Date.now()
+        if (session.current.lostAt === null) session.current.lostAt = now
+        if (now - session.current.lostAt > session.current.gracePeriod * 1000) {
+          session.current.token = null
+        }
+        retryTimer = setTimeout(connect, 1000)
+      }
+
+      ws.onerror = (err) => {
+        console.error('WebSocket error:', err)
+        setError('Connection error')
+        setConnected(false)
+      }
+
+      ws.onmessage = (event) => {
+        try {
+          const message = JSON.parse(event.data)
+          const { event: eventName, data } = message
+          session.current.received += 1
+
+          if (eventName === 'session') {
+            session.current = { token: data.token, received: 1, gracePeriod: data.gracePeriod, lostAt: null }
+          } else if (eventName === 'session_resumed') {
+            session.current.received = data.seq + 1
+            session.current.lostAt = null
+          }
+          
+          // Call registered event handlers
+          if (eventHandlers.current[eventName]) {
+            eventHandlers.current[eventName].forEach(handler => handler(data))
+          }
+        } catch (err) {
+          console.error('Failed to parse WebSocket message:', err)
         }
-      } catch (err) {
-        console.error('Failed to parse WebSocket message:', err)
       }
     }
 
+    connect()
+
     // Cleanup on unmount
     return () => {
       console.log('Cleaning up WebSocket connection')
+      closing = true
+      clearTimeout(retryTimer)
       ws.close()
     }
   }, [])